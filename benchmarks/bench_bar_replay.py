@@ -0,0 +1,107 @@
+#   ===========================================================================
+#
+#   bench_bar_replay.py
+#   ===================
+#   Compares decoding a large tick bar replay on the event loop with
+#   decoding it in a process pool through bar_replay.TickBarReplayDecoder :
+#
+#          python -m benchmarks.bench_bar_replay -n 100000 --workers 4
+#
+#   Frames are fed to the decoder as a reader would, yielding to the loop
+#   every few hundred, while a ticker task measures how late the loop runs
+#   it.  "loop busy" is the time the loop itself spent in the decoder;
+#   "worst stall" is the longest the ticker was kept waiting.
+#
+#   ===========================================================================
+
+import argparse
+import asyncio
+import random
+import time
+
+from rithmic_api import codec
+from rithmic_api.bar_replay import TickBarReplayDecoder
+from rithmic_api.response_tick_bar_replay_pb2 import ResponseTickBarReplay
+
+
+def make_frames(n):
+    frames = []
+    price = 5000.0
+    for i in range(n):
+        rp = ResponseTickBarReplay()
+        rp.template_id = 207
+        rp.request_key = "1"
+        rp.user_msg.append("hello")
+        rp.rq_handler_rp_code.append("0")
+        rp.symbol = "ESZ6"
+        rp.exchange = "CME"
+        rp.type = ResponseTickBarReplay.BarType.TICK_BAR
+        rp.sub_type = ResponseTickBarReplay.BarSubType.REGULAR
+        rp.type_specifier = "1"
+        rp.num_trades = 1
+        rp.volume = random.randint(1, 10)
+        rp.bid_volume = rp.volume // 2
+        rp.ask_volume = rp.volume - rp.bid_volume
+        rp.open_price = price
+        price += random.choice((-0.25, 0.0, 0.25))
+        rp.close_price = price
+        rp.high_price = max(rp.open_price, price)
+        rp.low_price = min(rp.open_price, price)
+        rp.data_bar_ssboe.append(1595260800 + i)
+        rp.data_bar_usecs.append(0)
+        frames.append(codec.encode(rp))
+    rp = ResponseTickBarReplay()
+    rp.template_id = 207
+    rp.request_key = "1"
+    rp.rp_code.append("0")
+    frames.append(codec.encode(rp))
+    return frames
+
+
+async def ticker(stalls, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        stalls.append(time.perf_counter() - started - 0.001)
+
+
+async def run(frames, workers, batch_size):
+    decoder = TickBarReplayDecoder(batch_size, workers=workers)
+    stalls = []
+    stop = asyncio.Event()
+    tick = asyncio.ensure_future(ticker(stalls, stop))
+    busy = 0.0
+    started = time.perf_counter()
+    for i in range(0, len(frames), 200):
+        t = time.perf_counter()
+        for msg_buf in frames[i:i + 200]:
+            decoder.add(207, msg_buf)
+        busy += time.perf_counter() - t
+        await asyncio.sleep(0)
+    bars = await decoder.result()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await tick
+    decoder.close()
+    return bars, elapsed, busy, max(stalls, default=0.0)
+
+
+def main(args):
+    frames = make_frames(args.n)
+    print(f"{args.n} bars, batches of {args.batch_size}")
+    print(f"{'mode':<22}{'wall':>10}{'loop busy':>12}{'worst stall':>14}")
+    results = {}
+    for name, workers in (("on the loop", 0), (f"pool of {args.workers}", args.workers)):
+        bars, elapsed, busy, stall = asyncio.run(run(frames, workers, args.batch_size))
+        results[name] = bars
+        print(f"{name:<22}{elapsed:>9.2f}s{busy:>11.2f}s{stall * 1000:>12.1f}ms")
+    first, second = results.values()
+    assert (first == second).all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark process-pool decoding of tick bar replays.")
+    parser.add_argument("-n", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=4)
+    main(parser.parse_args())
@@ -0,0 +1,280 @@
+#   ===========================================================================
+#
+#   bench_client.py
+#   ===============
+#   Benchmarks the client paths against the local stand-in server :
+#
+#          python -m benchmarks.bench_client --rate 2000 --seconds 3
+#
+#   The server runs in a child process so that generating market data does
+#   not compete with the client for the event loop; pass --uri to run
+#   against a server that is already up instead.
+#
+#   Reports connect + login time (fresh and pooled), sequential against
+#   concurrent login to the ticker, order and history plants, one by one
+#   against bulk subscribe to many symbols, subscribe to first
+#   tick, market data throughput through the MessageReader, request round
+#   trip through the RequestRouter, tick bar replay and heartbeat RTT, and
+#   how each overflow policy copes with a consumer that falls behind.
+#
+#   ===========================================================================
+
+import argparse
+import asyncio
+import contextlib
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from rithmic_api.multi_plant import DEFAULT_PLANTS, open_plants
+from rithmic_api.reader import BLOCK, CONFLATE, DROP_OLDEST
+from rithmic_api.request_login_pb2 import RequestLogin
+from rithmic_api.request_market_data_update_pb2 import RequestMarketDataUpdate
+from rithmic_api.request_tick_bar_replay_pb2 import RequestTickBarReplay
+from rithmic_api.request_trade_routes_pb2 import RequestTradeRoutes
+from rithmic_api.response_tick_bar_replay_pb2 import ResponseTickBarReplay
+from rithmic_api.response_trade_routes_pb2 import ResponseTradeRoutes
+from rithmic_api.session import RithmicSession
+from rithmic_api.session_pool import SessionPool
+
+SYSTEM_NAME = "Rithmic Test"
+USER_ID = "bench"
+PASSWORD = "bench"
+
+
+def report(name, samples, unit="ms", scale=1000.0):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{name:<28} n={len(samples):<6} median={statistics.median(samples) * scale:9.3f}{unit}"
+          f"  p99={p99 * scale:9.3f}{unit}")
+
+
+async def bench_connect(uri, n):
+    fresh = []
+    for _ in range(n):
+        started = time.perf_counter()
+        session = await RithmicSession.open(uri, SYSTEM_NAME, USER_ID, PASSWORD)
+        fresh.append(time.perf_counter() - started)
+        await session.close()
+    report("connect+login (fresh)", fresh)
+
+    pool = SessionPool(reconnect=False)
+    pooled = []
+    for _ in range(n):
+        started = time.perf_counter()
+        session = await pool.acquire(uri, SYSTEM_NAME, USER_ID, PASSWORD)
+        pooled.append(time.perf_counter() - started)
+        await pool.release(session)
+    await pool.close_all()
+    report("connect+login (pooled)", pooled)
+
+
+async def bench_plants(uri, n):
+    sequential = []
+    for _ in range(n):
+        started = time.perf_counter()
+        sessions = [await RithmicSession.open(uri, SYSTEM_NAME, USER_ID, PASSWORD, infra_type)
+                    for infra_type in DEFAULT_PLANTS]
+        sequential.append(time.perf_counter() - started)
+        for session in sessions:
+            await session.close()
+    report("3 plants (sequential)", sequential)
+
+    concurrent = []
+    for _ in range(n):
+        started = time.perf_counter()
+        plants = await open_plants(uri, SYSTEM_NAME, USER_ID, PASSWORD)
+        concurrent.append(time.perf_counter() - started)
+        await plants.close()
+    report("3 plants (concurrent)", concurrent)
+
+
+async def bench_bulk_subscribe(uri, num_symbols):
+    session = await RithmicSession.open(uri, SYSTEM_NAME, USER_ID, PASSWORD)
+    try:
+        # update bits the stand-in does not generate data for, so that only
+        # the requests and their acknowledgements are measured
+        update_bits = RequestMarketDataUpdate.UpdateBits.OPEN_INTEREST
+        instruments = [("CME", f"SYM{i}") for i in range(num_symbols)]
+
+        started = time.perf_counter()
+        for exchange, symbol in instruments:
+            await session.subscribe_market_data(exchange, symbol, update_bits)
+        one_by_one = time.perf_counter() - started
+        await session.unsubscribe_market_data_many(instruments, update_bits)
+
+        started = time.perf_counter()
+        await session.subscribe_market_data_many(instruments, update_bits)
+        bulk = time.perf_counter() - started
+        await session.unsubscribe_market_data_many(instruments, update_bits)
+
+        stats = session.writer.stats()
+        print(f"{'subscribe, one by one':<28} {num_symbols} symbols in {one_by_one * 1000:.1f}ms")
+        print(f"{'subscribe, bulk':<28} {num_symbols} symbols in {bulk * 1000:.1f}ms "
+              f"(max batch {stats['max_batch']}, max depth {stats['max_depth']})")
+    finally:
+        await session.close()
+
+
+async def bench_market_data(uri, seconds):
+    session = await RithmicSession.open(uri, SYSTEM_NAME, USER_ID, PASSWORD)
+    try:
+        stream = session.reader.stream(150, 151, maxsize=100000)
+        update_bits = RequestMarketDataUpdate.UpdateBits.LAST_TRADE | RequestMarketDataUpdate.UpdateBits.BBO
+
+        started = time.perf_counter()
+        await session.subscribe_market_data("CME", "ESZ6", update_bits)
+        await stream.get()
+        report("subscribe -> first tick", [time.perf_counter() - started])
+
+        count = 0
+        started = time.perf_counter()
+        asyncio.get_running_loop().call_later(seconds, stream.close)
+        async for _ in stream:
+            count += 1
+        elapsed = time.perf_counter() - started
+        print(f"{'market data throughput':<28} {count / elapsed:,.0f} msgs/s ({count} msgs)")
+
+        await session.unsubscribe_market_data("CME", "ESZ6", update_bits)
+    finally:
+        await session.close()
+
+
+async def bench_slow_consumer(uri, seconds):
+    update_bits = RequestMarketDataUpdate.UpdateBits.LAST_TRADE | RequestMarketDataUpdate.UpdateBits.BBO
+    for overflow in (BLOCK, DROP_OLDEST, CONFLATE):
+        session = await RithmicSession.open(uri, SYSTEM_NAME, USER_ID, PASSWORD)
+        try:
+            stream = session.reader.stream(150, 151, maxsize=100, overflow=overflow)
+            await session.subscribe_market_data("CME", "ESZ6", update_bits)
+            consumed = 0
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                await stream.get()
+                consumed += 1
+                await asyncio.sleep(0.001)
+            stats = stream.stats()
+            print(f"{'slow consumer, ' + overflow:<28} consumed={consumed} received={stats['received']} "
+                  f"dropped={stats['dropped']} conflated={stats['conflated']} max_depth={stats['max_depth']}")
+            stream.close()
+        finally:
+            await session.close()
+
+
+async def bench_requests(uri, n):
+    session = await RithmicSession.open(uri, SYSTEM_NAME, USER_ID, PASSWORD,
+                                        RequestLogin.SysInfraType.ORDER_PLANT)
+    try:
+        samples = []
+        for _ in range(n):
+            started = time.perf_counter()
+            await session.router.request(_trade_routes(), ResponseTradeRoutes)
+            samples.append(time.perf_counter() - started)
+        report("trade routes round trip", samples)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(session.router.request(_trade_routes(), ResponseTradeRoutes) for _ in range(n)))
+        elapsed = time.perf_counter() - started
+        print(f"{'trade routes, concurrent':<28} {n / elapsed:,.0f} requests/s")
+
+        samples = []
+        for _ in range(10):
+            last_rtt = session.heartbeat.last_rtt
+            await session.heartbeat.send_heartbeat()
+            while session.heartbeat.last_rtt is last_rtt:
+                await asyncio.sleep(0.0001)
+            samples.append(session.heartbeat.last_rtt)
+        report("heartbeat round trip", samples)
+    finally:
+        await session.close()
+
+
+async def bench_bars(uri, num_bars):
+    session = await RithmicSession.open(uri, SYSTEM_NAME, USER_ID, PASSWORD,
+                                        RequestLogin.SysInfraType.HISTORY_PLANT)
+    try:
+        rq = RequestTickBarReplay()
+        rq.template_id = 206
+        rq.exchange = "CME"
+        rq.symbol = "ESZ6"
+        rq.bar_type = RequestTickBarReplay.BarType.TICK_BAR
+        rq.bar_sub_type = RequestTickBarReplay.BarSubType.REGULAR
+        rq.bar_type_specifier = "1"
+        rq.start_index = int(time.time()) - 3600
+        rq.finish_index = int(time.time())
+
+        started = time.perf_counter()
+        responses = await session.router.request(rq, ResponseTickBarReplay)
+        elapsed = time.perf_counter() - started
+        print(f"{'tick bar replay':<28} {len(responses) - 1} bars in {elapsed * 1000:.1f}ms "
+              f"({(len(responses) - 1) / elapsed:,.0f} bars/s)")
+    finally:
+        await session.close()
+
+
+def _trade_routes():
+    rq = RequestTradeRoutes()
+    rq.template_id = 310
+    rq.subscribe_for_updates = False
+    return rq
+
+
+@contextlib.contextmanager
+def local_server(args):
+    """Run rithmic_api.local_server in a child process and yield its uri."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    proc = subprocess.Popen([sys.executable, "-m", "rithmic_api.local_server", "--port", str(port),
+                             "--rate", str(args.rate), "--burst-size", str(args.burst_size),
+                             "--latency", str(args.latency), "--jitter", str(args.jitter),
+                             "--num-bars", str(args.num_bars)],
+                            stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline or proc.poll() is not None:
+                    raise RuntimeError("local server did not start")
+                time.sleep(0.05)
+        yield f"ws://127.0.0.1:{port}"
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+async def run(uri, args):
+    await bench_connect(uri, args.n)
+    await bench_plants(uri, args.n)
+    await bench_bulk_subscribe(uri, args.num_symbols)
+    await bench_market_data(uri, args.seconds)
+    await bench_slow_consumer(uri, args.seconds)
+    await bench_requests(uri, args.n)
+    await bench_bars(uri, args.num_bars)
+
+
+def main(args):
+    if args.uri:
+        asyncio.run(run(args.uri, args))
+        return
+    with local_server(args) as uri:
+        asyncio.run(run(uri, args))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the client against the local server.")
+    parser.add_argument("--uri", help="benchmark a server that is already running")
+    parser.add_argument("--rate", type=float, default=2000.0)
+    parser.add_argument("--burst-size", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--num-symbols", type=int, default=500)
+    parser.add_argument("--num-bars", type=int, default=10000)
+    parser.add_argument("-n", type=int, default=50)
+    main(parser.parse_args())
@@ -0,0 +1,121 @@
+#   ===========================================================================
+#
+#   bench_codec.py
+#   ==============
+#   Reports the encode and decode cost of a representative message of each
+#   common template for every codec backend in rithmic_api.codec :
+#
+#          python -m benchmarks.bench_codec -n 20000
+#
+#   Each row is one template, each column one backend.  The wire backend
+#   only has its own decoders for the market data templates; other rows
+#   show its fallback.
+#
+#   ===========================================================================
+
+import argparse
+import time
+
+from rithmic_api import codec
+from rithmic_api.best_bid_offer_pb2 import BestBidOffer
+from rithmic_api.exchange_order_notification_pb2 import ExchangeOrderNotification
+from rithmic_api.last_trade_pb2 import LastTrade
+from rithmic_api.request_heartbeat_pb2 import RequestHeartbeat
+from rithmic_api.request_login_pb2 import RequestLogin
+from rithmic_api.request_market_data_update_pb2 import RequestMarketDataUpdate
+from rithmic_api.request_new_order_pb2 import RequestNewOrder
+from rithmic_api.response_heartbeat_pb2 import ResponseHeartbeat
+from rithmic_api.response_login_pb2 import ResponseLogin
+from rithmic_api.response_tick_bar_replay_pb2 import ResponseTickBarReplay
+from rithmic_api.rithmic_order_notification_pb2 import RithmicOrderNotification
+
+
+def samples():
+    """Return [(template_id, message)] with the fields a live gateway fills in."""
+    return [
+        (10, RequestLogin(template_id=10, template_version="3.9", user_msg=["hello"], user="user",
+                          password="password", app_name="SampleMD.py", app_version="0.3.0.0",
+                          system_name="Rithmic Test", infra_type=RequestLogin.SysInfraType.TICKER_PLANT)),
+        (11, ResponseLogin(template_id=11, template_version="3.9", user_msg=["hello"], rp_code=["0"],
+                           fcm_id="LocalFCM", ib_id="LocalIB", country_code="US", state_code="IL",
+                           unique_user_id="0123456789", heartbeat_interval=60)),
+        (18, RequestHeartbeat(template_id=18, user_msg=["hb-1"], ssboe=1792313612, usecs=772742)),
+        (19, ResponseHeartbeat(template_id=19, user_msg=["hb-1"], rp_code=["0"],
+                               ssboe=1792313612, usecs=772979)),
+        (100, RequestMarketDataUpdate(template_id=100, user_msg=["rq-1"], symbol="ESZ6", exchange="CME",
+                                      request=RequestMarketDataUpdate.Request.SUBSCRIBE,
+                                      update_bits=RequestMarketDataUpdate.UpdateBits.LAST_TRADE
+                                      | RequestMarketDataUpdate.UpdateBits.BBO)),
+        (150, LastTrade(template_id=150, symbol="ESZ6", exchange="CME", presence_bits=9,
+                        trade_price=5000.25, trade_size=3, aggressor=LastTrade.TransactionType.BUY,
+                        exchange_order_id="1234567890", volume=1250000, vwap=4998.5,
+                        trade_time="1792313612", ssboe=1792313612, usecs=772742)),
+        (151, BestBidOffer(template_id=151, symbol="ESZ6", exchange="CME", presence_bits=3,
+                           bid_price=5000.0, bid_size=42, bid_orders=11, ask_price=5000.25,
+                           ask_size=37, ask_orders=9, ssboe=1792313612, usecs=772979)),
+        (207, ResponseTickBarReplay(template_id=207, request_key="1", rq_handler_rp_code=["0"],
+                                    symbol="ESZ6", exchange="CME", type=1, type_specifier="1",
+                                    num_trades=1, volume=3, bid_volume=0, ask_volume=3,
+                                    open_price=5000.25, close_price=5000.25, high_price=5000.25,
+                                    low_price=5000.25, data_bar_ssboe=[1792313612],
+                                    data_bar_usecs=[772742])),
+        (312, RequestNewOrder(template_id=312, user_msg=["rq-2"], user_tag="order-1", window_name="SampleOrder",
+                              fcm_id="LocalFCM", ib_id="LocalIB", account_id="ACCT-1", symbol="ESZ6",
+                              exchange="CME", quantity=1, transaction_type=RequestNewOrder.TransactionType.BUY,
+                              duration=RequestNewOrder.Duration.DAY,
+                              price_type=RequestNewOrder.PriceType.MARKET, trade_route="simulator",
+                              manual_or_auto=RequestNewOrder.OrderPlacement.MANUAL)),
+        (351, RithmicOrderNotification(template_id=351, user_tag="order-1", notify_type=RithmicOrderNotification.COMPLETE,
+                                       status="complete", basket_id="1", fcm_id="LocalFCM", ib_id="LocalIB",
+                                       user_id="user", account_id="ACCT-1", symbol="ESZ6", exchange="CME",
+                                       trade_exchange="CME", trade_route="simulator", quantity=1,
+                                       avg_fill_price=5000.25, total_fill_size=1, total_unfilled_size=0,
+                                       completion_reason="F", ssboe=1792313612, usecs=772742)),
+        (352, ExchangeOrderNotification(template_id=352, user_tag="order-1",
+                                        notify_type=ExchangeOrderNotification.FILL, basket_id="1",
+                                        fcm_id="LocalFCM", ib_id="LocalIB", user_id="user", account_id="ACCT-1",
+                                        symbol="ESZ6", exchange="CME", trade_exchange="CME",
+                                        trade_route="simulator", quantity=1, fill_price=5000.25, fill_size=1,
+                                        fill_id="1", avg_fill_price=5000.25, total_fill_size=1,
+                                        ssboe=1792313612, usecs=772742)),
+    ]
+
+
+def per_call(fn, arg, n, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(n):
+            fn(arg)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / n * 1e6
+
+
+def main(args):
+    backends = [codec.get(name) for name in args.backends]
+    rows = samples()
+    print(f"{len(rows)} templates, {args.n} calls each, best of {args.repeat}, microseconds per call")
+    print(f"runtime {backends[0].runtime}")
+    header = "".join(f"{b.name + ' dec':>14}{b.name + ' enc':>14}" for b in backends)
+    print(f"{'template':<34}{'bytes':>6}{header}")
+    for template_id, msg in rows:
+        buf = msg.SerializeToString()
+        cells = []
+        for backend in backends:
+            decode = backend.decoder(type(msg))
+            native = backend.decode(type(msg), buf)
+            if not hasattr(native, "SerializeToString"):
+                native = backend.fallback.decode(type(msg), buf)
+            cells.append(per_call(decode, buf, args.n, args.repeat))
+            cells.append(per_call(backend.encode, native, args.n, args.repeat))
+        name = f"{template_id} {type(msg).__name__}"
+        print(f"{name:<34}{len(buf):>6}" + "".join(f"{c:>14.2f}" for c in cells))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-template encode/decode cost for each codec backend.")
+    parser.add_argument("-n", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backends", nargs="+", default=sorted(codec.BACKENDS), choices=sorted(codec.BACKENDS))
+    main(parser.parse_args())
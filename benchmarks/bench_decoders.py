@@ -0,0 +1,81 @@
+#   ===========================================================================
+#
+#   bench_decoders.py
+#   =================
+#   Validates the partial BestBidOffer / LastTrade decoders against the full
+#   protobuf parse on recorded traffic, then compares their speed :
+#
+#          python -m benchmarks.bench_decoders --frames 20000
+#
+#   Frames are recorded from the local stand-in server, or loaded with
+#   --load from a file written by bench_dispatch --save.
+#
+#   ===========================================================================
+
+import argparse
+import asyncio
+import sys
+import time
+
+from rithmic_api import decoders, wire
+from rithmic_api.best_bid_offer_pb2 import BestBidOffer
+from rithmic_api.last_trade_pb2 import LastTrade
+
+from benchmarks.bench_dispatch import load, record
+
+FULL = {150: LastTrade, 151: BestBidOffer}
+
+
+def validate(frames):
+    """Return the number of frames whose partial decode differs from the full parse."""
+    bad = 0
+    for template_id, msg_buf in frames:
+        mismatches = decoders.MARKET_DATA_DECODERS[template_id].mismatches(msg_buf)
+        if mismatches:
+            bad += 1
+            if bad <= 10:
+                print(f"template {template_id}: {mismatches}", file=sys.stderr)
+    return bad
+
+
+def run_full(frames):
+    for template_id, msg_buf in frames:
+        msg = FULL[template_id]()
+        msg.ParseFromString(msg_buf)
+
+
+def run_partial(frames):
+    table = decoders.MARKET_DATA_DECODERS
+    for template_id, msg_buf in frames:
+        table[template_id].decode(msg_buf)
+
+
+def measure(name, fn, frames, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(frames)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:<24} {len(frames) / best:>12,.0f} msgs/s  ({best / len(frames) * 1e6:.2f}us/msg)")
+    return best
+
+
+def main(args):
+    raw = load(args.load) if args.load else asyncio.run(record(args.frames))
+    frames = [(wire.peek_template_id(msg_buf), msg_buf) for msg_buf in raw]
+
+    bad = validate(frames)
+    print(f"{len(frames)} frames validated, {bad} mismatches")
+    full = measure("full protobuf parse", run_full, frames, args.repeat)
+    partial = measure("partial decode", run_partial, frames, args.repeat)
+    print(f"speedup {full / partial:.2f}x")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate and benchmark the partial market data decoders.")
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--load", help="read frames from this file instead of recording")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,152 @@
+#   ===========================================================================
+#
+#   bench_dispatch.py
+#   =================
+#   Compares the old way of routing inbound frames, parsing each one into
+#   base_pb2.Base for its template_id, walking an if/elif chain and parsing
+#   it again, with wire.peek_template_id() and a Dispatcher table that
+#   parse it once :
+#
+#          python -m benchmarks.bench_dispatch --frames 20000
+#
+#   The BBO/LastTrade traffic is recorded from the local stand-in server,
+#   or loaded with --load from a file previously written with --save.
+#
+#   ===========================================================================
+
+import argparse
+import asyncio
+import struct
+import time
+
+from rithmic_api import wire
+from rithmic_api.base_pb2 import Base
+from rithmic_api.best_bid_offer_pb2 import BestBidOffer
+from rithmic_api.dispatch import Dispatcher
+from rithmic_api.last_trade_pb2 import LastTrade
+from rithmic_api.local_server import LocalRithmicServer
+from rithmic_api.request_market_data_update_pb2 import RequestMarketDataUpdate
+from rithmic_api.session import RithmicSession
+
+
+async def record(num_frames):
+    server = LocalRithmicServer(port=0, rate=50000)
+    await server.start()
+    try:
+        session = await RithmicSession.open(server.uri, "Rithmic Test", "bench", "bench")
+        frames = []
+        session.reader.add_callback(150, lambda template_id, msg_buf: frames.append(msg_buf))
+        session.reader.add_callback(151, lambda template_id, msg_buf: frames.append(msg_buf))
+        update_bits = RequestMarketDataUpdate.UpdateBits.LAST_TRADE | RequestMarketDataUpdate.UpdateBits.BBO
+        await session.subscribe_market_data("CME", "ESZ6", update_bits)
+        while len(frames) < num_frames:
+            await asyncio.sleep(0.05)
+        await session.close()
+    finally:
+        await server.stop()
+    return frames[:num_frames]
+
+
+def save(path, frames):
+    with open(path, "wb") as f:
+        for frame in frames:
+            f.write(struct.pack("<I", len(frame)))
+            f.write(frame)
+
+
+def load(path):
+    frames = []
+    with open(path, "rb") as f:
+        data = f.read()
+    pos = 0
+    while pos < len(data):
+        (length,) = struct.unpack_from("<I", data, pos)
+        frames.append(data[pos + 4:pos + 4 + length])
+        pos += 4 + length
+    return frames
+
+
+def run_before(frames):
+    handled = 0
+    for msg_buf in frames:
+        base = Base()
+        base.ParseFromString(msg_buf)
+        template_id = base.template_id
+        if template_id == 13:
+            pass
+        elif template_id == 19:
+            pass
+        elif template_id == 101:
+            pass
+        elif template_id == 151:
+            msg = BestBidOffer()
+            msg.ParseFromString(msg_buf)
+            handled += 1
+        elif template_id == 150:
+            msg = LastTrade()
+            msg.ParseFromString(msg_buf)
+            handled += 1
+    return handled
+
+
+def run_after(frames):
+    handled = [0]
+
+    def on_msg(template_id, msg):
+        handled[0] += 1
+
+    dispatcher = Dispatcher()
+    dispatcher.register(151, BestBidOffer, on_msg)
+    dispatcher.register(150, LastTrade, on_msg)
+    for msg_buf in frames:
+        dispatcher.dispatch(wire.peek_template_id(msg_buf), msg_buf)
+    return handled[0]
+
+
+def route_before(frames):
+    for msg_buf in frames:
+        base = Base()
+        base.ParseFromString(msg_buf)
+        base.template_id
+
+
+def route_after(frames):
+    for msg_buf in frames:
+        wire.peek_template_id(msg_buf)
+
+
+def measure(name, fn, frames, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(frames)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:<34} {len(frames) / best:>12,.0f} msgs/s  ({best / len(frames) * 1e6:.2f}us/msg)")
+    return best
+
+
+def main(args):
+    if args.load:
+        frames = load(args.load)
+    else:
+        frames = asyncio.run(record(args.frames))
+    if args.save:
+        save(args.save, frames)
+
+    assert run_before(frames) == run_after(frames)
+    print(f"{len(frames)} recorded frames, {sum(len(f) for f in frames) / len(frames):.0f} bytes on average")
+    measure("template_id only, Base parse", route_before, frames, args.repeat)
+    measure("template_id only, wire peek", route_after, frames, args.repeat)
+    before = measure("dispatch, before (parse twice)", run_before, frames, args.repeat)
+    after = measure("dispatch, after (peek + table)", run_after, frames, args.repeat)
+    print(f"speedup {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark template_id peeking and table dispatch.")
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", help="write the recorded frames to this file")
+    parser.add_argument("--load", help="read frames from this file instead of recording")
+    main(parser.parse_args())
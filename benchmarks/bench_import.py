@@ -0,0 +1,70 @@
+#   ===========================================================================
+#
+#   bench_import.py
+#   ===============
+#   Measures start-up cost with the generated modules loaded lazily through
+#   rithmic_api.templates, against loading every one of them up front as
+#   the samples used to :
+#
+#          python -m benchmarks.bench_import -n 10
+#
+#   Each case runs in a fresh interpreter, n times; the median wall time
+#   and the number of *_pb2 modules left in sys.modules are reported.
+#   "worker boot" is what a WSGI worker does before its first request:
+#   load the application and resolve the URL patterns, which imports the
+#   views.
+#
+#   ===========================================================================
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EAGER = ("import rithmic_api.templates as t\n"
+         "for template_id in t.TEMPLATES: t.message_class(template_id)\n")
+
+REPORT = ("import sys\n"
+          "print(sum(1 for m in sys.modules if m.endswith('_pb2') and m.startswith('rithmic_api')))\n")
+
+CASES = {
+    "import SampleOrder": "import rithmic_api.SampleOrder\n",
+    "import SampleMD": "import rithmic_api.SampleMD\n",
+    "manage.py check": ("from django.core.management import execute_from_command_line\n"
+                        "execute_from_command_line(['manage.py', 'check', '-v', '0'])\n"),
+    "worker boot": ("from myproject.wsgi import application\n"
+                    "from django.urls import get_resolver\n"
+                    "get_resolver().url_patterns\n"),
+}
+
+
+def run(code, eager):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE="myproject.settings")
+    source = (EAGER if eager else "") + code + REPORT
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", source], cwd=ROOT, env=env,
+                         check=True, capture_output=True, text=True).stdout
+    return time.perf_counter() - started, int(out.split()[-1])
+
+
+def main(args):
+    baseline = statistics.median(run("pass\n", False)[0] for _ in range(args.n))
+    print(f"bare interpreter: {baseline * 1000:.1f}ms, median of {args.n}")
+    print(f"{'case':<20}{'eager':>10}{'lazy':>10}{'saved':>10}{'pb2 loaded':>12}")
+    for name, code in CASES.items():
+        eager = [run(code, True) for _ in range(args.n)]
+        lazy = [run(code, False) for _ in range(args.n)]
+        eager_ms = statistics.median(t for t, _ in eager) * 1000
+        lazy_ms = statistics.median(t for t, _ in lazy) * 1000
+        print(f"{name:<20}{eager_ms:>8.1f}ms{lazy_ms:>8.1f}ms{eager_ms - lazy_ms:>8.1f}ms"
+              f"{eager[0][1]:>6} -> {lazy[0][1]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark start-up time with lazy and eager _pb2 imports.")
+    parser.add_argument("-n", type=int, default=10)
+    main(parser.parse_args())
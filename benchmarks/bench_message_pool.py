@@ -0,0 +1,79 @@
+#   ===========================================================================
+#
+#   bench_message_pool.py
+#   =====================
+#   Compares decoding BBO/LastTrade traffic into a new message per frame
+#   with the REUSE and SNAPSHOT modes of message_pool.MessagePool :
+#
+#          python -m benchmarks.bench_message_pool --frames 20000
+#
+#   Besides the time per message, each mode reports how many message
+#   objects it allocated and how many garbage collections of each
+#   generation ran while it did, as a measure of the GC pressure it puts on
+#   a busy consumer.
+#
+#   ===========================================================================
+
+import argparse
+import asyncio
+import gc
+import time
+
+from rithmic_api import codec, message_pool, wire
+from rithmic_api.best_bid_offer_pb2 import BestBidOffer
+from rithmic_api.last_trade_pb2 import LastTrade
+from rithmic_api.message_pool import MessagePool
+
+from benchmarks.bench_dispatch import load, record
+
+CLASSES = {150: LastTrade, 151: BestBidOffer}
+
+
+def new_per_frame(frames):
+    decoders = {t: codec.get("generated").decoder(cls) for t, cls in CLASSES.items()}
+    for template_id, msg_buf in frames:
+        decoders[template_id](msg_buf)
+    return len(frames)
+
+
+def pooled(mode):
+    def run(frames):
+        pool = MessagePool(codec.get("generated"))
+        decoders = {t: pool.decoder(cls, mode) for t, cls in CLASSES.items()}
+        for template_id, msg_buf in frames:
+            decoders[template_id](msg_buf)
+        return pool.allocated
+    return run
+
+
+def measure(name, fn, frames, repeat):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        before = [s["collections"] for s in gc.get_stats()]
+        started = time.perf_counter()
+        allocated = fn(frames)
+        elapsed = time.perf_counter() - started
+        collections = [s["collections"] - b for s, b in zip(gc.get_stats(), before)]
+        if best is None or elapsed < best[0]:
+            best = (elapsed, allocated, collections)
+    elapsed, allocated, collections = best
+    print(f"{name:<20} {elapsed / len(frames) * 1e6:>8.2f}us/msg {allocated:>10} messages allocated"
+          f"   gc gen0/1/2 {collections[0]}/{collections[1]}/{collections[2]}")
+
+
+def main(args):
+    raw = load(args.load) if args.load else asyncio.run(record(args.frames))
+    frames = [(wire.peek_template_id(msg_buf), msg_buf) for msg_buf in raw]
+    print(f"{len(frames)} frames, best of {args.repeat}")
+    measure("new per frame", new_per_frame, frames, args.repeat)
+    measure("reuse", pooled(message_pool.REUSE), frames, args.repeat)
+    measure("snapshot", pooled(message_pool.SNAPSHOT), frames, args.repeat)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark message reuse against a new message per frame.")
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--load", help="read frames from this file instead of recording")
+    main(parser.parse_args())
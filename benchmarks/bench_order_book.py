@@ -0,0 +1,156 @@
+#   ===========================================================================
+#
+#   bench_order_book.py
+#   ===================
+#   Measures how many depth updates per second the order book takes, on
+#   synthetic OrderBook traffic: an image of the book, then updates of one
+#   to a few levels around a mid price that wanders, some of them split
+#   over BEGIN / END messages :
+#
+#          python -m benchmarks.bench_order_book --frames 200000
+#
+#   Reported are decoding alone, applying decoded updates, both together
+#   as a subscription callback does, and best bid / ask and top-10
+#   queries; a book keyed by price in dicts is run on the same traffic for
+#   comparison, and both books must end up with the same top levels.
+#   Queries on the dict book slow down as --depth grows, on the ladder
+#   they do not.
+#
+#   ===========================================================================
+
+import argparse
+import heapq
+import random
+import sys
+import time
+
+from rithmic_api import order_book
+
+EXCHANGE = "CME"
+SYMBOL = "ESZ6"
+TICK = 0.25
+
+
+def synthesize(num_frames, depth=20, seed=1):
+    """Return a list of serialized OrderBook frames."""
+    rng = random.Random(seed)
+    mid = 20000
+    frames = [order_book.encode(
+        EXCHANGE, SYMBOL, order_book.SNAPSHOT_IMAGE,
+        [((mid - k) * TICK, rng.randint(1, 200), rng.randint(1, 20)) for k in range(1, depth + 1)],
+        [((mid + k) * TICK, rng.randint(1, 200), rng.randint(1, 20)) for k in range(depth)],
+        1792300000, 0)]
+    while len(frames) < num_frames:
+        if rng.random() < 0.02:
+            mid += rng.choice((-1, 1))
+        count = 1 if rng.random() < 0.8 else rng.randint(2, 5)
+        update_types = [order_book.SOLO] if count == 1 else \
+            [order_book.BEGIN] + [order_book.MIDDLE] * (count - 2) + [order_book.END]
+        for update_type in update_types:
+            k = rng.randrange(depth)
+            size = 0 if rng.random() < 0.25 else rng.randint(1, 200)
+            if rng.random() < 0.5:
+                bids, asks = [((mid - 1 - k) * TICK, size, (size + 9) // 10)], ()
+            else:
+                bids, asks = (), [((mid + k) * TICK, size, (size + 9) // 10)]
+            frames.append(order_book.encode(EXCHANGE, SYMBOL, update_type, bids, asks,
+                                            1792300000, len(frames) % 1000000))
+    return frames[:num_frames]
+
+
+class DictBook:
+    """The straightforward book: {price: (size, orders)} per side."""
+
+    def __init__(self):
+        self.bids = {}
+        self.asks = {}
+
+    def apply(self, msg):
+        if msg.update_type == order_book.SNAPSHOT_IMAGE:
+            self.bids.clear()
+            self.asks.clear()
+        for side, prices, sizes, orders in ((self.bids, msg.bid_price, msg.bid_size, msg.bid_orders),
+                                            (self.asks, msg.ask_price, msg.ask_size, msg.ask_orders)):
+            for i, price in enumerate(prices):
+                if sizes[i]:
+                    side[price] = (sizes[i], orders[i])
+                else:
+                    side.pop(price, None)
+
+    def best(self):
+        return max(self.bids, default=None), min(self.asks, default=None)
+
+    def top(self, n=10):
+        return {"bids": [(p,) + self.bids[p] for p in heapq.nlargest(n, self.bids)],
+                "asks": [(p,) + self.asks[p] for p in heapq.nsmallest(n, self.asks)]}
+
+
+def measure(name, fn, count, repeat, unit="updates"):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:<28} {count / best:>12,.0f} {unit}/s  ({best / count * 1e6:.2f}us)")
+    return best
+
+
+def main(args):
+    frames = synthesize(args.frames, args.depth)
+    decoded = [order_book.decode(buf) for buf in frames]
+    print(f"{len(frames)} frames, {sum(len(m.bid_price) + len(m.ask_price) for m in decoded)} levels")
+
+    def decode_only():
+        decode = order_book.decode
+        for buf in frames:
+            decode(buf)
+
+    def ladder_apply():
+        book = order_book.OrderBook(EXCHANGE, SYMBOL, TICK)
+        for msg in decoded:
+            book.apply(msg)
+
+    def ladder_update_buf():
+        books = order_book.OrderBooks(default_tick_size=TICK)
+        update_buf = books.update_buf
+        for buf in frames:
+            update_buf(order_book.ORDER_BOOK, buf)
+
+    def dict_apply():
+        book = DictBook()
+        for msg in decoded:
+            book.apply(msg)
+
+    ladder = order_book.OrderBook(EXCHANGE, SYMBOL, TICK)
+    reference = DictBook()
+    for msg in decoded:
+        ladder.apply(msg)
+        reference.apply(msg)
+    same = ladder.top(10) == reference.top(10)
+    print(f"top 10 levels match the dict book: {same}")
+
+    measure("decode", decode_only, len(frames), args.repeat)
+    measure("ladder apply", ladder_apply, len(frames), args.repeat)
+    measure("ladder decode + apply", ladder_update_buf, len(frames), args.repeat)
+    measure("dict apply", dict_apply, len(frames), args.repeat)
+
+    queries = args.queries
+    measure("ladder best bid / ask", lambda: [(ladder.best_bid(), ladder.best_ask()) for _ in range(queries)],
+            queries, args.repeat, "queries")
+    measure("dict best bid / ask", lambda: [reference.best() for _ in range(queries)], queries, args.repeat,
+            "queries")
+    measure("ladder top(10)", lambda: [ladder.top(10) for _ in range(queries)], queries, args.repeat, "queries")
+    measure("ladder depth(10) arrays", lambda: [ladder.depth(10) for _ in range(queries)], queries,
+            args.repeat, "queries")
+    measure("dict top(10)", lambda: [reference.top(10) for _ in range(queries)], queries, args.repeat, "queries")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the order book on synthetic depth traffic.")
+    parser.add_argument("--frames", type=int, default=200000)
+    parser.add_argument("--depth", type=int, default=20, help="price levels each side in the image")
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,106 @@
+#   ===========================================================================
+#
+#   bench_request_templates.py
+#   ==========================
+#   Compares building and serializing a request from scratch, as the
+#   samples did, with encoding only its varying fields into a
+#   request_templates.RequestTemplate :
+#
+#          python -m benchmarks.bench_request_templates -n 20000
+#
+#   Both ways must produce the same bytes, which is checked first.
+#
+#   ===========================================================================
+
+import argparse
+import itertools
+import time
+
+from rithmic_api import codec
+from rithmic_api.request_heartbeat_pb2 import RequestHeartbeat
+from rithmic_api.request_new_order_pb2 import RequestNewOrder
+from rithmic_api.request_templates import RequestTemplate
+
+ORDER = dict(user_msg=["hello"], fcm_id="LocalFCM", ib_id="LocalIB", account_id="ACCT-1",
+             exchange="CME", symbol="ESZ6", duration=RequestNewOrder.Duration.DAY,
+             price_type=RequestNewOrder.PriceType.LIMIT, trade_route="simulator",
+             manual_or_auto=RequestNewOrder.OrderPlacement.MANUAL)
+ORDER_FIELDS = ("user_tag", "quantity", "price", "transaction_type")
+
+
+def order_from_scratch(user_tag, quantity, price, transaction_type):
+    rq = RequestNewOrder()
+    rq.template_id = 312
+    rq.user_msg.append("hello")
+    rq.user_tag = user_tag
+    rq.fcm_id = ORDER["fcm_id"]
+    rq.ib_id = ORDER["ib_id"]
+    rq.account_id = ORDER["account_id"]
+    rq.exchange = ORDER["exchange"]
+    rq.symbol = ORDER["symbol"]
+    rq.quantity = quantity
+    rq.price = price
+    rq.transaction_type = transaction_type
+    rq.duration = ORDER["duration"]
+    rq.price_type = ORDER["price_type"]
+    rq.trade_route = ORDER["trade_route"]
+    rq.manual_or_auto = ORDER["manual_or_auto"]
+    return codec.encode(rq)
+
+
+def heartbeat_from_scratch(token, ssboe, usecs):
+    rq = RequestHeartbeat()
+    rq.template_id = 18
+    rq.user_msg.append(token)
+    rq.ssboe = ssboe
+    rq.usecs = usecs
+    return codec.encode(rq)
+
+
+def measure(name, fn, args, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for a in args:
+            fn(*a)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    us = best / len(args) * 1e6
+    print(f"{name:<34} {us:>8.2f}us/request")
+    return us
+
+
+def main(args):
+    order = RequestTemplate(312, ORDER_FIELDS, **ORDER)
+    heartbeat = RequestTemplate(18, ("user_msg", "ssboe", "usecs"))
+
+    sides = itertools.cycle((RequestNewOrder.TransactionType.BUY, RequestNewOrder.TransactionType.SELL))
+    orders = [(f"order-{i}", 1 + i % 5, 5000.0 + (i % 40) * 0.25, next(sides)) for i in range(args.n)]
+    heartbeats = [(f"hb{i}", 1792313612 + i, i % 1000000) for i in range(args.n)]
+
+    def order_template(user_tag, quantity, price, transaction_type):
+        return order.encode(user_tag=user_tag, quantity=quantity, price=price,
+                            transaction_type=transaction_type)
+
+    def heartbeat_template(token, ssboe, usecs):
+        return heartbeat.encode(user_msg=(token,), ssboe=ssboe, usecs=usecs)
+
+    for a in orders[:1000]:
+        assert order_from_scratch(*a) == order_template(*a)
+    for a in heartbeats[:1000]:
+        assert heartbeat_from_scratch(*a) == heartbeat_template(*a)
+    print(f"templates match a full serialization; {args.n} requests, best of {args.repeat}")
+
+    before = measure("RequestNewOrder, from scratch", order_from_scratch, orders, args.repeat)
+    after = measure("RequestNewOrder, template", order_template, orders, args.repeat)
+    print(f"speedup {before / after:.2f}x")
+    before = measure("RequestHeartbeat, from scratch", heartbeat_from_scratch, heartbeats, args.repeat)
+    after = measure("RequestHeartbeat, template", heartbeat_template, heartbeats, args.repeat)
+    print(f"speedup {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pre-serialized request templates.")
+    parser.add_argument("-n", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,99 @@
+#   ===========================================================================
+#
+#   bench_shared_quotes.py
+#   ======================
+#   Exercises the shared-memory quote table with a writer process
+#   publishing as fast as it can and readers in other processes, as the
+#   Django workers would be :
+#
+#          python -m benchmarks.bench_shared_quotes --seconds 3 --readers 2
+#
+#   Every record the writer publishes has the same value in all of its
+#   price and size fields, so a reader that ever sees two different values
+#   in one record has seen a torn write; the count of those must be 0.
+#   Reported are writes and reads per second, seqlock retries, and read
+#   latency.
+#
+#   ===========================================================================
+
+import argparse
+import multiprocessing
+import time
+
+from rithmic_api.quote_state import EMPTY_QUOTE, EMPTY_TRADE, InstrumentState
+from rithmic_api.shared_quotes import QuoteTableReader, QuoteTableWriter
+
+NAME = "bench_rithmic_quotes"
+
+
+def write(name, symbols, seconds, ready, done):
+    writer = QuoteTableWriter(name, capacity=len(symbols))
+    states = [InstrumentState("CME", symbol) for symbol in symbols]
+    for state in states:
+        writer.publish(state)
+    ready.set()
+    started = time.perf_counter()
+    i = 0
+    while time.perf_counter() - started < seconds:
+        i += 1
+        state = states[i % len(states)]
+        state.quote = EMPTY_QUOTE._replace(bid_price=float(i), ask_price=float(i), bid_size=i, ask_size=i,
+                                           ssboe=1792300000, usecs=i % 1000000)
+        state.trade = EMPTY_TRADE._replace(trade_price=float(i), trade_size=i, volume=i)
+        state.received_at = time.time()
+        writer.publish(state)
+    done.put(("writer", writer.writes / (time.perf_counter() - started)))
+    # keep the block alive until the readers are done with it
+    time.sleep(0.5)
+    writer.close()
+
+
+def read(name, symbols, seconds, done):
+    reader = QuoteTableReader(name)
+    started = time.perf_counter()
+    reads = torn = 0
+    while time.perf_counter() - started < seconds:
+        for symbol in symbols:
+            q = reader.quote("CME", symbol)
+            reads += 1
+            if q["bid_price"] is not None and \
+                    not (q["bid_price"] == q["ask_price"] == q["last_price"] == q["bid_size"]
+                         == q["ask_size"] == q["last_size"] == q["volume"]):
+                torn += 1
+    elapsed = time.perf_counter() - started
+    done.put(("reader", reads / elapsed, elapsed / reads * 1e6, torn, reader.retried))
+    reader.close()
+
+
+def main(args):
+    symbols = [f"S{i}" for i in range(args.symbols)]
+    ready = multiprocessing.Event()
+    done = multiprocessing.Queue()
+    writer = multiprocessing.Process(target=write, args=(NAME, symbols, args.seconds, ready, done))
+    writer.start()
+    ready.wait()
+    readers = [multiprocessing.Process(target=read, args=(NAME, symbols, args.seconds, done))
+               for _ in range(args.readers)]
+    for reader in readers:
+        reader.start()
+    results = [done.get(timeout=args.seconds + 30) for _ in range(1 + args.readers)]
+    for process in [writer] + readers:
+        process.join()
+
+    total_torn = 0
+    for result in results:
+        if result[0] == "writer":
+            print(f"writer  {result[1]:>12,.0f} writes/s")
+        else:
+            _, rate, latency, torn, retried = result
+            total_torn += torn
+            print(f"reader  {rate:>12,.0f} reads/s  {latency:6.2f}us/read  {retried} retries  {torn} torn")
+    assert total_torn == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the shared-memory quote table.")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--symbols", type=int, default=16)
+    main(parser.parse_args())
@@ -0,0 +1,94 @@
+#   ===========================================================================
+#
+#   bench_tls.py
+#   ============
+#   Measures what the shared SSL context and TLS session resumption save on
+#   each new wss:// connection, against the local stand-in server :
+#
+#          python -m benchmarks.bench_tls -n 50
+#
+#   A self-signed certificate for localhost is generated with the openssl
+#   command line tool.  Three cases are timed, connect + login each :
+#
+#      fresh context   a new SSLContext per connection, loading the CA file
+#                      (what the samples used to do), full handshake
+#      shared context  tls.client_context(), full handshake
+#      resumed         tls.client_context() with the TLS session resumed
+#
+#   ===========================================================================
+
+import argparse
+import asyncio
+import pathlib
+import ssl
+import statistics
+import subprocess
+import tempfile
+import time
+
+from rithmic_api import tls
+from rithmic_api.local_server import LocalRithmicServer
+from rithmic_api.session import RithmicSession
+
+SYSTEM_NAME = "Rithmic Test"
+
+
+def make_certificate(directory):
+    certfile = pathlib.Path(directory, "localhost.pem")
+    keyfile = pathlib.Path(directory, "localhost.key")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost",
+                    "-keyout", str(keyfile), "-out", str(certfile)],
+                   check=True, capture_output=True)
+    return certfile, keyfile
+
+
+async def connect(uri, ssl_context):
+    started = time.perf_counter()
+    session = await RithmicSession.open(uri, SYSTEM_NAME, "bench", "bench", ssl_context=ssl_context)
+    elapsed = time.perf_counter() - started
+    await session.close()
+    return elapsed
+
+
+async def main(n):
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = make_certificate(directory)
+        server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        server_context.load_cert_chain(certfile, keyfile)
+        server = LocalRithmicServer(host="localhost", port=0, ssl_context=server_context)
+        await server.start()
+        try:
+            fresh = []
+            for _ in range(n):
+                started = time.perf_counter()
+                ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+                ssl_context.load_verify_locations(certfile)
+                fresh.append(time.perf_counter() - started + await connect(server.uri, ssl_context))
+
+            shared_context = tls.client_context(certfile)
+            shared = []
+            for _ in range(n):
+                shared_context.forget()
+                shared.append(await connect(server.uri, shared_context))
+
+            await connect(server.uri, shared_context)
+            resumed_before = shared_context.resumed
+            resumed = []
+            for _ in range(n):
+                resumed.append(await connect(server.uri, shared_context))
+            num_resumed = shared_context.resumed - resumed_before
+        finally:
+            await server.stop()
+
+    baseline = statistics.median(fresh)
+    for name, samples in (("fresh context", fresh), ("shared context", shared), ("resumed", resumed)):
+        median = statistics.median(samples)
+        print(f"{name:<16} median={median * 1000:8.3f}ms  saved={(baseline - median) * 1000:8.3f}ms/connection")
+    print(f"{num_resumed} of {n} connections resumed their TLS session")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark TLS context caching and session resumption.")
+    parser.add_argument("-n", type=int, default=50)
+    asyncio.run(main(parser.parse_args().n))
@@ -60,9 +60,6 @@
 #          pip3 install --user protobuf
 
 import asyncio
-import google.protobuf.message
-import pathlib
-import ssl
 import sys
 import websockets
 
@@ -81,27 +78,38 @@ import websockets
 #     message type.  The base_pb2 class is a convenience class to get the
 #     template_id so that the message can be passed to an appropriate handler
 #     routine.
+#   - The modules are loaded through the template registry, which imports
+#     each one the first time the sample actually uses it.
 
-import base_pb2
+from rithmic_api import templates
 
-import request_heartbeat_pb2
-import response_heartbeat_pb2
+base_pb2 = templates.lazy_module("base_pb2")
 
-import request_rithmic_system_info_pb2
-import response_rithmic_system_info_pb2
+request_heartbeat_pb2 = templates.lazy_module("request_heartbeat_pb2")
+response_heartbeat_pb2 = templates.lazy_module("response_heartbeat_pb2")
 
-import request_login_pb2
-import response_login_pb2
+request_rithmic_system_info_pb2 = templates.lazy_module("request_rithmic_system_info_pb2")
+response_rithmic_system_info_pb2 = templates.lazy_module("response_rithmic_system_info_pb2")
 
-import request_logout_pb2
-import response_logout_pb2
+request_login_pb2 = templates.lazy_module("request_login_pb2")
+response_login_pb2 = templates.lazy_module("response_login_pb2")
 
-import request_tick_bar_replay_pb2
-import response_tick_bar_replay_pb2
+request_logout_pb2 = templates.lazy_module("request_logout_pb2")
+response_logout_pb2 = templates.lazy_module("response_logout_pb2")
+
+request_tick_bar_replay_pb2 = templates.lazy_module("request_tick_bar_replay_pb2")
+response_tick_bar_replay_pb2 = templates.lazy_module("response_tick_bar_replay_pb2")
+
+from rithmic_api import codec, message_pool
+from rithmic_api.bar_replay import TickBarReplayDecoder
+from rithmic_api.dispatch import Dispatcher
+from rithmic_api.events import EventBus
+from rithmic_api.heartbeat import HeartbeatScheduler
+from rithmic_api.reader import MessageReader
+from rithmic_api.request_templates import RequestTemplate
+from rithmic_api import tls
 import sys
 import asyncio
-import pathlib
-import ssl
 import websockets
 
 # if len(sys.argv) != 6:
@@ -118,22 +126,12 @@ USAGE_2 = "  (try wss://rituz00100.rithmic.com:443 for the connect_point)"
 g_rp_is_done = False
 
 #   ===========================================================================
-#   This routine interprets the msg_buf as a ResponseTickBarReplay
+#   This routine handles a ResponseTickBarReplay, parsed by the dispatcher
 
-async def response_tick_bar_replay_cb(msg_buf):
-    # rithmic_order_notification : 207
+async def response_tick_bar_replay_cb(template_id, msg):
+    # response_tick_bar_replay : 207
     global g_rp_is_done
-    
-    msg = response_tick_bar_replay_pb2.ResponseTickBarReplay()
-    msg.ParseFromString(msg_buf[0:])
-
-    bar_type_to_string = {response_tick_bar_replay_pb2.ResponseTickBarReplay.BarType.TICK_BAR   : "TICK_BAR",
-                          response_tick_bar_replay_pb2.ResponseTickBarReplay.BarType.RANGE_BAR  : "RANGE_BAR",
-                          response_tick_bar_replay_pb2.ResponseTickBarReplay.BarType.VOLUME_BAR : "VOLUME_BAR"}
 
-    bar_sub_type_to_string = {response_tick_bar_replay_pb2.ResponseTickBarReplay.BarSubType.REGULAR : "REGULAR",
-                              response_tick_bar_replay_pb2.ResponseTickBarReplay.BarSubType.CUSTOM  : "CUSTOM"}
-    
     print(f"")
     print(f"   ResponseTickBarReplay : ")
     print(f"             template_id : {msg.template_id}")
@@ -144,8 +142,8 @@ async def response_tick_bar_replay_cb(msg_buf):
     print(f"                  symbol : {msg.symbol}")
     print(f"                exchange : {msg.exchange}")
     
-    print(f"                    type : {bar_type_to_string[msg.type]} ({msg.type})")
-    print(f"                sub_type : {bar_sub_type_to_string[msg.sub_type]} ({msg.sub_type})")
+    print(f"                    type : {templates.enum_name(msg, 'type')} ({msg.type})")
+    print(f"                sub_type : {templates.enum_name(msg, 'sub_type')} ({msg.sub_type})")
     print(f"         type_specifier  : {msg.type_specifier}")
 
     print(f"              num_trades : {msg.num_trades}")
@@ -195,19 +193,14 @@ async def connect_to_rithmic(uri, ssl_context):
 
 #   ===========================================================================
 #   This routine sends a heartbeat request.  It does not do anything about
-#   reading the heartbeat response (see consume() for reading).
-
-async def send_heartbeat(ws):
-    rq = request_heartbeat_pb2.RequestHeartbeat()
-
-    rq.template_id = 18
+#   reading the heartbeat response (see consume() for reading).  The request
+#   never changes, so it is serialized once and the same bytes are sent
+#   every time.
 
-    serialized = rq.SerializeToString()
+heartbeat_request = RequestTemplate(18)
 
-    buf  = bytearray()
-    buf  = serialized
-
-    await ws.send(buf)
+async def send_heartbeat(ws):
+    await ws.send(heartbeat_request.encode())
     print(f"sent heartbeat request")
 
 #   ===========================================================================
@@ -222,7 +215,7 @@ async def list_systems(ws):
     rq.user_msg.append("hello");
     rq.user_msg.append("world");
 
-    serialized = rq.SerializeToString()
+    serialized = codec.encode(rq)
 
     buf  = bytearray()
     buf  = serialized
@@ -233,8 +226,7 @@ async def list_systems(ws):
     rp_buf = bytearray()
     rp_buf = await ws.recv()
 
-    rp = response_rithmic_system_info_pb2.ResponseRithmicSystemInfo()
-    rp.ParseFromString(rp_buf[0:])
+    rp = codec.decode(response_rithmic_system_info_pb2.ResponseRithmicSystemInfo, rp_buf)
 
     # an rp code of "0" indicates that the request was completed successfully
     if rp.rp_code[0] == "0":
@@ -250,10 +242,37 @@ async def list_systems(ws):
         print(f" system_name : {rp.system_name}")
 
 #   ===========================================================================
-#   This routine reads data off the wire, occassionally sending heartbeats if
-#   there is no traffic.  It will exit after receiving max_num_messages.
+#   consume() routes messages through this table instead of an if/elif
+#   chain.  The dispatcher parses a message once, into the class registered
+#   for its template, and only when there is a handler for it.  The handlers
+#   are done with a message once they return, so one message per class is
+#   reused rather than allocating one per frame.
+#
+#   The replay responses are published on an event bus, which application
+#   code can subscribe its own handlers to; events.stats() shows how long
+#   each handler takes.
+
+msg_types = {13  : "logout response",
+             19  : "heartbeat response",
+             101 : "market data update response",
+             150 : "last_trade",
+             151 : "best_bid_offer",
+             207 : "tick bar replay response",
+             251 : "tick bar"}
+
+events = EventBus(slow=0.010)
+events.subscribe(207, response_tick_bar_replay_cb)
+
+dispatcher = Dispatcher(reuse=message_pool.REUSE)
+dispatcher.register_template(207, events.publish_async)
+
+#   ===========================================================================
+#   This routine reads data off the wire through a single reader task, which
+#   routes each msg to the stream below by template id, while a heartbeat
+#   scheduler keeps the session alive at the interval given at login.  It
+#   will exit after receiving max_num_messages.
 
-async def consume(ws):
+async def consume(ws, heartbeat_interval=None):
     global g_rp_is_done
     # send a heartbeat immediately, just in case
     await send_heartbeat(ws)
@@ -261,68 +280,66 @@ async def consume(ws):
     max_num_msgs = 100000
     num_msgs = 0
 
-    # After <max_num_msgs>  messages are read or the tick bar response is done,
-    # this routine will exit
-    while num_msgs < max_num_msgs and not g_rp_is_done :
-        msg_buf = bytearray()
+    reader    = MessageReader(ws).start()
+    stream    = reader.stream()
+    heartbeat = HeartbeatScheduler(ws.send, reader, heartbeat_interval).start()
 
-        waiting_for_msg = True
-        
-        while waiting_for_msg:
-            try:
-                print(f"waiting for msg ...")
-                msg_buf = await asyncio.wait_for(ws.recv(), timeout=5)
-                waiting_for_msg = False
-            except asyncio.TimeoutError:
-                if ws.open:
-                    print(f"sending heartbeat ...")
-                    await send_heartbeat(ws)
-                else:
-                    print(f"connection appears to be closed.  exiting consume()")
-                    return;
-
-        num_msgs += 1
-
-        print(f"received msg {num_msgs} of {max_num_msgs}")
-
-        # parse into base class just to get a template id
-        base = base_pb2.Base()
-        base.ParseFromString(msg_buf[0:])
-
-        # route msg based on template id
-        if base.template_id == 13:
-            msg_type = "logout response"
-            print(f" consumed msg : {msg_type} ({base.template_id})")
-            
-        elif base.template_id == 19:
-            msg_type = "heartbeat response"
-            print(f" consumed msg : {msg_type} ({base.template_id})")
-            
-        elif base.template_id == 101:
-            msg_type = "market data update response"
-            print(f" consumed msg : {msg_type} ({base.template_id})")
-
-        elif base.template_id == 151: # best_bid_offer
-            msg_type = "best_bid_offer"
-            print(f" consumed msg : {msg_type} ({base.template_id})")
-            
-        elif base.template_id == 150: # last_trade
-            msg_type = "last_trade"
-            print(f" consumed msg : {msg_type} ({base.template_id})")
-
-        elif base.template_id == 207:
-            msg_type = "tick bar replay response"
-            print(f" consumed msg : {msg_type} ({base.template_id})")
-            await response_tick_bar_replay_cb(msg_buf)
-    
-        elif base.template_id == 251:
-            msg_type = "tick bar"
-            print(f" consumed msg : {msg_type} ({base.template_id})")
+    try:
+        # After <max_num_msgs>  messages are read or the tick bar response is done,
+        # this routine will exit
+        async for template_id, msg_buf in stream:
+            num_msgs += 1
+
+            print(f"received msg {num_msgs} of {max_num_msgs}")
+
+            # route msg based on template id
+            msg_type = msg_types.get(template_id, "unrecognized template id")
+            print(f" consumed msg : {msg_type} ({template_id})")
+            await dispatcher.dispatch_async(template_id, msg_buf)
 
+            if num_msgs >= max_num_msgs or g_rp_is_done:
+                break
         else:
-            msg_type = "unrecognized template id"
-            print(f" consumed msg : {msg_type} ({base.template_id})")
-            
+            print(f"connection appears to be closed.  exiting consume()")
+    finally:
+        heartbeat.stop()
+        await reader.stop()
+
+#   ===========================================================================
+#   The alternative to consume() for large replays.  Printing every bar on
+#   the event loop holds up everything else on it for the whole replay, so
+#   here the loop only collects the raw bars, which are decoded in batches
+#   by a process pool into one packed array.  It returns that array, or
+#   None if the connection closes before the replay is done.
+
+async def consume_in_pool(ws, heartbeat_interval=None, batch_size=5000):
+    await send_heartbeat(ws)
+
+    reader    = MessageReader(ws).start()
+    heartbeat = HeartbeatScheduler(ws.send, reader, heartbeat_interval).start()
+    replay    = TickBarReplayDecoder(batch_size).attach(reader)
+
+    result = asyncio.ensure_future(replay.result())
+    closed = asyncio.ensure_future(reader.closed.wait())
+    try:
+        await asyncio.wait({result, closed}, return_when=asyncio.FIRST_COMPLETED)
+        if not result.done():
+            print(f"connection appears to be closed.  exiting consume_in_pool()")
+            return None
+
+        bars = result.result()
+        print(f"tick bar responses are done : {len(bars)} bars, rp_code {list(replay.end.rp_code)}")
+        if len(bars):
+            print(f"  open {bars['open_price'][0]}  high {bars['high_price'].max()}"
+                  f"  low {bars['low_price'].min()}  close {bars['close_price'][-1]}"
+                  f"  volume {bars['volume'].sum()}")
+        return bars
+    finally:
+        result.cancel()
+        closed.cancel()
+        replay.close()
+        heartbeat.stop()
+        await reader.stop()
 
 #   ===========================================================================
 #   This routine logs into the specified Rithmic system using the specified
@@ -343,7 +360,7 @@ async def rithmic_login(ws, system_name, infra_type, user_id, password):
     rq.system_name = system_name
     rq.infra_type  = infra_type
 
-    serialized = rq.SerializeToString()
+    serialized = codec.encode(rq)
 
     buf  = bytearray()
     buf  = serialized
@@ -353,8 +370,7 @@ async def rithmic_login(ws, system_name, infra_type, user_id, password):
     rp_buf = bytearray()
     rp_buf = await ws.recv()
 
-    rp = response_login_pb2.ResponseLogin()
-    rp.ParseFromString(rp_buf[0:])
+    rp = codec.decode(response_login_pb2.ResponseLogin, rp_buf)
 
     print(f"")
     print(f"      ResponseLogin :")
@@ -371,6 +387,8 @@ async def rithmic_login(ws, system_name, infra_type, user_id, password):
     print(f"     unique_user_id : {rp.unique_user_id}")
     print(f"")
 
+    return rp
+
 #   ===========================================================================
 #   This routine requests tick bars for the
 #   specified instrument.  Any received messages resulting from this request
@@ -398,7 +416,7 @@ async def replay_tick_bars(ws, exchange, symbol):
     rq.start_index  = 1595260800  # 2020-07-20 12:00:00 EDT
     rq.finish_index = 1595261400  # 2020-07-20 12:10:00 EDT
     
-    serialized = rq.SerializeToString()
+    serialized = codec.encode(rq)
 
     buf  = bytearray()
     buf  = serialized
@@ -414,7 +432,7 @@ async def rithmic_logout(ws):
     rq.template_id      = 12;
     rq.user_msg.append("hello")
 
-    serialized = rq.SerializeToString()
+    serialized = codec.encode(rq)
 
     buf = bytearray()
     buf = serialized
@@ -440,11 +458,9 @@ if __name__ == "__main__":
         # check if we should use ssl/tls
         ssl_context = None
         if "wss://" in uri:
-            # Set up the ssl context.  One can also use an alternate SSL/TLS cert file
-            # or database
-            ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-            localhost_pem = pathlib.Path(__file__).with_name("rithmic_ssl_cert_auth_params")
-            ssl_context.load_verify_locations(localhost_pem)
+            # Use the shared ssl context.  One can also pass an alternate
+            # SSL/TLS cert file to tls.client_context()
+            ssl_context = tls.client_context()
 
         ws = loop.run_until_complete(connect_to_rithmic(uri, ssl_context))
 
@@ -456,11 +472,11 @@ if __name__ == "__main__":
             password = sys.argv[4]
 
             if once == True:
-                loop.run_until_complete(rithmic_login(ws,
-                                                      system_name,
-                                                      request_login_pb2.RequestLogin.SysInfraType.HISTORY_PLANT,
-                                                      user_id,
-                                                      password))
+                login_rp = loop.run_until_complete(rithmic_login(ws,
+                                                                 system_name,
+                                                                 request_login_pb2.RequestLogin.SysInfraType.HISTORY_PLANT,
+                                                                 user_id,
+                                                                 password))
                 once = False
 
             exchange = sys.argv[5]
@@ -468,7 +484,7 @@ if __name__ == "__main__":
 
             loop.run_until_complete(replay_tick_bars(ws, exchange, symbol))
 
-            loop.run_until_complete(consume(ws))
+            loop.run_until_complete(consume(ws, login_rp.heartbeat_interval))
 
             if ws.open:
                 print(f"logging out ...")
@@ -489,18 +505,25 @@ if __name__ == "__main__":
 
 # Import all required protobufs and utility functions used in SampleBar.py
 
-async def run_sample_bar(uri, system_name, user_id, password, exchange, symbol):
-    # Set up SSL
-    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-    localhost_pem = pathlib.Path(__file__).with_name("rithmic_ssl_cert_auth_params")
-    ssl_context.load_verify_locations(localhost_pem)
+async def run_sample_bar(uri, system_name, user_id, password, exchange, symbol, process_pool=False):
+    # Set up SSL; the context is shared so later calls can resume the TLS session
+    ssl_context = tls.client_context() if "wss://" in uri else None
     # Connect to Rithmic
     ws = await connect_to_rithmic(uri, ssl_context)
-    await rithmic_login(ws, system_name, "HISTORY_PLANT", user_id, password)
+    login_rp = await rithmic_login(ws,
+                                   system_name,
+                                   request_login_pb2.RequestLogin.SysInfraType.HISTORY_PLANT,
+                                   user_id,
+                                   password)
+    tls.remember(ws)
     # Request tick bar data
     await replay_tick_bars(ws, exchange, symbol)
-    # Consume messages (display or process tick data)
-    await consume(ws)
+    # Consume messages (display or process tick data); large replays are
+    # better decoded in a process pool than printed one by one
+    if process_pool:
+        await consume_in_pool(ws, login_rp.heartbeat_interval)
+    else:
+        await consume(ws, login_rp.heartbeat_interval)
     # Logout and disconnect if connection is still open
     if ws.open:
         await rithmic_logout(ws)
@@ -1,15 +1,18 @@
-import asyncio
-import pathlib
-import ssl
+import functools
+
 import websockets
-from rithmic_api.base_pb2 import Base
-from rithmic_api.request_heartbeat_pb2 import RequestHeartbeat
-from rithmic_api.request_login_pb2 import RequestLogin
-from rithmic_api.request_market_data_update_pb2 import RequestMarketDataUpdate
-from rithmic_api.response_login_pb2 import ResponseLogin
-from rithmic_api.response_market_data_update_pb2 import ResponseMarketDataUpdate
-from rithmic_api.best_bid_offer_pb2 import BestBidOffer
-from rithmic_api.last_trade_pb2 import LastTrade
+from rithmic_api import codec, quote_state, templates
+from rithmic_api.dispatch import Dispatcher
+from rithmic_api.session_pool import pool, run_coroutine
+from rithmic_api.subscriptions import BBO, LAST_TRADE, ORDER_BOOK, SubscriptionManager
+
+# the generated modules are imported the first time they are used
+request_heartbeat_pb2 = templates.lazy_module("request_heartbeat_pb2")
+request_login_pb2 = templates.lazy_module("request_login_pb2")
+request_market_data_update_pb2 = templates.lazy_module("request_market_data_update_pb2")
+response_login_pb2 = templates.lazy_module("response_login_pb2")
+# and the order book, with NumPy, only when depth is asked for
+order_book = templates.lazy_module("order_book")
 
 
 async def connect_to_rithmic(uri, ssl_context=None):
@@ -21,7 +24,7 @@ async def connect_to_rithmic(uri, ssl_context=None):
 
 async def rithmic_login(ws, system_name, user_id, password):
     """Log in to the Rithmic system."""
-    rq = RequestLogin()
+    rq = request_login_pb2.RequestLogin()
     rq.template_id = 10
     rq.template_version = "3.9"
     rq.user = user_id
@@ -29,92 +32,120 @@ async def rithmic_login(ws, system_name, user_id, password):
     rq.app_name = "SampleMD.py"
     rq.app_version = "0.3.0.0"
     rq.system_name = system_name
-    rq.infra_type = RequestLogin.SysInfraType.TICKER_PLANT
+    rq.infra_type = request_login_pb2.RequestLogin.SysInfraType.TICKER_PLANT
 
-    await ws.send(rq.SerializeToString())
+    await ws.send(codec.encode(rq))
     rp_buf = await ws.recv()
 
-    rp = ResponseLogin()
-    rp.ParseFromString(rp_buf)
+    rp = codec.decode(response_login_pb2.ResponseLogin, rp_buf)
 
     print(f"ResponseLogin:\nTemplate ID: {rp.template_id}\nTemplate Version: {rp.template_version}\n"
           f"User Msg: {rp.user_msg}\nRP Code: {rp.rp_code}\nFCM ID: {rp.fcm_id}\nIB ID: {rp.ib_id}")
 
 
-async def subscribe(ws, exchange, symbol):
+async def subscribe(ws, exchange, symbol, update_bits=LAST_TRADE | BBO):
     """Subscribe to market data."""
-    rq = RequestMarketDataUpdate()
+    rq = request_market_data_update_pb2.RequestMarketDataUpdate()
     rq.template_id = 100
     rq.symbol = symbol
     rq.exchange = exchange
-    rq.request = RequestMarketDataUpdate.Request.SUBSCRIBE
-    rq.update_bits = RequestMarketDataUpdate.UpdateBits.LAST_TRADE | RequestMarketDataUpdate.UpdateBits.BBO
+    rq.request = request_market_data_update_pb2.RequestMarketDataUpdate.Request.SUBSCRIBE
+    rq.update_bits = update_bits
 
-    await ws.send(rq.SerializeToString())
+    await ws.send(codec.encode(rq))
     print(f"Subscribed to market data for {symbol} on {exchange}")
 
 
-async def consume(ws, max_num_msgs=100):
-    """Consume and handle market data messages."""
+# updates only carry the fields flagged in presence_bits, so print the
+# merged state of the caller's QuoteState rather than the update itself
+def print_best_bid_offer(quotes, template_id, msg):
+    quote = quotes.update(template_id, msg).quote
+    print(f"BestBidOffer:\nSymbol: {msg.symbol}, Bid Price: {quote.bid_price}, Ask Price: {quote.ask_price}")
+
+
+def print_last_trade(quotes, template_id, msg):
+    trade = quotes.update(template_id, msg).trade
+    print(f"LastTrade:\nSymbol: {msg.symbol}, Trade Price: {trade.trade_price}")
+
+
+# depth updates only carry the levels that changed, so print the book
+def print_order_book(books, template_id, msg):
+    book = books.update(template_id, msg)
+    if not book.consistent:
+        return
+    top = book.top(5)
+    print(f"OrderBook:\nSymbol: {msg.symbol}, Bids: {[(p, s) for p, s, _ in top['bids']]}, "
+          f"Asks: {[(p, s) for p, s, _ in top['asks']]}")
+
+
+def print_unhandled(template_id, msg_buf):
+    print(f"Unhandled message type: {template_id}")
+
+
+def make_dispatcher(quotes, books=None):
+    """A dispatcher printing into one caller's state, so that concurrent
+    runs never merge each other's quotes or books.  Depth is only handled
+    when books is given."""
+    # decode just the fields the quote state needs from the wire
+    dispatcher = Dispatcher(default=print_unhandled)
+    dispatcher.register(151, quote_state.DECODERS[151], functools.partial(print_best_bid_offer, quotes))
+    dispatcher.register(150, quote_state.DECODERS[150], functools.partial(print_last_trade, quotes))
+    if books is not None:
+        dispatcher.register(order_book.ORDER_BOOK, order_book.decode, functools.partial(print_order_book, books))
+    return dispatcher
+
+
+async def consume(stream, dispatcher, max_num_msgs=100):
+    """Consume and handle market data messages from a reader stream."""
     num_msgs = 0
 
-    while num_msgs < max_num_msgs:
-        try:
-            msg_buf = await asyncio.wait_for(ws.recv(), timeout=5)
-            num_msgs += 1
-            print(f"Received message {num_msgs}/{max_num_msgs}")
-
-            base = Base()
-            base.ParseFromString(msg_buf)
-
-            if base.template_id == 151:  # BestBidOffer
-                msg = BestBidOffer()
-                msg.ParseFromString(msg_buf)
-                print(f"BestBidOffer:\nSymbol: {msg.symbol}, Bid Price: {msg.bid_price}, Ask Price: {msg.ask_price}")
-            elif base.template_id == 150:  # LastTrade
-                msg = LastTrade()
-                msg.ParseFromString(msg_buf)
-                print(f"LastTrade:\nSymbol: {msg.symbol}, Trade Price: {msg.trade_price}")
-            else:
-                print(f"Unhandled message type: {base.template_id}")
-
-        except asyncio.TimeoutError:
-            print("No message received, sending heartbeat.")
-            await send_heartbeat(ws)
-        except websockets.ConnectionClosed:
-            print("WebSocket connection closed.")
+    async for template_id, msg_buf in stream:
+        num_msgs += 1
+        print(f"Received message {num_msgs}/{max_num_msgs}")
+
+        dispatcher.dispatch(template_id, msg_buf)
+
+        if num_msgs >= max_num_msgs:
             break
+    else:
+        print("WebSocket connection closed.")
 
 
 async def send_heartbeat(ws):
     """Send a heartbeat to keep the connection alive."""
-    rq = RequestHeartbeat()
+    rq = request_heartbeat_pb2.RequestHeartbeat()
     rq.template_id = 18
-    await ws.send(rq.SerializeToString())
+    await ws.send(codec.encode(rq))
     print("Sent heartbeat request")
 
 
-async def main(uri, system_name, user_id, password, exchange, symbol):
-    """Main function to connect and subscribe to Rithmic market data."""
-    ssl_context = None
-    if "wss://" in uri:
-        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-        localhost_pem = pathlib.Path(__file__).with_name("rithmic_ssl_cert_auth_params")
-        ssl_context.load_verify_locations(localhost_pem)
-
-    ws = await connect_to_rithmic(uri, ssl_context)
-    try:
-        await rithmic_login(ws, system_name, user_id, password)
-        await subscribe(ws, exchange, symbol)
-        await consume(ws)
-    finally:
-        await ws.close()
-        print("WebSocket connection closed.")
+async def main(uri, system_name, user_id, password, exchange, symbol, update_bits=LAST_TRADE | BBO):
+    """Main function to subscribe to Rithmic market data on a pooled session.
+
+    symbol may be a comma-separated list, e.g. "ESZ4,NQZ4", to follow
+    several instruments over the same session.  update_bits says what to
+    receive; LAST_TRADE alone spares the far busier BBO stream, adding
+    ORDER_BOOK prints the top of the depth as well.
+    """
+    instruments = [(exchange, s.strip()) for s in symbol.split(",") if s.strip()]
+
+    async with pool.session(uri, system_name, user_id, password) as session:
+        subscriptions = SubscriptionManager([session])
+        stream = session.reader.stream()
+        try:
+            await subscriptions.subscribe_many(instruments, update_bits)
+            print(f"Subscribed to market data for {symbol} on {exchange}")
+            books = order_book.OrderBooks() if update_bits & ORDER_BOOK else None
+            await consume(stream, make_dispatcher(quote_state.QuoteState(), books))
+        finally:
+            stream.close()
+            # unsubscribes everything before the session goes back to the pool
+            await subscriptions.close()
 
 
-def run_rithmic(uri, system_name, user_id, password, exchange, symbol):
+def run_rithmic(uri, system_name, user_id, password, exchange, symbol, update_bits=LAST_TRADE | BBO):
     """Run the Rithmic client as a function."""
-    asyncio.run(main(uri, system_name, user_id, password, exchange, symbol))
+    run_coroutine(main(uri, system_name, user_id, password, exchange, symbol, update_bits))
 
 
 # Example of how to call the function programmatically
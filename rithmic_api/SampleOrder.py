@@ -60,9 +60,6 @@
 #          pip3 install --user protobuf
 
 import asyncio
-import google.protobuf.message
-import pathlib
-import ssl
 import sys
 import websockets
 
@@ -81,41 +78,54 @@ import websockets
 #     message type.  The base_pb2 class is a convenience class to get the
 #     template_id so that the message can be passed to an appropriate handler
 #     routine.
+#   - The modules are loaded through the template registry, which imports
+#     each one the first time the sample actually uses it.
 
-import base_pb2
+from rithmic_api import templates
 
-import request_account_list_pb2
-import response_account_list_pb2
+base_pb2 = templates.lazy_module("base_pb2")
 
-import request_heartbeat_pb2
-import response_heartbeat_pb2
+request_account_list_pb2 = templates.lazy_module("request_account_list_pb2")
+response_account_list_pb2 = templates.lazy_module("response_account_list_pb2")
 
-import request_rithmic_system_info_pb2
-import response_rithmic_system_info_pb2
+request_heartbeat_pb2 = templates.lazy_module("request_heartbeat_pb2")
+response_heartbeat_pb2 = templates.lazy_module("response_heartbeat_pb2")
 
-import request_login_pb2
-import response_login_pb2
+request_rithmic_system_info_pb2 = templates.lazy_module("request_rithmic_system_info_pb2")
+response_rithmic_system_info_pb2 = templates.lazy_module("response_rithmic_system_info_pb2")
 
-import request_login_info_pb2
-import response_login_info_pb2
+request_login_pb2 = templates.lazy_module("request_login_pb2")
+response_login_pb2 = templates.lazy_module("response_login_pb2")
 
-import request_logout_pb2
-import response_logout_pb2
+request_login_info_pb2 = templates.lazy_module("request_login_info_pb2")
+response_login_info_pb2 = templates.lazy_module("response_login_info_pb2")
 
-import request_market_data_update_pb2
-import response_market_data_update_pb2
+request_logout_pb2 = templates.lazy_module("request_logout_pb2")
+response_logout_pb2 = templates.lazy_module("response_logout_pb2")
 
-import request_trade_routes_pb2
-import response_trade_routes_pb2
+request_market_data_update_pb2 = templates.lazy_module("request_market_data_update_pb2")
+response_market_data_update_pb2 = templates.lazy_module("response_market_data_update_pb2")
 
-import request_subscribe_for_order_updates_pb2
-import response_subscribe_for_order_updates_pb2
+request_trade_routes_pb2 = templates.lazy_module("request_trade_routes_pb2")
+response_trade_routes_pb2 = templates.lazy_module("response_trade_routes_pb2")
 
-import request_new_order_pb2
-import response_new_order_pb2
+request_subscribe_for_order_updates_pb2 = templates.lazy_module("request_subscribe_for_order_updates_pb2")
+response_subscribe_for_order_updates_pb2 = templates.lazy_module("response_subscribe_for_order_updates_pb2")
 
-import exchange_order_notification_pb2
-import rithmic_order_notification_pb2
+request_new_order_pb2 = templates.lazy_module("request_new_order_pb2")
+response_new_order_pb2 = templates.lazy_module("response_new_order_pb2")
+
+exchange_order_notification_pb2 = templates.lazy_module("exchange_order_notification_pb2")
+rithmic_order_notification_pb2 = templates.lazy_module("rithmic_order_notification_pb2")
+
+from rithmic_api import codec, message_pool
+from rithmic_api.correlation import RequestRouter
+from rithmic_api.dispatch import Dispatcher
+from rithmic_api.events import EventBus
+from rithmic_api.heartbeat import HeartbeatScheduler
+from rithmic_api.reader import MessageReader
+from rithmic_api.request_templates import RequestTemplate, RequestTemplateCache
+from rithmic_api import tls
 
 #   ===========================================================================
 
@@ -141,56 +151,14 @@ g_side = ""
 g_order_is_complete = False;
 
 #   ===========================================================================
-#   This routine interprets the msg_buf as a RithmicOrderNotification.
+#   This routine handles a RithmicOrderNotification, parsed by the dispatcher.
 
-async def rithmic_order_notification_cb(msg_buf):
+async def rithmic_order_notification_cb(template_id, msg):
     # rithmic_order_notification : 351
-    global g_order_is_complete
-    
-    msg = rithmic_order_notification_pb2.RithmicOrderNotification()
-    msg.ParseFromString(msg_buf[0:])
-
-    notify_type_to_string = {rithmic_order_notification_pb2.RithmicOrderNotification.ORDER_RCVD_FROM_CLNT     : "ORDER_RCVD_FROM_CLNT",
-                             rithmic_order_notification_pb2.RithmicOrderNotification.MODIFY_RCVD_FROM_CLNT    : "MODIFY_RCVD_FROM_CLNT",
-                             rithmic_order_notification_pb2.RithmicOrderNotification.CANCEL_RCVD_FROM_CLNT    : "CANCEL_RCVD_FROM_CLNT",
-                             rithmic_order_notification_pb2.RithmicOrderNotification.OPEN_PENDING             : "OPEN_PENDING",
-                             rithmic_order_notification_pb2.RithmicOrderNotification.MODIFY_PENDING           : "MODIFY_PENDING",
-                             rithmic_order_notification_pb2.RithmicOrderNotification.CANCEL_PENDING           : "CANCEL_PENDING",
-                             rithmic_order_notification_pb2.RithmicOrderNotification.ORDER_RCVD_BY_EXCH_GTWY  : "ORDER_RCVD_BY_EXCH_GTWY",
-                             rithmic_order_notification_pb2.RithmicOrderNotification.MODIFY_RCVD_BY_EXCH_GTWY : "MODIFY_RCVD_BY_EXCH_GTWY",
-                             rithmic_order_notification_pb2.RithmicOrderNotification.CANCEL_RCVD_BY_EXCH_GTWY : "CANCEL_RCVD_BY_EXCH_GTWY",
-                             rithmic_order_notification_pb2.RithmicOrderNotification.ORDER_SENT_TO_EXCH       : "ORDER_SENT_TO_EXCH",
-                             rithmic_order_notification_pb2.RithmicOrderNotification.MODIFY_SENT_TO_EXCH      : "MODIFY_SENT_TO_EXCH",
-                             rithmic_order_notification_pb2.RithmicOrderNotification.CANCEL_SENT_TO_EXCH      : "CANCEL_SENT_TO_EXCH",
-                             rithmic_order_notification_pb2.RithmicOrderNotification.OPEN                     : "OPEN",
-                             rithmic_order_notification_pb2.RithmicOrderNotification.MODIFIED                 : "MODIFIED",
-                             rithmic_order_notification_pb2.RithmicOrderNotification.COMPLETE                 : "COMPLETE",
-                             rithmic_order_notification_pb2.RithmicOrderNotification.MODIFICATION_FAILED      : "MODIFICATION_FAILED",
-                             rithmic_order_notification_pb2.RithmicOrderNotification.CANCELLATION_FAILED      : "CANCELLATION_FAILED",
-                             rithmic_order_notification_pb2.RithmicOrderNotification.TRIGGER_PENDING          : "TRIGGER_PENDING",
-                             rithmic_order_notification_pb2.RithmicOrderNotification.GENERIC                  : "GENERIC",
-                             rithmic_order_notification_pb2.RithmicOrderNotification.LINK_ORDERS_FAILED       : "LINK_ORDERS_FAILED"}
-
-    transaction_type_to_string = {rithmic_order_notification_pb2.RithmicOrderNotification.TransactionType.BUY  : "BUY",
-                                  rithmic_order_notification_pb2.RithmicOrderNotification.TransactionType.SELL : "SELL"}
-
-    duration_to_string = {rithmic_order_notification_pb2.RithmicOrderNotification.Duration.DAY : "DAY",
-                          rithmic_order_notification_pb2.RithmicOrderNotification.Duration.GTC : "GTC",
-                          rithmic_order_notification_pb2.RithmicOrderNotification.Duration.IOC : "IOC",
-                          rithmic_order_notification_pb2.RithmicOrderNotification.Duration.FOK : "FOK"}
-
-    price_type_to_string = {rithmic_order_notification_pb2.RithmicOrderNotification.PriceType.LIMIT       : "LIMIT",
-                            rithmic_order_notification_pb2.RithmicOrderNotification.PriceType.MARKET      : "MARKET",
-                            rithmic_order_notification_pb2.RithmicOrderNotification.PriceType.STOP_LIMIT  : "STOP_LIMIT",
-                            rithmic_order_notification_pb2.RithmicOrderNotification.PriceType.STOP_MARKET : "STOP_MARKET"}
-
-    order_placement_to_string = {rithmic_order_notification_pb2.RithmicOrderNotification.OrderPlacement.MANUAL : "LIMIT",
-                                 rithmic_order_notification_pb2.RithmicOrderNotification.OrderPlacement.AUTO   : "AUTO"}
-
     print(f"")
     print(f" RithmicOrderNotification : ")
     print(f"              template_id : {msg.template_id}")
-    print(f"              notify_type : {notify_type_to_string[msg.notify_type]} ({msg.notify_type})")
+    print(f"              notify_type : {templates.enum_name(msg, 'notify_type')} ({msg.notify_type})")
     print(f"              is_snapshot : {msg.is_snapshot}")
 
     print(f"                   status : {msg.status}")
@@ -213,11 +181,11 @@ async def rithmic_order_notification_cb(msg_buf):
     print(f"                    price : {msg.price}")
     print(f"            trigger_price : {msg.trigger_price}")
     
-    print(f"         transaction_type : {transaction_type_to_string[msg.transaction_type]} ({msg.transaction_type})")
-    print(f"                duration  : {duration_to_string[msg.duration]} ({msg.duration})")
-    print(f"               price_type : {price_type_to_string[msg.price_type]} ({msg.price_type})")
-    print(f"          orig_price_type : {price_type_to_string[msg.orig_price_type]} ({msg.orig_price_type})")
-    print(f"           manual_or_auto : {order_placement_to_string[msg.manual_or_auto]} ({msg.manual_or_auto})")
+    print(f"         transaction_type : {templates.enum_name(msg, 'transaction_type')} ({msg.transaction_type})")
+    print(f"                duration  : {templates.enum_name(msg, 'duration')} ({msg.duration})")
+    print(f"               price_type : {templates.enum_name(msg, 'price_type')} ({msg.price_type})")
+    print(f"          orig_price_type : {templates.enum_name(msg, 'orig_price_type')} ({msg.orig_price_type})")
+    print(f"           manual_or_auto : {templates.enum_name(msg, 'manual_or_auto')} ({msg.manual_or_auto})")
 
     print(f"         sequence_number  : {msg.sequence_number}")
     print(f"    orig_sequence_number  : {msg.orig_sequence_number}")
@@ -234,48 +202,27 @@ async def rithmic_order_notification_cb(msg_buf):
     print(f"                    usecs : {msg.usecs}")
     print(f"")
 
+#   ===========================================================================
+#   This routine watches RithmicOrderNotifications for the order completing,
+#   which is what consume() waits for.
+
+def order_complete_cb(template_id, msg):
+    global g_order_is_complete
+
     if msg.status == "complete" or \
        msg.notify_type == rithmic_order_notification_pb2.RithmicOrderNotification.COMPLETE:
         g_order_is_complete = True
-        
+
 #   ===========================================================================
-#   This routine interprets the msg_buf as a ExchangeOrderNotification.
+#   This routine handles an ExchangeOrderNotification, parsed by the dispatcher.
 
-async def exchange_order_notification_cb(msg_buf):
+async def exchange_order_notification_cb(template_id, msg):
     # exchange_order_notification : 352
-    msg = exchange_order_notification_pb2.ExchangeOrderNotification()
-    msg.ParseFromString(msg_buf[0:])
-
-    notify_type_to_string = {exchange_order_notification_pb2.ExchangeOrderNotification.STATUS        : "STATUS",
-                             exchange_order_notification_pb2.ExchangeOrderNotification.MODIFY        : "MODIFY",
-                             exchange_order_notification_pb2.ExchangeOrderNotification.CANCEL        : "CANCEL",
-                             exchange_order_notification_pb2.ExchangeOrderNotification.TRIGGER       : "TRIGGER",
-                             exchange_order_notification_pb2.ExchangeOrderNotification.FILL          : "FILL",
-                             exchange_order_notification_pb2.ExchangeOrderNotification.REJECT        : "REJECT",
-                             exchange_order_notification_pb2.ExchangeOrderNotification.NOT_MODIFIED  : "NOT_MODIFIED",
-                             exchange_order_notification_pb2.ExchangeOrderNotification.NOT_CANCELLED : "NOT_CANCELLED",
-                             exchange_order_notification_pb2.ExchangeOrderNotification.GENERIC       : "GENERIC"}
-
-    transaction_type_to_string = {exchange_order_notification_pb2.ExchangeOrderNotification.TransactionType.BUY  : "BUY",
-                                  exchange_order_notification_pb2.ExchangeOrderNotification.TransactionType.SELL : "SELL"}
-
-    duration_to_string = {exchange_order_notification_pb2.ExchangeOrderNotification.Duration.DAY : "DAY",
-                          exchange_order_notification_pb2.ExchangeOrderNotification.Duration.GTC : "GTC",
-                          exchange_order_notification_pb2.ExchangeOrderNotification.Duration.IOC : "IOC",
-                          exchange_order_notification_pb2.ExchangeOrderNotification.Duration.FOK : "FOK"}
-
-    price_type_to_string = {exchange_order_notification_pb2.ExchangeOrderNotification.PriceType.LIMIT       : "LIMIT",
-                            exchange_order_notification_pb2.ExchangeOrderNotification.PriceType.MARKET      : "MARKET",
-                            exchange_order_notification_pb2.ExchangeOrderNotification.PriceType.STOP_LIMIT  : "STOP_LIMIT",
-                            exchange_order_notification_pb2.ExchangeOrderNotification.PriceType.STOP_MARKET : "STOP_MARKET"}
-
-    order_placement_to_string = {exchange_order_notification_pb2.ExchangeOrderNotification.OrderPlacement.MANUAL : "LIMIT",
-                                 exchange_order_notification_pb2.ExchangeOrderNotification.OrderPlacement.AUTO   : "AUTO"}
 
     print(f"")
     print(f" ExchangeOrderNotification : ")
     print(f"               template_id : {msg.template_id}")
-    print(f"               notify_type : {notify_type_to_string[msg.notify_type]} ({msg.notify_type})")
+    print(f"               notify_type : {templates.enum_name(msg, 'notify_type')} ({msg.notify_type})")
     print(f"               is_snapshot : {msg.is_snapshot}")
 
     print(f"              report_type : {msg.report_type}")
@@ -299,11 +246,11 @@ async def exchange_order_notification_cb(msg_buf):
     print(f"                    price : {msg.price}")
     print(f"            trigger_price : {msg.trigger_price}")
     
-    print(f"         transaction_type : {transaction_type_to_string[msg.transaction_type]} ({msg.transaction_type})")
-    print(f"                duration  : {duration_to_string[msg.duration]} ({msg.duration})")
-    print(f"               price_type : {price_type_to_string[msg.price_type]} ({msg.price_type})")
-    print(f"          orig_price_type : {price_type_to_string[msg.orig_price_type]} ({msg.orig_price_type})")
-    print(f"           manual_or_auto : {order_placement_to_string[msg.manual_or_auto]} ({msg.manual_or_auto})")
+    print(f"         transaction_type : {templates.enum_name(msg, 'transaction_type')} ({msg.transaction_type})")
+    print(f"                duration  : {templates.enum_name(msg, 'duration')} ({msg.duration})")
+    print(f"               price_type : {templates.enum_name(msg, 'price_type')} ({msg.price_type})")
+    print(f"          orig_price_type : {templates.enum_name(msg, 'orig_price_type')} ({msg.orig_price_type})")
+    print(f"           manual_or_auto : {templates.enum_name(msg, 'manual_or_auto')} ({msg.manual_or_auto})")
 
     print(f"           confirmed_size : {msg.confirmed_size}")
     print(f"           confirmed_time : {msg.confirmed_time}")
@@ -359,19 +306,14 @@ async def connect_to_rithmic(uri, ssl_context):
 
 #   ===========================================================================
 #   This routine sends a heartbeat request.  It does not do anything about
-#   reading the heartbeat response (see consume() for reading).
-
-async def send_heartbeat(ws):
-    rq = request_heartbeat_pb2.RequestHeartbeat()
-
-    rq.template_id = 18
+#   reading the heartbeat response (see consume() for reading).  The request
+#   never changes, so it is serialized once and the same bytes are sent
+#   every time.
 
-    serialized = rq.SerializeToString()
+heartbeat_request = RequestTemplate(18)
 
-    buf  = bytearray()
-    buf  = serialized
-
-    await ws.send(buf)
+async def send_heartbeat(ws):
+    await ws.send(heartbeat_request.encode())
     print(f"sent heartbeat request")
 
 #   ===========================================================================
@@ -386,7 +328,7 @@ async def list_systems(ws):
     rq.user_msg.append("hello");
     rq.user_msg.append("world");
 
-    serialized = rq.SerializeToString()
+    serialized = codec.encode(rq)
 
     buf  = bytearray()
     buf  = serialized
@@ -397,8 +339,7 @@ async def list_systems(ws):
     rp_buf = bytearray()
     rp_buf = await ws.recv()
 
-    rp = response_rithmic_system_info_pb2.ResponseRithmicSystemInfo()
-    rp.ParseFromString(rp_buf[0:])
+    rp = codec.decode(response_rithmic_system_info_pb2.ResponseRithmicSystemInfo, rp_buf)
 
     # an rp code of "0" indicates that the request was completed successfully
     if rp.rp_code[0] == "0":
@@ -414,83 +355,71 @@ async def list_systems(ws):
         print(f" system_name : {rp.system_name}")
 
 #   ===========================================================================
-#   This routine reads data off the wire, occassionally sending heartbeats if
-#   there is no traffic.  It will exit after receiving max_num_messages.
+#   consume() routes messages through this table instead of an if/elif
+#   chain.  The dispatcher parses a message once, into the class registered
+#   for its template, and only when there is a handler for it.  The handlers
+#   are done with a message once they return, so one message per class is
+#   reused rather than allocating one per frame.
+#
+#   The order notifications are published on an event bus, so application
+#   code can subscribe its own handlers to them, narrowed to an account,
+#   symbol or basket_id if it likes, next to the ones printing them here.
+#   events.stats() shows how long each handler takes.
+
+msg_types = {13  : "logout response",
+             19  : "heartbeat response",
+             101 : "market data update response",
+             150 : "last_trade",
+             151 : "best_bid_offer",
+             309 : "response_subscribe_for_order_updates",
+             313 : "response_new_order",
+             351 : "rithmic_order_notification",
+             352 : "exchange_order_notification"}
+
+events = EventBus(slow=0.010)
+events.subscribe(351, rithmic_order_notification_cb)
+events.subscribe(351, order_complete_cb)
+events.subscribe(352, exchange_order_notification_cb)
+
+dispatcher = Dispatcher(reuse=message_pool.REUSE)
+dispatcher.register_template(351, events.publish_async)
+dispatcher.register_template(352, events.publish_async)
+
+#   ===========================================================================
+#   This routine reads data off the wire through the connection's reader
+#   task, which routes each msg to the stream below by template id.  It will
+#   exit after receiving max_num_messages.
+
+async def consume(reader):
+    ws = reader.ws
 
-async def consume(ws):
     # send a heartbeat immediately, just in case
     await send_heartbeat(ws)
 
     max_num_msgs = 20
     num_msgs = 0
 
-    # After 100 messages are read, this routine will exit
-    while num_msgs < max_num_msgs and g_order_is_complete == False:
-        msg_buf = bytearray()
-
-        waiting_for_msg = True
-        
-        while waiting_for_msg:
-            try:
-                print(f"waiting for msg ...")
-                msg_buf = await asyncio.wait_for(ws.recv(), timeout=5)
-                waiting_for_msg = False
-            except asyncio.TimeoutError:
-                if ws.open:
-                    print(f"sending heartbeat ...")
-                    await send_heartbeat(ws)
-                else:
-                    print(f"connection appears to be closed.  exiting consume()")
-                    return;
-
-        num_msgs += 1
-
-        print(f"received msg {num_msgs} of {max_num_msgs}")
-
-        # parse into base class just to get a template id
-        base = base_pb2.Base()
-        base.ParseFromString(msg_buf[0:])
-
-        # route msg based on template id
-        if base.template_id == 13:
-            msg_type = "logout response"
-            print(f" consumed msg : {msg_type} ({base.template_id})")
-            
-        elif base.template_id == 19:
-            msg_type = "heartbeat response"
-            print(f" consumed msg : {msg_type} ({base.template_id})")
-            
-        elif base.template_id == 101:
-            msg_type = "market data update response"
-            print(f" consumed msg : {msg_type} ({base.template_id})")
-
-        elif base.template_id == 150: # last_trade
-            msg_type = "last_trade"
-            print(f" consumed msg : {msg_type} ({base.template_id})")
-            
-        elif base.template_id == 151: # best_bid_offer
-            msg_type = "best_bid_offer"
-            print(f" consumed msg : {msg_type} ({base.template_id})")
-            
-        elif base.template_id == 309: # response to subscribe_for_order_updates
-            msg_type = "response_subscribe_for_order_updates"
-            print(f" consumed msg : {msg_type} ({base.template_id})")
-
-        elif base.template_id == 313: # response to new_order
-            msg_type = "response_new_order"
-            print(f" consumed msg : {msg_type} ({base.template_id})")
-
-        elif base.template_id == 351: # rithmic_order_notification
-            msg_type = "rithmic_order_notification"
-            print(f" consumed msg : {msg_type} ({base.template_id})")
-
-            await rithmic_order_notification_cb(msg_buf)
-
-        elif base.template_id == 352: # exchange_order_notification
-            msg_type = "exchange_order_notification"
-            print(f" consumed msg : {msg_type} ({base.template_id})")
-
-            await exchange_order_notification_cb(msg_buf)
+    stream    = reader.stream()
+
+    try:
+        # After <max_num_msgs> messages are read, this routine will exit
+        async for template_id, msg_buf in stream:
+            num_msgs += 1
+
+            print(f"received msg {num_msgs} of {max_num_msgs}")
+
+            # route msg based on template id
+            msg_type = msg_types.get(template_id)
+            if msg_type is not None:
+                print(f" consumed msg : {msg_type} ({template_id})")
+            await dispatcher.dispatch_async(template_id, msg_buf)
+
+            if num_msgs >= max_num_msgs or g_order_is_complete == True:
+                break
+        else:
+            print(f"connection appears to be closed.  exiting consume()")
+    finally:
+        stream.close()
 
     if g_order_is_complete == True:
         print(f"order is complete ...")
@@ -514,7 +443,7 @@ async def rithmic_login(ws, system_name, infra_type, user_id, password):
     rq.system_name = system_name
     rq.infra_type  = infra_type
 
-    serialized = rq.SerializeToString()
+    serialized = codec.encode(rq)
 
     buf  = bytearray()
     buf  = serialized
@@ -524,8 +453,7 @@ async def rithmic_login(ws, system_name, infra_type, user_id, password):
     rp_buf = bytearray()
     rp_buf = await ws.recv()
 
-    rp = response_login_pb2.ResponseLogin()
-    rp.ParseFromString(rp_buf[0:])
+    rp = codec.decode(response_login_pb2.ResponseLogin, rp_buf)
 
     print(f"")
     print(f"      ResponseLogin :")
@@ -542,34 +470,35 @@ async def rithmic_login(ws, system_name, infra_type, user_id, password):
     print(f"     unique_user_id : {rp.unique_user_id}")
     print(f"")
 
+    return rp
+
+#   ===========================================================================
+#   ResponseLoginInfo.user_type, for printing
+
+USER_TYPES = {0 : 'ADMIN',
+              1 : 'FCM',
+              2 : 'IB',
+              3 : 'TRADER'}
+
 #   ===========================================================================
 #   This routine retrieves additional info about the currently logged in user.
-#   It will also wait for the (login info) response.
+#   It will also wait for the (login info) response, then fetch the account
+#   list and the trade routes concurrently over the same connection.  The
+#   router matches each response to its request by the user_msg it carries.
 
-async def login_info(ws):
+async def login_info(router):
+    global g_rcvd_trade_route
+    global g_trade_route
 
     rq = request_login_info_pb2.RequestLoginInfo()
 
     rq.template_id = 300;
     rq.user_msg.append("hello")
 
-    serialized = rq.SerializeToString()
-
-    buf  = bytearray()
-    buf  = serialized
-
-    await ws.send(buf)
-
-    rp_buf = bytearray()
-    rp_buf = await ws.recv()
-
-    rp = response_login_info_pb2.ResponseLoginInfo()
-    rp.ParseFromString(rp_buf[0:])
-
-    user_type_to_string = {0:'ADMIN',
-                           1:'FCM',
-                           2:'IB',
-                           3:'TRADER'}
+    responses = await router.request(rq,
+                                     response_login_info_pb2.ResponseLoginInfo,
+                                     check=False)
+    rp = responses[-1]
 
     print(f"")
     print(f" ResponseLoginInfo :")
@@ -581,22 +510,30 @@ async def login_info(ws):
     print(f"            ib_id  : {rp.ib_id}")
     print(f"        first_name : {rp.first_name}")
     print(f"         last_name : {rp.last_name}")
-    print(f"         user_type : {rp.user_type} ({user_type_to_string[rp.user_type]})")
+    print(f"         user_type : {rp.user_type} ({USER_TYPES.get(rp.user_type, rp.user_type)})")
     print(f"")
 
     if rp.rp_code[0] == '0':
-        print(f"retrieving account list ...")
-        await list_accounts(ws, rp.fcm_id, rp.ib_id, rp.user_type)
-
-        print(f"retrieving trade routes ...")
-        await list_trade_routes(ws)
+        print(f"retrieving account list and trade routes ...")
+        accounts, trade_routes = await asyncio.gather(list_accounts(router, rp.fcm_id, rp.ib_id, rp.user_type),
+                                                      list_trade_routes(router))
+
+        # store the first applicable trade route we got.  This is done once
+        # both lists are in, since the route has to match the chosen account.
+        for route in trade_routes:
+            if g_rcvd_trade_route == False and \
+               g_fcm_id   == route.fcm_id  and \
+               g_ib_id    == route.ib_id   and \
+               g_exchange == route.exchange:
+                g_trade_route      = route.trade_route
+                g_rcvd_trade_route = True
 
 #   ===========================================================================
 #   This routine retrieves the list of accounts that the currently logged in
 #   user has permission to trade on.  It will also wait for the associated
-#   response.
+#   responses, and returns the ones that carry an account.
 
-async def list_accounts(ws, fcm_id, ib_id, user_type):
+async def list_accounts(router, fcm_id, ib_id, user_type):
     global g_rcvd_account
     global g_fcm_id
     global g_ib_id
@@ -610,23 +547,30 @@ async def list_accounts(ws, fcm_id, ib_id, user_type):
     rq.ib_id       = ib_id
     rq.user_type   = user_type
 
-    serialized = rq.SerializeToString()
-
-    buf  = bytearray()
-    buf  = serialized
-
-    rp_is_done = False
-
-    await ws.send(buf)
-
-    rp_buf = bytearray()
-    
-    while rp_is_done == False:
-        rp_buf = await ws.recv()
-
-        rp = response_account_list_pb2.ResponseAccountList()
-        rp.ParseFromString(rp_buf[0:])
-
+    # How to determine when the response is done :
+    # --------------------------------------------
+    # There can be many messages returned when requesting accounts.  The first
+    # <N> messages will return actual accounts, and the last message will have
+    # an rp_code indicating any error condition.  This non-empty rp_code also
+    # indicates that all the responses to the account list request are now done.
+    #
+    # When receiving the <N> responses, the rq_handler_rp_code
+    # will not be empty, and contain "0" when the request is being processed
+    # without error.  The rp_code on these same messages
+    # will be empty.  When receiving the last message, sometimes called the
+    # end-of-response message, the rq_handler_rp_code will be empty, and the
+    # rp_code will contain any error code.  A value of "0" in rp_code indicates
+    # there there was no error.
+    #
+    # This pattern of a request having <N> + 1 response msgs appears often in
+    # the RProtocolAPI, and is handled by router.request().
+
+    responses = await router.request(rq,
+                                     response_account_list_pb2.ResponseAccountList,
+                                     check=False)
+    accounts = []
+
+    for rp in responses:
         print(f"")
         print(f" ResponseAccountList :")
         print(f" =====================")
@@ -640,73 +584,40 @@ async def list_accounts(ws, fcm_id, ib_id, user_type):
         print(f"        account_name : {rp.account_name}")
         print(f"")
 
-        # store the first acount we get for placing the order
-        if g_rcvd_account == False         and \
-           len(rp.rq_handler_rp_code) > 0  and \
+        if len(rp.rq_handler_rp_code) > 0  and \
            rp.rq_handler_rp_code[0] == "0" and \
            len(rp.fcm_id) > 0              and \
            len(rp.ib_id) > 0               and \
            len(rp.account_id) > 0:
-            g_fcm_id       = rp.fcm_id
-            g_ib_id        = rp.ib_id
-            g_account_id   = rp.account_id
-            g_rcvd_account = True
-
-        # How to determine when the response is done :
-        # --------------------------------------------
-        # There can be many messages returned when requesting accounts.  The first
-        # <N> messages will return actual accounts, and the last message will have
-        # an rp_code indicating any error condition.  This non-empty rp_code also
-        # indicates that all the responses to the account list request are now done.
-        #
-        # When receiving the <N> responses, the rq_handler_rp_code
-        # will not be empty, and contain "0" when the request is being processed
-        # without error.  The rp_code on these same messages
-        # will be empty.  When receiving the last message, sometimes called the
-        # end-of-response message, the rq_handler_rp_code will be empty, and the
-        # rp_code will contain any error code.  A value of "0" in rp_code indicates
-        # there there was no error.
-        #
-        # This pattern of a request having <N> + 1 response msgs appears often in
-        # the RProtocolAPI.
-    
-        if len(rp.rp_code) > 0:
-            rp_is_done = True
+            accounts.append(rp)
+
+    # store the first acount we get for placing the order
+    if g_rcvd_account == False and len(accounts) > 0:
+        g_fcm_id       = accounts[0].fcm_id
+        g_ib_id        = accounts[0].ib_id
+        g_account_id   = accounts[0].account_id
+        g_rcvd_account = True
+
+    return accounts
 
 #   ===========================================================================
 #   This routine retrieves the list of trade routes from the order plant.  It
-#   will also wait for the associated response.
-
-async def list_trade_routes(ws):
-    global g_rcvd_trade_route
-    global g_trade_route
-    global g_exchange
-    global g_fcm_id
-    global g_ib_id
+#   will also wait for the associated responses, and returns the ones that
+#   carry a trade route.
 
+async def list_trade_routes(router):
     rq = request_trade_routes_pb2.RequestTradeRoutes()
 
     rq.template_id = 310;
     rq.user_msg.append("hello")
     rq.subscribe_for_updates = False
 
-    serialized = rq.SerializeToString()
-
-    buf  = bytearray()
-    buf  = serialized
-
-    rp_is_done = False
-
-    await ws.send(buf)
-
-    rp_buf = bytearray()
-    
-    while rp_is_done == False:
-        rp_buf = await ws.recv()
-
-        rp = response_trade_routes_pb2.ResponseTradeRoutes()
-        rp.ParseFromString(rp_buf[0:])
+    responses = await router.request(rq,
+                                     response_trade_routes_pb2.ResponseTradeRoutes,
+                                     check=False)
+    trade_routes = []
 
+    for rp in responses:
         print(f"")
         print(f" ResponseTradeRoutes :")
         print(f" =====================")
@@ -722,25 +633,19 @@ async def list_trade_routes(ws):
         print(f"          is_default : {rp.is_default}")
         print(f"")
 
-        # store the first applicable trade route we get
-        if g_rcvd_trade_route == False     and \
-           len(rp.rq_handler_rp_code) > 0  and \
-           rp.rq_handler_rp_code[0] == "0" and \
-           g_fcm_id   == rp.fcm_id         and \
-           g_ib_id    == rp.ib_id          and \
-           g_exchange == rp.exchange:
-            g_trade_route      = rp.trade_route
-            g_rcvd_trade_route = True
+        if len(rp.rq_handler_rp_code) > 0 and \
+           rp.rq_handler_rp_code[0] == "0":
+            trade_routes.append(rp)
 
-        if len(rp.rp_code) > 0:
-            rp_is_done = True
+    return trade_routes
 
 #   ===========================================================================
 #   This routine subscribes for updates on any orders on the specified fcm, ib
-#   and account.  Any received messages from this subscription request
-#   are handled elsewhere (see the consume() routine)
+#   and account, and waits for the subscription to be acknowledged.  Any
+#   received messages from this subscription are handled elsewhere (see the
+#   consume() routine)
 
-async def subscribe_for_order_updates(ws, fcm_id, ib_id, account_id):
+async def subscribe_for_order_updates(router, fcm_id, ib_id, account_id):
 
     rq = request_subscribe_for_order_updates_pb2.RequestSubscribeForOrderUpdates()
 
@@ -751,50 +656,48 @@ async def subscribe_for_order_updates(ws, fcm_id, ib_id, account_id):
     rq.ib_id      = ib_id
     rq.account_id = account_id
 
-    serialized = rq.SerializeToString()
-
-    buf  = bytearray()
-    buf  = serialized
+    responses = await router.request(rq,
+                                     response_subscribe_for_order_updates_pb2.ResponseSubscribeForOrderUpdates,
+                                     check=False)
 
-    await ws.send(buf)
+    print(f" subscribe for order updates rp code : {responses[-1].rp_code}")
 
 #   ===========================================================================
 #   This routine submits a request for a new order.  Updates to this order
 #   are received when subscribing to order updates on the specified
 #   fcm/ib/account (see subscribe_order(), above).
+#
+#   Everything but the quantity, price, side and user tag stays the same for
+#   a given account and instrument, so that part of the request is
+#   serialized once, into a template kept in order_requests, and only the
+#   varying fields are encoded for each order.
 
-async def new_order(ws, fcm_id, ib_id, account_id, exchange, symbol, trade_route, side):
-
-    rq = request_new_order_pb2.RequestNewOrder()
+order_requests = RequestTemplateCache()
 
-    rq.template_id      = 312;
-    rq.user_msg.append("hello")
+ORDER_FIELDS = ("user_tag", "quantity", "price", "transaction_type")
 
-    rq.fcm_id     = fcm_id
-    rq.ib_id      = ib_id
-    rq.account_id = account_id
+async def new_order(ws, fcm_id, ib_id, account_id, exchange, symbol, trade_route, side):
 
-    rq.exchange   = exchange
-    rq.symbol     = symbol
+    RequestNewOrder = request_new_order_pb2.RequestNewOrder
 
-    rq.quantity   = 1
+    rq = order_requests.get(312, ORDER_FIELDS,
+                            user_msg       = ["hello"],
+                            fcm_id         = fcm_id,
+                            ib_id          = ib_id,
+                            account_id     = account_id,
+                            exchange       = exchange,
+                            symbol         = symbol,
+                            duration       = RequestNewOrder.Duration.DAY,
+                            price_type     = RequestNewOrder.PriceType.MARKET,
+                            trade_route    = trade_route,
+                            manual_or_auto = RequestNewOrder.OrderPlacement.MANUAL)
 
     if side == "B" or side == "b":
-        rq.transaction_type = request_new_order_pb2.RequestNewOrder.TransactionType.BUY
+        transaction_type = RequestNewOrder.TransactionType.BUY
     else:
-        rq.transaction_type = request_new_order_pb2.RequestNewOrder.TransactionType.SELL
-    rq.duration         = request_new_order_pb2.RequestNewOrder.Duration.DAY
-    rq.price_type       = request_new_order_pb2.RequestNewOrder.PriceType.MARKET
-    rq.manual_or_auto   = request_new_order_pb2.RequestNewOrder.OrderPlacement.MANUAL
+        transaction_type = RequestNewOrder.TransactionType.SELL
 
-    rq.trade_route = trade_route
-
-    serialized = rq.SerializeToString()
-
-    buf  = bytearray()
-    buf  = serialized
-
-    await ws.send(buf)
+    await ws.send(rq.encode(quantity = 1, transaction_type = transaction_type))
 
 #   ===========================================================================
 #   This routine sends a logout request.  It does not wait for a response.
@@ -805,7 +708,7 @@ async def rithmic_logout(ws):
     rq.template_id      = 12;
     rq.user_msg.append("hello")
 
-    serialized = rq.SerializeToString()
+    serialized = codec.encode(rq)
 
     buf = bytearray()
     buf = serialized
@@ -821,81 +724,89 @@ async def disconnect_from_rithmic(ws):
 
 #   ===========================================================================
 
-loop = asyncio.get_event_loop()
+if __name__ == "__main__":
+    loop = asyncio.get_event_loop()
 
-num_args = len(sys.argv)
+    num_args = len(sys.argv)
 
-if num_args == 2 or num_args == 8:
-    uri = sys.argv[1]
+    if num_args == 2 or num_args == 8:
+        uri = sys.argv[1]
 
-    # check if we should use ssl/tls
-    ssl_context = None
-    if "wss://" in uri:
-        # Set up the ssl context.  One can also use an alternate SSL/TLS cert file
-        # or database
-        ssl_context   = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-        localhost_pem = pathlib.Path(__file__).with_name("rithmic_ssl_cert_auth_params")
-        ssl_context.load_verify_locations(localhost_pem)
+        # check if we should use ssl/tls
+        ssl_context = None
+        if "wss://" in uri:
+            # Use the shared ssl context.  One can also pass an alternate
+            # SSL/TLS cert file to tls.client_context()
+            ssl_context = tls.client_context()
 
-    ws = loop.run_until_complete(connect_to_rithmic(uri, ssl_context))
+        ws = loop.run_until_complete(connect_to_rithmic(uri, ssl_context))
     
-    if num_args == 2:
-        loop.run_until_complete(list_systems(ws))
-    elif num_args == 8:
-        system_name = sys.argv[2]
-        user_id     = sys.argv[3]
-        password    = sys.argv[4]
-        g_exchange  = sys.argv[5]
-        g_symbol    = sys.argv[6]
-        g_side      = sys.argv[7]
-
-        loop.run_until_complete(rithmic_login(ws,
-                                              system_name,
-                                              request_login_pb2.RequestLogin.SysInfraType.ORDER_PLANT,
-                                              user_id,
-                                              password))
-
-        loop.run_until_complete(login_info(ws))
-
-        print(f"")
-        print(f"     g_rcvd_account : {g_rcvd_account}")
-        print(f"           g_fcm_id : {g_fcm_id}")
-        print(f"            g_ib_id : {g_ib_id}")
-        print(f"       g_account_id : {g_account_id}")
-        print(f"")
-        print(f"         g_exchange : {g_exchange}")
-        print(f"           g_symbol : {g_symbol}")
-        print(f"")
-        print(f" g_rcvd_trade_route : {g_rcvd_trade_route}")
-        print(f"      g_trade_route : {g_trade_route}")
-        print(f"")
-
-        if g_rcvd_account and g_rcvd_trade_route:
-            loop.run_until_complete(subscribe_for_order_updates(ws,          \
-                                                                g_fcm_id,    \
-                                                                g_ib_id,     \
-                                                                g_account_id))
-            loop.run_until_complete(new_order(ws,           \
-                                              g_fcm_id,     \
-                                              g_ib_id,      \
-                                              g_account_id, \
-                                              g_exchange,   \
-                                              g_symbol,     \
-                                              g_trade_route,\
-                                              g_side))
-
-            loop.run_until_complete(consume(ws))
-
-        if ws.open:
-            print(f"logging out ...")
-            loop.run_until_complete(rithmic_logout(ws))
-            print(f"disconnecting ...")
-            loop.run_until_complete(disconnect_from_rithmic(ws))
-            print(f"done!")
-        else:
-            print(f"connection appears to be closed.  exiting app.")
-else:
-    print(f"{USAGE}")
-    print(f"{USAGE_2}")
+        if num_args == 2:
+            loop.run_until_complete(list_systems(ws))
+        elif num_args == 8:
+            system_name = sys.argv[2]
+            user_id     = sys.argv[3]
+            password    = sys.argv[4]
+            g_exchange  = sys.argv[5]
+            g_symbol    = sys.argv[6]
+            g_side      = sys.argv[7]
+
+            login_rp = loop.run_until_complete(rithmic_login(ws,
+                                                             system_name,
+                                                             request_login_pb2.RequestLogin.SysInfraType.ORDER_PLANT,
+                                                             user_id,
+                                                             password))
+
+            # from here on a single reader task owns the socket, the router
+            # pairs each request with its responses, and the heartbeat
+            # scheduler keeps the session alive
+            reader    = MessageReader(ws).start()
+            router    = RequestRouter(reader)
+            heartbeat = HeartbeatScheduler(ws.send, reader, login_rp.heartbeat_interval).start()
+
+            loop.run_until_complete(login_info(router))
+
+            print(f"")
+            print(f"     g_rcvd_account : {g_rcvd_account}")
+            print(f"           g_fcm_id : {g_fcm_id}")
+            print(f"            g_ib_id : {g_ib_id}")
+            print(f"       g_account_id : {g_account_id}")
+            print(f"")
+            print(f"         g_exchange : {g_exchange}")
+            print(f"           g_symbol : {g_symbol}")
+            print(f"")
+            print(f" g_rcvd_trade_route : {g_rcvd_trade_route}")
+            print(f"      g_trade_route : {g_trade_route}")
+            print(f"")
+
+            if g_rcvd_account and g_rcvd_trade_route:
+                loop.run_until_complete(subscribe_for_order_updates(router,      \
+                                                                    g_fcm_id,    \
+                                                                    g_ib_id,     \
+                                                                    g_account_id))
+                loop.run_until_complete(new_order(ws,           \
+                                                  g_fcm_id,     \
+                                                  g_ib_id,      \
+                                                  g_account_id, \
+                                                  g_exchange,   \
+                                                  g_symbol,     \
+                                                  g_trade_route,\
+                                                  g_side))
+
+                loop.run_until_complete(consume(reader))
+
+            heartbeat.stop()
+
+            if ws.open:
+                print(f"logging out ...")
+                loop.run_until_complete(rithmic_logout(ws))
+                print(f"disconnecting ...")
+                loop.run_until_complete(disconnect_from_rithmic(ws))
+                print(f"done!")
+            else:
+                print(f"connection appears to be closed.  exiting app.")
+    else:
+        print(f"{USAGE}")
+        print(f"{USAGE_2}")
 
-#   ===========================================================================
+    #   ===========================================================================
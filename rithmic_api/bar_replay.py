@@ -0,0 +1,182 @@
+#   ===========================================================================
+#   Tick bar replays decoded off the event loop.  A RequestTickBarReplay can
+#   be answered with up to 100000 ResponseTickBarReplay frames; parsing and
+#   handling each one on the loop stalls every other consumer of the
+#   connection for as long as the replay lasts.  A TickBarReplayDecoder only
+#   collects the raw frames on the loop and ships them in batches to a
+#   process pool, where they are decoded into a NumPy structured array, one
+#   row per bar; the loop just concatenates the packed arrays it gets back.
+#
+#   NumPy is only needed by this module; importing it without NumPy raises
+#   ImportError when a decoder is created.
+
+import asyncio
+import concurrent.futures
+import logging
+
+from rithmic_api import codec, templates, wire
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+TICK_BAR_REPLAY = 207
+
+BAR_DTYPE = [("type", "i1"), ("sub_type", "i1"), ("num_trades", "<u8"), ("volume", "<u8"),
+             ("bid_volume", "<u8"), ("ask_volume", "<u8"), ("open_price", "<f8"), ("close_price", "<f8"),
+             ("high_price", "<f8"), ("low_price", "<f8"), ("ssboe", "<i4"), ("usecs", "<i4")]
+
+# ResponseTickBarReplay.rp_code, only set on the end-of-response frame
+_RP_CODE = 132766
+_RP_CODE_TAG = wire.encode_tag(_RP_CODE, wire.WIRETYPE_LENGTH_DELIMITED)
+
+
+def is_end_of_response(msg_buf):
+    """True for the last frame of a replay, the one carrying rp_code.
+
+    A bar almost never contains the bytes of the rp_code tag at all, so
+    the tags are only walked, to rule out a match inside a value, when it
+    does.
+    """
+    if _RP_CODE_TAG not in msg_buf:
+        return False
+    pos = 0
+    end = len(msg_buf)
+    while pos < end:
+        tag, pos = wire.read_varint(msg_buf, pos)
+        field_number = tag >> 3
+        if field_number == _RP_CODE:
+            return True
+        if field_number > _RP_CODE:
+            return False
+        pos = wire.skip_field(msg_buf, pos, tag & 7)
+    return False
+
+
+def decode_bars(frames):
+    """Decode ResponseTickBarReplay frames into a BAR_DTYPE array.
+
+    Runs in the worker processes, so it must stay a module-level function.
+    """
+    message_class = templates.message_class(TICK_BAR_REPLAY)
+    bars = np.zeros(len(frames), dtype=BAR_DTYPE)
+    rows = []
+    for msg_buf in frames:
+        msg = codec.decode(message_class, msg_buf)
+        rows.append((msg.type, msg.sub_type, msg.num_trades, msg.volume, msg.bid_volume, msg.ask_volume,
+                     msg.open_price, msg.close_price, msg.high_price, msg.low_price,
+                     msg.data_bar_ssboe[0] if msg.data_bar_ssboe else 0,
+                     msg.data_bar_usecs[0] if msg.data_bar_usecs else 0))
+    if rows:
+        bars[:] = rows
+    return bars
+
+
+class TickBarReplayDecoder:
+    """Collects the frames of one tick bar replay and decodes them in a pool.
+
+    Frames are fed with add(), or straight from a MessageReader after
+    attach(reader).  Every batch_size bars are sent to the executor as one
+    job; the end-of-response frame flushes the rest, and result() returns
+    every bar, in order, once all jobs are done.
+
+    executor defaults to a ProcessPoolExecutor of workers processes that is
+    shut down by close().  workers=0 decodes each batch on the loop instead,
+    for platforms where a process pool is not an option.
+    """
+
+    def __init__(self, batch_size=5000, executor=None, workers=None):
+        if np is None:
+            raise ImportError("TickBarReplayDecoder requires numpy")
+        self.batch_size = batch_size
+        self.workers = workers
+        self.end = None
+        self.bars = 0
+        self.batches = 0
+        self.malformed = 0
+
+        self._executor = executor
+        self._own_executor = False
+        self._pending = []
+        self._jobs = []
+        self._done = asyncio.Event()
+        self._reader = None
+
+    def add(self, template_id, msg_buf):
+        """Queue a raw ResponseTickBarReplay frame."""
+        if template_id != TICK_BAR_REPLAY or self._done.is_set():
+            return
+        try:
+            end = is_end_of_response(msg_buf)
+        except wire.WireError as e:
+            self.malformed += 1
+            logger.warning("Dropping malformed frame: %s", e)
+            return
+        if end:
+            self.end = codec.decode(templates.message_class(TICK_BAR_REPLAY), msg_buf)
+            self._submit()
+            self._done.set()
+            return
+        self._pending.append(msg_buf)
+        if len(self._pending) >= self.batch_size:
+            self._submit()
+
+    async def result(self):
+        """Wait for the end of the replay; returns every bar as one array."""
+        await self._done.wait()
+        arrays = await asyncio.gather(*self._jobs)
+        if not arrays:
+            return np.zeros(0, dtype=BAR_DTYPE)
+        return np.concatenate(arrays)
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def attach(self, reader):
+        """Feed this decoder from reader's callbacks."""
+        self._reader = reader
+        reader.add_callback(TICK_BAR_REPLAY, self.add)
+        return self
+
+    def detach(self):
+        if self._reader is not None:
+            self._reader.remove_callback(TICK_BAR_REPLAY, self.add)
+            self._reader = None
+
+    def close(self):
+        """Detach, and shut down the executor if this decoder created it."""
+        self.detach()
+        if self._own_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._own_executor = False
+
+    def stats(self):
+        return {
+            "bars": self.bars,
+            "batches": self.batches,
+            "pending": len(self._pending),
+            "malformed": self.malformed,
+            "done": self.done,
+        }
+
+    def _submit(self):
+        if not self._pending:
+            return
+        frames, self._pending = self._pending, []
+        self.bars += len(frames)
+        self.batches += 1
+        loop = asyncio.get_running_loop()
+        if self.workers == 0:
+            job = loop.create_future()
+            job.set_result(decode_bars(frames))
+        else:
+            if self._executor is None:
+                self._executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+                self._own_executor = True
+            job = loop.run_in_executor(self._executor, decode_bars, frames)
+        self._jobs.append(job)
@@ -0,0 +1,201 @@
+#   ===========================================================================
+#   Columnar batch decoding of market data.  A MarketDataBatcher collects raw
+#   LastTrade and BestBidOffer frames and, once it holds capacity of them or
+#   the oldest has waited interval seconds, decodes them all into
+#   preallocated NumPy structured arrays, so analytics code gets contiguous
+#   price/size/time columns instead of one Python object per message.
+#
+#   NumPy is only needed by this module; importing it without NumPy raises
+#   ImportError when a batcher is created.
+
+import asyncio
+import logging
+import time
+
+from rithmic_api import decoders, wire
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+LAST_TRADE = 150
+BEST_BID_OFFER = 151
+
+TRADE_DTYPE = [("price", "<f8"), ("size", "<i4"), ("aggressor", "i1"), ("presence_bits", "<u4"),
+               ("ssboe", "<i4"), ("usecs", "<i4"), ("symbol_id", "<i4")]
+QUOTE_DTYPE = [("bid_price", "<f8"), ("bid_size", "<i4"), ("ask_price", "<f8"), ("ask_size", "<i4"),
+               ("presence_bits", "<u4"), ("ssboe", "<i4"), ("usecs", "<i4"), ("symbol_id", "<i4")]
+
+# symbol and exchange first, then the columns in dtype order, less symbol_id
+_TRADE_DECODER = decoders.FieldDecoder(LAST_TRADE, ("symbol", "exchange", "trade_price", "trade_size",
+                                                   "aggressor", "presence_bits", "ssboe", "usecs"))
+_QUOTE_DECODER = decoders.FieldDecoder(BEST_BID_OFFER, ("symbol", "exchange", "bid_price", "bid_size",
+                                                      "ask_price", "ask_size", "presence_bits", "ssboe", "usecs"))
+
+
+class SymbolTable:
+    """Assigns small integer ids to (exchange, symbol) pairs, in order of arrival."""
+
+    def __init__(self):
+        self.keys = []
+        self._ids = {}
+
+    def id(self, exchange, symbol):
+        key = (exchange, symbol)
+        symbol_id = self._ids.get(key)
+        if symbol_id is None:
+            symbol_id = self._ids[key] = len(self.keys)
+            self.keys.append(key)
+        return symbol_id
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, symbol_id):
+        return self.keys[symbol_id]
+
+
+class MarketDataBatcher:
+    """Accumulates trade and quote frames and decodes them a batch at a time.
+
+    Frames are fed with add(), or straight from a MessageReader after
+    attach(reader).  A batch is flushed when capacity frames are pending,
+    when the oldest pending frame is interval seconds old, or on flush();
+    on_flush(batch) is then called with a Batch holding the trades and
+    quotes arrays and the symbol table their symbol_id columns refer to.
+
+    The arrays are views of buffers reused by the next flush, so a
+    consumer that keeps them past on_flush() must copy them, or the
+    batcher can be created with copy=True.
+    """
+
+    def __init__(self, capacity=1024, interval=1.0, on_flush=None, copy=False):
+        if np is None:
+            raise ImportError("MarketDataBatcher requires numpy")
+        self.capacity = capacity
+        self.interval = interval
+        self.on_flush = on_flush
+        self.copy = copy
+        self.symbols = SymbolTable()
+
+        self.flushes = 0
+        self.trades = 0
+        self.quotes = 0
+        self.malformed = 0
+
+        self._trades = np.zeros(capacity, dtype=TRADE_DTYPE)
+        self._quotes = np.zeros(capacity, dtype=QUOTE_DTYPE)
+        self._pending = {LAST_TRADE: [], BEST_BID_OFFER: []}
+        self._num_pending = 0
+        self._first_at = None
+        self._reader = None
+        self._timer = None
+
+    def add(self, template_id, msg_buf):
+        """Queue a raw frame; returns the flushed Batch if this filled one."""
+        pending = self._pending.get(template_id)
+        if pending is None:
+            return None
+        if self._first_at is None:
+            self._first_at = time.monotonic()
+        pending.append(msg_buf)
+        self._num_pending += 1
+        if self._num_pending >= self.capacity or time.monotonic() - self._first_at >= self.interval:
+            return self.flush()
+        return None
+
+    def flush(self):
+        """Decode every pending frame; returns the Batch, or None if there were none."""
+        if not self._num_pending:
+            return None
+        trades = self._fill(self._trades, _TRADE_DECODER, self._pending[LAST_TRADE])
+        quotes = self._fill(self._quotes, _QUOTE_DECODER, self._pending[BEST_BID_OFFER])
+        self._pending = {LAST_TRADE: [], BEST_BID_OFFER: []}
+        self._num_pending = 0
+        self._first_at = None
+
+        if self.copy:
+            trades = trades.copy()
+            quotes = quotes.copy()
+        self.flushes += 1
+        self.trades += len(trades)
+        self.quotes += len(quotes)
+        batch = Batch(trades, quotes, self.symbols)
+        if self.on_flush is not None:
+            try:
+                self.on_flush(batch)
+            except Exception:
+                logger.exception("Batch flush handler failed")
+        return batch
+
+    def attach(self, reader):
+        """Feed this batcher from reader's callbacks, flushing on a timer too."""
+        self._reader = reader
+        reader.add_callback(LAST_TRADE, self.add)
+        reader.add_callback(BEST_BID_OFFER, self.add)
+        self._timer = asyncio.get_running_loop().call_later(self.interval, self._on_timer)
+        return self
+
+    def detach(self):
+        """Stop feeding from the attached reader and flush what is pending."""
+        if self._reader is not None:
+            self._reader.remove_callback(LAST_TRADE, self.add)
+            self._reader.remove_callback(BEST_BID_OFFER, self.add)
+            self._reader = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return self.flush()
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "pending": self._num_pending,
+            "flushes": self.flushes,
+            "trades": self.trades,
+            "quotes": self.quotes,
+            "malformed": self.malformed,
+            "symbols": len(self.symbols),
+        }
+
+    def _fill(self, array, decoder, frames):
+        symbol_id = self.symbols.id
+        rows = []
+        for msg_buf in frames:
+            try:
+                record = decoder.decode(msg_buf)
+            except wire.WireError as e:
+                self.malformed += 1
+                logger.warning("Dropping malformed frame: %s", e)
+                continue
+            rows.append(record[2:] + (symbol_id(record[1], record[0]),))
+        view = array[:len(rows)]
+        if rows:
+            view[:] = rows
+        return view
+
+    def _on_timer(self):
+        if self._first_at is not None and time.monotonic() - self._first_at >= self.interval:
+            self.flush()
+        if self._reader is not None:
+            delay = self.interval
+            if self._first_at is not None:
+                delay = max(0.0, self._first_at + self.interval - time.monotonic())
+            self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+
+class Batch:
+    """One flush: trades and quotes as structured arrays, plus the symbol table."""
+
+    __slots__ = ("trades", "quotes", "symbols")
+
+    def __init__(self, trades, quotes, symbols):
+        self.trades = trades
+        self.quotes = quotes
+        self.symbols = symbols
+
+    def __len__(self):
+        return len(self.trades) + len(self.quotes)
@@ -0,0 +1,193 @@
+#   ===========================================================================
+#   Codec backends: every place that serializes a request or parses a
+#   response goes through encode() / decode() here instead of calling
+#   SerializeToString() / ParseFromString() on the generated classes, so
+#   the implementation behind them can be measured and swapped.
+#
+#   generated   the *_pb2 classes in this package, on whatever protobuf
+#               runtime is installed
+#   runtime     message classes rebuilt from the same descriptors by the
+#               installed runtime's message factory; on protobuf >= 4.21
+#               these are upb classes even though the *_pb2 modules were
+#               generated by an old protoc
+#   wire        the hand-written partial decoders in decoders.py for the
+#               market data templates, falling back on another codec for
+#               everything else and for encoding
+#
+#   Messages are always named by their generated class, e.g.
+#   codec.decode(ResponseLogin, buf), whichever backend is in use.
+#
+#   The runtime and wire backends import what they need when created, so
+#   that importing this module stays cheap; see templates.py.
+
+import logging
+import os
+
+from google.protobuf.internal import api_implementation
+
+logger = logging.getLogger(__name__)
+
+
+class ProtobufCodec:
+    """Encodes and decodes with the generated *_pb2 classes."""
+
+    name = "generated"
+
+    def __init__(self):
+        self.runtime = api_implementation.Type()
+
+    def message_class(self, message_class):
+        return message_class
+
+    def encode(self, msg):
+        return msg.SerializeToString()
+
+    def decode(self, message_class, buf):
+        msg = message_class()
+        msg.ParseFromString(buf)
+        return msg
+
+    def decoder(self, message_class):
+        """Return a callable decoding buf into message_class, for hot loops."""
+        message_class = self.message_class(message_class)
+
+        def decode(buf):
+            msg = message_class()
+            msg.ParseFromString(buf)
+            return msg
+        return decode
+
+
+class RuntimeCodec(ProtobufCodec):
+    """Encodes and decodes with classes rebuilt from the generated descriptors.
+
+    The classes live in a private descriptor pool and are built on first
+    use.  Messages created from the generated classes are still accepted
+    by encode(), since both serialize to the same bytes.
+    """
+
+    name = "runtime"
+
+    def __init__(self):
+        super().__init__()
+        from google.protobuf import descriptor_pool, message_factory
+
+        self._pool = descriptor_pool.DescriptorPool()
+        self._factory = message_factory.MessageFactory(self._pool)
+        self._files = set()
+        self._classes = {}
+
+    def message_class(self, message_class):
+        cls = self._classes.get(message_class)
+        if cls is None:
+            descriptor = message_class.DESCRIPTOR
+            if descriptor.file.name not in self._files:
+                from google.protobuf import descriptor_pb2
+
+                file_proto = descriptor_pb2.FileDescriptorProto()
+                descriptor.file.CopyToProto(file_proto)
+                self._pool.Add(file_proto)
+                self._files.add(descriptor.file.name)
+            cls = _message_class(self._factory, self._pool.FindMessageTypeByName(descriptor.full_name))
+            self._classes[message_class] = cls
+        return cls
+
+    def decode(self, message_class, buf):
+        msg = self.message_class(message_class)()
+        msg.ParseFromString(buf)
+        return msg
+
+
+class WireCodec:
+    """Decodes with decoders.FieldDecoder where one exists, else falls back.
+
+    Decoded market data comes back as the decoder's namedtuple rather
+    than a message, with only the fields the decoder reads.
+    """
+
+    name = "wire"
+
+    def __init__(self, fallback=None, field_decoders=None):
+        self.fallback = fallback or ProtobufCodec()
+        self.runtime = self.fallback.runtime
+        if field_decoders is None:
+            from rithmic_api import decoders
+
+            field_decoders = decoders.MARKET_DATA_DECODERS.values()
+        self._decoders = {d.message_class: d for d in field_decoders}
+
+    def message_class(self, message_class):
+        return self.fallback.message_class(message_class)
+
+    def encode(self, msg):
+        return self.fallback.encode(msg)
+
+    def decodes(self, message_class):
+        """True if message_class has its own wire decoder."""
+        return message_class in self._decoders
+
+    def decode(self, message_class, buf):
+        decoder = self._decoders.get(message_class)
+        if decoder is not None:
+            return decoder.decode(buf)
+        return self.fallback.decode(message_class, buf)
+
+    def decoder(self, message_class):
+        decoder = self._decoders.get(message_class)
+        if decoder is not None:
+            return decoder.decode
+        return self.fallback.decoder(message_class)
+
+
+def _message_class(factory, descriptor):
+    from google.protobuf import message_factory
+
+    get_message_class = getattr(message_factory, "GetMessageClass", None)
+    if get_message_class is not None:
+        return get_message_class(descriptor)
+    return factory.GetPrototype(descriptor)
+
+
+#   ===========================================================================
+#   backend registry and the process-wide default
+
+BACKENDS = {
+    ProtobufCodec.name: ProtobufCodec,
+    RuntimeCodec.name: RuntimeCodec,
+    WireCodec.name: WireCodec,
+}
+
+_default = None
+
+
+def get(name=None):
+    """Return a new codec for the named backend, or the default codec."""
+    if name is None:
+        return default()
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"unknown codec {name!r}, expected one of {sorted(BACKENDS)}") from None
+
+
+def default():
+    global _default
+    if _default is None:
+        _default = get(os.environ.get("RITHMIC_CODEC", ProtobufCodec.name))
+        logger.debug("Using %s codec on the %s runtime.", _default.name, _default.runtime)
+    return _default
+
+
+def set_default(codec):
+    """Make codec, or the backend of that name, the process-wide default."""
+    global _default
+    _default = get(codec) if isinstance(codec, str) else codec
+    return _default
+
+
+def encode(msg):
+    return default().encode(msg)
+
+
+def decode(message_class, buf):
+    return default().decode(message_class, buf)
@@ -0,0 +1,106 @@
+import asyncio
+import itertools
+
+from rithmic_api import codec
+
+
+class RequestError(Exception):
+    """Raised when a request's end-of-response message carries an error rp_code."""
+
+    def __init__(self, template_id, rp_code):
+        super().__init__(f"Request (template {template_id}) failed: {list(rp_code)}")
+        self.template_id = template_id
+        self.rp_code = list(rp_code)
+
+
+class _Pending:
+    def __init__(self):
+        self.future = asyncio.get_running_loop().create_future()
+        self.responses = []
+
+
+class RequestRouter:
+    """Matches responses to in-flight requests on one plant connection.
+
+    Each request is tagged with a unique user_msg, which the gateway echoes on
+    every response.  Responses that carry a request_key are also matched on
+    it once the key has been seen alongside the tag.  Requests follow the
+    usual <N> + 1 pattern: responses are collected until one arrives with a
+    non-empty rp_code, and the whole list is returned to the caller.
+    Responses that match no pending request are left to the reader's other
+    consumers, so notifications and heartbeats are never swallowed.
+
+    Requests in flight when the reader loses its connection fail with
+    ConnectionResetError, as do requests made while it is disconnected.
+    """
+
+    def __init__(self, reader, send=None, prefix="rq"):
+        self.reader = reader
+        self._send = send or reader.ws.send
+        self._prefix = prefix
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._request_keys = {}
+        self._response_classes = {}
+        reader.add_disconnect_callback(self._on_disconnect)
+
+    async def request(self, rq, response_class, timeout=None, check=True):
+        """Send rq and return every response to it, end-of-response last.
+
+        The response template_id is taken to be rq.template_id + 1, which
+        holds for every request/response pair in the R | Protocol API.
+        """
+        if self.reader.disconnected.is_set():
+            raise ConnectionResetError("Rithmic connection lost")
+        token = f"{self._prefix}{next(self._ids)}"
+        rq.user_msg.append(token)
+        self._watch(rq.template_id + 1, response_class)
+
+        pending = _Pending()
+        self._pending[token] = pending
+        try:
+            await self._send(codec.encode(rq))
+            responses = await asyncio.wait_for(pending.future, timeout)
+        finally:
+            self._pending.pop(token, None)
+            for key in [k for k, t in self._request_keys.items() if t == token]:
+                del self._request_keys[key]
+
+        if check and responses[-1].rp_code[0] != "0":
+            raise RequestError(rq.template_id, responses[-1].rp_code)
+        return responses
+
+    def fail_pending(self, exc):
+        """Fail every in-flight request, e.g. after the connection dropped."""
+        for pending in self._pending.values():
+            if not pending.future.done():
+                pending.future.set_exception(exc)
+
+    def _on_disconnect(self):
+        self.fail_pending(ConnectionResetError("Rithmic connection lost"))
+
+    def _watch(self, template_id, response_class):
+        if template_id not in self._response_classes:
+            self._response_classes[template_id] = response_class
+            self.reader.add_callback(template_id, self._on_response)
+
+    def _on_response(self, template_id, msg_buf):
+        if not self._pending:
+            return
+        msg = codec.decode(self._response_classes[template_id], msg_buf)
+
+        token = next((m for m in msg.user_msg if m in self._pending), None)
+        request_key = getattr(msg, "request_key", "")
+        if token is None:
+            token = self._request_keys.get(request_key)
+            if token is None or token not in self._pending:
+                return
+        elif request_key:
+            self._request_keys[request_key] = token
+
+        pending = self._pending[token]
+        if pending.future.done():
+            return
+        pending.responses.append(msg)
+        if len(msg.rp_code) > 0:
+            pending.future.set_result(pending.responses)
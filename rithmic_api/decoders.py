@@ -0,0 +1,194 @@
+#   ===========================================================================
+#   Partial decoders: read only the fields a consumer asked for straight
+#   from the wire format into a namedtuple, instead of materialising the
+#   full protobuf message.  Fields missing from a message take their proto
+#   default, so a record holds the same values the full parse would give.
+
+import collections
+import struct
+
+from rithmic_api import templates, wire
+
+_DOUBLE = struct.Struct("<d").unpack_from
+_FLOAT = struct.Struct("<f").unpack_from
+_INT64 = struct.Struct("<q").unpack_from
+_UINT64 = struct.Struct("<Q").unpack_from
+_INT32 = struct.Struct("<i").unpack_from
+_UINT32 = struct.Struct("<I").unpack_from
+
+# how each scalar type is stored on the wire, and read back
+_VARINT_SIGNED = 1
+_VARINT_UNSIGNED = 2
+_VARINT_BOOL = 3
+_VARINT_ZIGZAG = 4
+_STRING = 5
+_BYTES = 6
+
+
+def _kinds():
+    """How each scalar type is stored on the wire, keyed by FieldDescriptor type."""
+    from google.protobuf.descriptor import FieldDescriptor
+
+    return {
+        FieldDescriptor.TYPE_DOUBLE: (wire.WIRETYPE_FIXED64, _DOUBLE),
+        FieldDescriptor.TYPE_FLOAT: (wire.WIRETYPE_FIXED32, _FLOAT),
+        FieldDescriptor.TYPE_INT64: (wire.WIRETYPE_VARINT, _VARINT_SIGNED),
+        FieldDescriptor.TYPE_UINT64: (wire.WIRETYPE_VARINT, _VARINT_UNSIGNED),
+        FieldDescriptor.TYPE_INT32: (wire.WIRETYPE_VARINT, _VARINT_SIGNED),
+        FieldDescriptor.TYPE_FIXED64: (wire.WIRETYPE_FIXED64, _UINT64),
+        FieldDescriptor.TYPE_FIXED32: (wire.WIRETYPE_FIXED32, _UINT32),
+        FieldDescriptor.TYPE_BOOL: (wire.WIRETYPE_VARINT, _VARINT_BOOL),
+        FieldDescriptor.TYPE_STRING: (wire.WIRETYPE_LENGTH_DELIMITED, _STRING),
+        FieldDescriptor.TYPE_BYTES: (wire.WIRETYPE_LENGTH_DELIMITED, _BYTES),
+        FieldDescriptor.TYPE_UINT32: (wire.WIRETYPE_VARINT, _VARINT_UNSIGNED),
+        FieldDescriptor.TYPE_ENUM: (wire.WIRETYPE_VARINT, _VARINT_SIGNED),
+        FieldDescriptor.TYPE_SFIXED32: (wire.WIRETYPE_FIXED32, _INT32),
+        FieldDescriptor.TYPE_SFIXED64: (wire.WIRETYPE_FIXED64, _INT64),
+        FieldDescriptor.TYPE_SINT32: (wire.WIRETYPE_VARINT, _VARINT_ZIGZAG),
+        FieldDescriptor.TYPE_SINT64: (wire.WIRETYPE_VARINT, _VARINT_ZIGZAG),
+    }
+
+
+class FieldDecoder:
+    """Decodes a few singular fields of one message type into a namedtuple.
+
+    The scan stops as soon as it is past the highest requested field
+    number, so asking only for low-numbered fields skips the rest of the
+    message entirely.  mismatches() compares a record with the full
+    protobuf parse, for validating a decoder against real traffic.
+
+    message may be a generated class or a template_id; for a template_id
+    the class, and its module, is only loaded when first needed.
+    """
+
+    def __init__(self, message, fields):
+        self.fields = tuple(fields)
+        if isinstance(message, int):
+            self.template_id = message
+            self._message_class = None
+            name = templates.TEMPLATES[message][1]
+        else:
+            self.template_id = None
+            self._message_class = message
+            name = message.__name__
+        self.name = name
+        self.record_class = collections.namedtuple(name + "Record", self.fields)
+        self._defaults = None
+        self._fields = None
+        self._last_field = None
+        if self._message_class is not None:
+            self._setup()
+
+    @property
+    def message_class(self):
+        if self._message_class is None:
+            self._message_class = templates.message_class(self.template_id)
+        return self._message_class
+
+    def _setup(self):
+        message_class = self.message_class
+        kinds = _kinds()
+        by_name = message_class.DESCRIPTOR.fields_by_name
+        defaults = []
+        fields = {}
+        for index, name in enumerate(self.fields):
+            field = by_name.get(name)
+            if field is None:
+                raise ValueError(f"{message_class.__name__} has no field {name!r}")
+            if field.label == field.LABEL_REPEATED or field.type not in kinds:
+                raise ValueError(f"{message_class.__name__}.{name} is not a singular scalar field")
+            wire_type, kind = kinds[field.type]
+            default = field.default_value
+            if field.type in (field.TYPE_DOUBLE, field.TYPE_FLOAT):
+                default = float(default)
+            defaults.append(default)
+            fields[field.number] = (index, wire_type, kind)
+        self._defaults = defaults
+        self._last_field = max(fields)
+        self._fields = fields
+
+    def __call__(self, buf):
+        return self.decode(buf)
+
+    def decode(self, buf):
+        try:
+            return self.record_class._make(self._decode(buf))
+        except (IndexError, struct.error, UnicodeDecodeError):
+            raise wire.WireError(f"malformed {self.name}") from None
+
+    def mismatches(self, buf):
+        """Return {field: (decoded, parsed)} for fields that differ from a full parse."""
+        record = self.decode(buf)
+        msg = self.message_class()
+        msg.ParseFromString(buf)
+        result = {}
+        for name, value in zip(self.fields, record):
+            expected = getattr(msg, name)
+            if value != expected:
+                result[name] = (value, expected)
+        return result
+
+    def _decode(self, buf):
+        fields = self._fields
+        if fields is None:
+            self._setup()
+            fields = self._fields
+        values = list(self._defaults)
+        last_field = self._last_field
+        read_varint = wire.read_varint
+        pos = 0
+        end = len(buf)
+        while pos < end:
+            # three byte tags inline, as in wire.peek_template_id()
+            b0 = buf[pos]
+            if b0 & 0x80 and pos + 2 < end and buf[pos + 1] & 0x80 and not buf[pos + 2] & 0x80:
+                tag = (b0 & 0x7f) | (buf[pos + 1] & 0x7f) << 7 | buf[pos + 2] << 14
+                pos += 3
+            else:
+                tag, pos = read_varint(buf, pos)
+            field_number = tag >> 3
+            if field_number > last_field:
+                break
+            wire_type = tag & 7
+            entry = fields.get(field_number)
+            if entry is None or entry[1] != wire_type:
+                pos = wire.skip_field(buf, pos, wire_type)
+                continue
+            index, _, kind = entry
+            if wire_type == wire.WIRETYPE_FIXED64:
+                values[index] = kind(buf, pos)[0]
+                pos += 8
+            elif wire_type == wire.WIRETYPE_FIXED32:
+                values[index] = kind(buf, pos)[0]
+                pos += 4
+            elif wire_type == wire.WIRETYPE_VARINT:
+                value, pos = read_varint(buf, pos)
+                if kind == _VARINT_SIGNED:
+                    if value >= 1 << 63:
+                        value -= 1 << 64
+                elif kind == _VARINT_BOOL:
+                    value = bool(value)
+                elif kind == _VARINT_ZIGZAG:
+                    value = (value >> 1) ^ -(value & 1)
+                values[index] = value
+            else:
+                length, pos = read_varint(buf, pos)
+                value = bytes(buf[pos:pos + length])
+                pos += length
+                values[index] = value.decode("utf-8") if kind == _STRING else value
+        if pos > end:
+            # slicing does not raise, so a cut string or skipped field shows here
+            raise wire.WireError(f"truncated {self.name}")
+        return values
+
+
+BEST_BID_OFFER_FIELDS = ("symbol", "exchange", "presence_bits", "bid_price", "bid_size",
+                         "ask_price", "ask_size", "ssboe", "usecs")
+LAST_TRADE_FIELDS = ("symbol", "exchange", "presence_bits", "trade_price", "trade_size",
+                     "aggressor", "ssboe", "usecs")
+
+best_bid_offer = FieldDecoder(151, BEST_BID_OFFER_FIELDS)
+last_trade = FieldDecoder(150, LAST_TRADE_FIELDS)
+
+#   decoders for reader.stream(150, 151, decoders=MARKET_DATA_DECODERS)
+MARKET_DATA_DECODERS = {150: last_trade, 151: best_bid_offer}
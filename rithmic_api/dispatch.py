@@ -0,0 +1,85 @@
+import inspect
+import logging
+
+from rithmic_api import codec as codecs
+from rithmic_api import templates, wire
+from rithmic_api.message_pool import MessagePool
+
+logger = logging.getLogger(__name__)
+
+
+class Dispatcher:
+    """Routes frames to handlers through a table keyed by template_id.
+
+    Each template is registered with the message class to parse it into
+    and a handler called as handler(template_id, msg).  The frame is parsed
+    once, into that class, and only if a handler wants it.  Instead of a
+    class, a decoder such as decoders.FieldDecoder can be given, which is
+    called as decoder(msg_buf); None hands the raw bytes to the handler.
+    Frames for unregistered templates go to default, if given, as
+    default(template_id, msg_buf).  Classes are decoded with codec, the
+    process-wide default codec unless one is given.
+
+    With reuse set to message_pool.REUSE or SNAPSHOT, classes are decoded
+    into preallocated messages from self.pool rather than a new message
+    per frame; see message_pool for what each mode hands the handler.
+    """
+
+    def __init__(self, default=None, codec=None, reuse=None):
+        self.default = default
+        self.codec = codec or codecs.default()
+        self.reuse = reuse
+        self.pool = MessagePool(self.codec) if reuse else None
+        self._table = {}
+
+    def register(self, template_id, message_class, handler):
+        if message_class is None:
+            decode = None
+        elif hasattr(message_class, "ParseFromString"):
+            if self.pool is not None:
+                decode = self.pool.decoder(message_class, self.reuse)
+            else:
+                decode = self.codec.decoder(message_class)
+        else:
+            decode = message_class
+        self._table[template_id] = (decode, handler)
+
+    def register_template(self, template_id, handler):
+        """register() with the class looked up in the template registry.
+
+        The lookup, and the import of the generated module, is put off
+        until the first frame of that template arrives.
+        """
+        def resolve(msg_buf):
+            self.register(template_id, templates.message_class(template_id), handler)
+            return self._table[template_id][0](msg_buf)
+        self._table[template_id] = (resolve, handler)
+
+    def unregister(self, template_id):
+        self._table.pop(template_id, None)
+
+    def __contains__(self, template_id):
+        return template_id in self._table
+
+    def dispatch(self, template_id, msg_buf):
+        """Parse msg_buf for its handler and return the handler's result."""
+        entry = self._table.get(template_id)
+        if entry is None:
+            if self.default is not None:
+                return self.default(template_id, msg_buf)
+            return None
+        decode, handler = entry
+        if decode is None:
+            return handler(template_id, msg_buf)
+        return handler(template_id, decode(msg_buf))
+
+    def dispatch_buf(self, msg_buf):
+        """dispatch() a frame whose template_id is not known yet."""
+        return self.dispatch(wire.peek_template_id(msg_buf), msg_buf)
+
+    async def dispatch_async(self, template_id, msg_buf):
+        """dispatch(), awaiting the result when the handler is a coroutine."""
+        result = self.dispatch(template_id, msg_buf)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
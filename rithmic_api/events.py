@@ -0,0 +1,183 @@
+#   ===========================================================================
+#   In-process event bus for parsed R | Protocol messages.  Application code
+#   subscribes a handler to one or more templates, optionally narrowed by
+#   field values (symbol, account_id, basket_id ...), and whatever parses
+#   the messages publishes them here instead of calling handlers itself.
+#
+#          events = EventBus()
+#          events.subscribe(RithmicOrderNotification, on_order, account_id="ACCT-1")
+#          dispatcher.register_template(351, events.publish_async)
+#
+#   Routing is precomputed: every subscribe() and unsubscribe() rebuilds a
+#   table, per template_id, of the unfiltered handlers and of the filtered
+#   ones indexed by the value of their first filter, so publishing looks
+#   up at most one dict entry per filtered field rather than testing every
+#   subscription.  Each subscription records how often its handler ran and
+#   for how long, and a handler slower than slow seconds is logged.
+
+import asyncio
+import inspect
+import logging
+import time
+
+from rithmic_api import templates
+
+logger = logging.getLogger(__name__)
+
+#   what a filtered field reads as on a message that lacks it, so that such
+#   a filter matches nothing instead of breaking publish()
+_MISSING = object()
+
+
+class Subscription:
+    """One handler on the bus, with its filters and timings."""
+
+    def __init__(self, template_ids, handler, filters):
+        self.template_ids = template_ids
+        self.handler = handler
+        self.filters = filters
+        self.name = getattr(handler, "__qualname__", repr(handler))
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def matches(self, msg):
+        for field, value in self.filters:
+            if getattr(msg, field, _MISSING) != value:
+                return False
+        return True
+
+    def stats(self):
+        return {
+            "handler": self.name,
+            "template_ids": list(self.template_ids),
+            "filters": dict(self.filters),
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_ms": self.total_time * 1000,
+            "mean_us": self.total_time / self.calls * 1e6 if self.calls else 0.0,
+            "max_us": self.max_time * 1e6,
+        }
+
+
+class _Route:
+    """The subscriptions for one template_id, as publish() walks them."""
+
+    __slots__ = ("unfiltered", "indexed")
+
+    def __init__(self, subscriptions):
+        self.unfiltered = tuple(s for s in subscriptions if not s.filters)
+        # first filter field : {value : subscriptions}
+        indexed = {}
+        for s in subscriptions:
+            if s.filters:
+                field, value = s.filters[0]
+                by_value = indexed.setdefault(field, {})
+                by_value[value] = by_value.get(value, ()) + (s,)
+        self.indexed = tuple(indexed.items())
+
+    def match(self, msg):
+        matched = self.unfiltered
+        for field, by_value in self.indexed:
+            candidates = by_value.get(getattr(msg, field, _MISSING))
+            if candidates:
+                matched = matched + tuple(s for s in candidates if s.matches(msg))
+        return matched
+
+
+class EventBus:
+    """Delivers published messages to the handlers subscribed to them.
+
+    Handlers are called as handler(template_id, msg), in subscription
+    order for the unfiltered ones; a handler that raises is logged and
+    does not stop the others.  A handler may be a coroutine function if
+    messages are published with publish_async().
+    """
+
+    def __init__(self, slow=None):
+        self.slow = slow
+        self.published = 0
+        self._subscriptions = []
+        self._routes = {}
+
+    def subscribe(self, templates_or_classes, handler, **filters):
+        """Subscribe handler to templates, given by id or generated class.
+
+        filters are field=value pairs every delivered message must match,
+        e.g. symbol="ESZ6"; returns the Subscription for unsubscribe().
+        """
+        if isinstance(templates_or_classes, (list, tuple, set, frozenset)):
+            items = templates_or_classes
+        else:
+            items = (templates_or_classes,)
+        template_ids = tuple(t if isinstance(t, int) else templates.template_id_of(t) for t in items)
+        subscription = Subscription(template_ids, handler, tuple(filters.items()))
+        self._subscriptions.append(subscription)
+        self._rebuild()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscriptions = [s for s in self._subscriptions if s is not subscription]
+        self._rebuild()
+
+    def __contains__(self, template_id):
+        return template_id in self._routes
+
+    def publish(self, template_id, msg):
+        """Call every matching handler; coroutines are scheduled, not awaited."""
+        route = self._routes.get(template_id)
+        if route is None:
+            return
+        self.published += 1
+        for subscription in route.match(msg):
+            self._call(subscription, template_id, msg)
+
+    async def publish_async(self, template_id, msg):
+        """publish(), awaiting each handler that is a coroutine before the next."""
+        route = self._routes.get(template_id)
+        if route is None:
+            return
+        self.published += 1
+        for subscription in route.match(msg):
+            started = time.perf_counter()
+            try:
+                result = subscription.handler(template_id, msg)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                subscription.errors += 1
+                logger.exception("Event handler %s failed for template %s", subscription.name, template_id)
+            self._record(subscription, time.perf_counter() - started)
+
+    def stats(self):
+        return {
+            "published": self.published,
+            "subscriptions": [s.stats() for s in self._subscriptions],
+        }
+
+    def _call(self, subscription, template_id, msg):
+        started = time.perf_counter()
+        try:
+            result = subscription.handler(template_id, msg)
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(result)
+        except Exception:
+            subscription.errors += 1
+            logger.exception("Event handler %s failed for template %s", subscription.name, template_id)
+        self._record(subscription, time.perf_counter() - started)
+
+    def _record(self, subscription, elapsed):
+        subscription.calls += 1
+        subscription.total_time += elapsed
+        if elapsed > subscription.max_time:
+            subscription.max_time = elapsed
+        if self.slow is not None and elapsed > self.slow:
+            logger.warning("Slow event handler %s: %.1fms", subscription.name, elapsed * 1000)
+
+    def _rebuild(self):
+        by_template = {}
+        for s in self._subscriptions:
+            for template_id in s.template_ids:
+                by_template.setdefault(template_id, []).append(s)
+        self._routes = {template_id: _Route(subs) for template_id, subs in by_template.items()}
@@ -0,0 +1,137 @@
+import asyncio
+import itertools
+import logging
+import time
+
+from rithmic_api import codec, templates
+from rithmic_api.request_templates import RequestTemplate
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 30.0
+
+# only the tag and timestamps change from one heartbeat to the next
+HEARTBEAT_REQUEST = RequestTemplate(18, ("user_msg", "ssboe", "usecs"))
+
+
+class HeartbeatScheduler:
+    """Keeps a plant session alive and measures heartbeat round-trip time.
+
+    A heartbeat is only sent once nothing has gone out for ``lead`` of the
+    interval returned in ResponseLogin.heartbeat_interval; callers report
+    other outbound traffic with note_sent() so it can stand in for a
+    heartbeat.  Each RequestHeartbeat is stamped with ssboe/usecs and a
+    user_msg tag, and the matching ResponseHeartbeat gives the round trip.
+    """
+
+    def __init__(self, send, reader, interval=None, lead=0.8):
+        self.interval = interval or DEFAULT_INTERVAL
+        self.lead = lead
+        self.last_sent = time.monotonic()
+
+        self.sent = 0
+        self.suppressed = 0
+        self.last_rtt = None
+        self.min_rtt = None
+        self.avg_rtt = None
+        self.clock_offset = None
+
+        self._send = send
+        self._reader = reader
+        self._ids = itertools.count(1)
+        self._outstanding = {}
+        self._task = None
+        reader.add_callback(19, self._on_response)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    def stop(self):
+        self._reader.remove_callback(19, self._on_response)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def restart(self, interval=None):
+        """Resume after a reconnect, using the new login's interval."""
+        self.interval = interval or DEFAULT_INTERVAL
+        self._outstanding.clear()
+        self.note_sent()
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def note_sent(self):
+        """Record outbound traffic, which postpones the next heartbeat."""
+        self.last_sent = time.monotonic()
+
+    async def send_heartbeat(self):
+        now = time.time()
+        ssboe = int(now)
+        usecs = int((now - ssboe) * 1000000)
+        token = f"hb{next(self._ids)}"
+
+        # forget heartbeats that were never answered
+        cutoff = time.monotonic() - 4 * self.interval
+        for key in [k for k, v in self._outstanding.items() if v[0] < cutoff]:
+            del self._outstanding[key]
+
+        self._outstanding[token] = (time.monotonic(), ssboe, usecs)
+        await self._send(HEARTBEAT_REQUEST.encode(user_msg=(token,), ssboe=ssboe, usecs=usecs))
+        self.note_sent()
+        self.sent += 1
+
+    def stats(self):
+        return {
+            "interval": self.interval,
+            "sent": self.sent,
+            "suppressed": self.suppressed,
+            "last_rtt": self.last_rtt,
+            "min_rtt": self.min_rtt,
+            "avg_rtt": self.avg_rtt,
+            "clock_offset": self.clock_offset,
+        }
+
+    async def _run(self):
+        while True:
+            send_after = self.interval * self.lead
+            idle_for = time.monotonic() - self.last_sent
+            if idle_for < send_after:
+                await asyncio.sleep(send_after - idle_for)
+                if time.monotonic() - self.last_sent < send_after:
+                    self.suppressed += 1
+                continue
+            try:
+                await self.send_heartbeat()
+            except Exception:
+                logger.info("Heartbeat failed, stopping scheduler.")
+                return
+
+    def _on_response(self, template_id, msg_buf):
+        rp = codec.decode(templates.message_class(19), msg_buf)
+
+        sent = None
+        for token in rp.user_msg:
+            sent = self._outstanding.pop(token, None)
+            if sent is not None:
+                break
+        if sent is None:
+            # fall back on the echoed timestamp if user_msg was dropped
+            for token, value in self._outstanding.items():
+                if value[1:] == (rp.ssboe, rp.usecs):
+                    sent = self._outstanding.pop(token)
+                    break
+        if sent is None:
+            return
+
+        sent_at, ssboe, usecs = sent
+        rtt = time.monotonic() - sent_at
+        self.last_rtt = rtt
+        self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+        self.avg_rtt = rtt if self.avg_rtt is None else self.avg_rtt + (rtt - self.avg_rtt) / 8
+
+        # a response stamped with the gateway's own clock gives its offset
+        if rp.ssboe and (rp.ssboe, rp.usecs) != (ssboe, usecs):
+            sent_wall = ssboe + usecs / 1000000
+            self.clock_offset = rp.ssboe + rp.usecs / 1000000 - (sent_wall + rtt / 2)
@@ -0,0 +1,600 @@
+#   ===========================================================================
+#
+#   local_server.py
+#   ===============
+#   A local stand-in for the Rithmic gateway, for load and latency testing of
+#   the client code without a live connection.  It speaks the protobuf
+#   templates this project uses :
+#
+#      10/11   login                   300/301  login info
+#      12/13   logout                  302/303  account list
+#      16/17   rithmic system info     308/309  subscribe for order updates
+#      18/19   heartbeat               310/311  trade routes
+#     100/101  market data update      312/313  new order
+#     150/151  last trade / bbo        351/352  order notifications
+#     156      order book              206/207  tick bar replay
+#
+#   Market data is generated at a configurable rate per subscribed symbol,
+#   with optional bursts, and every response can be delayed to simulate
+#   network latency.  Example :
+#
+#          python -m rithmic_api.local_server --port 8765 --rate 5000 \
+#                 --burst-size 2000 --burst-interval 1 --latency 0.002
+#
+#   then point any client at ws://127.0.0.1:8765.
+#
+#   ===========================================================================
+
+import argparse
+import asyncio
+import itertools
+import logging
+import random
+import ssl
+import time
+
+import websockets
+
+from rithmic_api import order_book, wire
+from rithmic_api.best_bid_offer_pb2 import BestBidOffer
+from rithmic_api.exchange_order_notification_pb2 import ExchangeOrderNotification
+from rithmic_api.last_trade_pb2 import LastTrade
+from rithmic_api.request_account_list_pb2 import RequestAccountList
+from rithmic_api.request_heartbeat_pb2 import RequestHeartbeat
+from rithmic_api.request_login_info_pb2 import RequestLoginInfo
+from rithmic_api.request_login_pb2 import RequestLogin
+from rithmic_api.request_logout_pb2 import RequestLogout
+from rithmic_api.request_market_data_update_pb2 import RequestMarketDataUpdate
+from rithmic_api.request_new_order_pb2 import RequestNewOrder
+from rithmic_api.request_rithmic_system_info_pb2 import RequestRithmicSystemInfo
+from rithmic_api.request_subscribe_for_order_updates_pb2 import RequestSubscribeForOrderUpdates
+from rithmic_api.request_tick_bar_replay_pb2 import RequestTickBarReplay
+from rithmic_api.request_trade_routes_pb2 import RequestTradeRoutes
+from rithmic_api.response_account_list_pb2 import ResponseAccountList
+from rithmic_api.response_heartbeat_pb2 import ResponseHeartbeat
+from rithmic_api.response_login_info_pb2 import ResponseLoginInfo
+from rithmic_api.response_login_pb2 import ResponseLogin
+from rithmic_api.response_logout_pb2 import ResponseLogout
+from rithmic_api.response_market_data_update_pb2 import ResponseMarketDataUpdate
+from rithmic_api.response_new_order_pb2 import ResponseNewOrder
+from rithmic_api.response_rithmic_system_info_pb2 import ResponseRithmicSystemInfo
+from rithmic_api.response_subscribe_for_order_updates_pb2 import ResponseSubscribeForOrderUpdates
+from rithmic_api.response_tick_bar_replay_pb2 import ResponseTickBarReplay
+from rithmic_api.response_trade_routes_pb2 import ResponseTradeRoutes
+from rithmic_api.rithmic_order_notification_pb2 import RithmicOrderNotification
+
+logger = logging.getLogger(__name__)
+
+FCM_ID = "LocalFCM"
+IB_ID = "LocalIB"
+TRADE_ROUTE = "simulator"
+
+
+def _stamp(msg):
+    now = time.time()
+    msg.ssboe = int(now)
+    msg.usecs = int((now - msg.ssboe) * 1000000)
+
+
+class _Connection:
+    """Per-client state: logged-in plant, feeds, requests in progress."""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.infra_type = None
+        self.feeds = {}
+        self.tasks = set()
+        self.order_accounts = set()
+
+
+class LocalRithmicServer:
+    """A websocket server that answers like a Rithmic gateway.
+
+    rate is the number of market data messages per second per subscribed
+    symbol, book_ratio of them depth updates when the order book is
+    subscribed too; every burst_interval seconds a further burst_size
+    messages are sent back to back.  Responses are delayed by latency seconds plus up to
+    jitter seconds.  Tick bar replays return num_bars bars, the account list
+    returns num_accounts accounts.  Pass a server-side ssl_context to serve
+    wss:// instead of ws://.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765, rate=100.0, trade_ratio=0.25, book_ratio=0.5,
+                 burst_size=0, burst_interval=1.0, latency=0.0, jitter=0.0,
+                 heartbeat_interval=60.0, num_bars=1000, num_accounts=1,
+                 system_names=("Rithmic Test",), ssl_context=None):
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.trade_ratio = trade_ratio
+        self.book_ratio = book_ratio
+        self.burst_size = burst_size
+        self.burst_interval = burst_interval
+        self.latency = latency
+        self.jitter = jitter
+        self.heartbeat_interval = heartbeat_interval
+        self.num_bars = num_bars
+        self.num_accounts = num_accounts
+        self.system_names = list(system_names)
+        self.ssl_context = ssl_context
+
+        self.num_connections = 0
+        self.num_received = 0
+        self.num_sent = 0
+
+        self._server = None
+        self._basket_ids = itertools.count(1)
+        self._request_keys = itertools.count(1)
+        self._handlers = {
+            10: self._on_login,
+            12: self._on_logout,
+            16: self._on_system_info,
+            18: self._on_heartbeat,
+            100: self._on_market_data_update,
+            206: self._on_tick_bar_replay,
+            300: self._on_login_info,
+            302: self._on_account_list,
+            308: self._on_subscribe_for_order_updates,
+            310: self._on_trade_routes,
+            312: self._on_new_order,
+        }
+
+    @property
+    def uri(self):
+        scheme = "wss" if self.ssl_context is not None else "ws"
+        return f"{scheme}://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await websockets.serve(self._serve, self.host, self.port,
+                                              ssl=self.ssl_context, max_queue=None)
+        if self.port == 0:
+            self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Local Rithmic server listening on %s", self.uri)
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await asyncio.Future()
+        finally:
+            await self.stop()
+
+    async def _serve(self, ws, path=None):
+        self.num_connections += 1
+        conn = _Connection(ws)
+        try:
+            async for msg_buf in ws:
+                self.num_received += 1
+                template_id = wire.peek_template_id(msg_buf)
+                handler = self._handlers.get(template_id)
+                if handler is None:
+                    logger.info("Ignoring unsupported template id %s", template_id)
+                    continue
+                # each request is answered in its own task so that injected
+                # latency delays responses without serialising requests
+                task = asyncio.ensure_future(handler(conn, msg_buf))
+                conn.tasks.add(task)
+                task.add_done_callback(conn.tasks.discard)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for task in list(conn.feeds.values()) + list(conn.tasks):
+                task.cancel()
+
+    async def _send(self, conn, msg, delay=True):
+        if delay and (self.latency or self.jitter):
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        await conn.ws.send(msg if isinstance(msg, bytes) else msg.SerializeToString())
+        self.num_sent += 1
+
+    #   =======================================================================
+    #   session templates
+
+    async def _on_login(self, conn, msg_buf):
+        rq = RequestLogin()
+        rq.ParseFromString(msg_buf)
+        conn.infra_type = rq.infra_type
+
+        rp = ResponseLogin()
+        rp.template_id = 11
+        rp.template_version = rq.template_version
+        rp.user_msg.extend(rq.user_msg)
+        if rq.system_name in self.system_names:
+            rp.rp_code.append("0")
+            rp.fcm_id = FCM_ID
+            rp.ib_id = IB_ID
+            rp.country_code = "US"
+            rp.unique_user_id = rq.user
+            rp.heartbeat_interval = self.heartbeat_interval
+        else:
+            rp.rp_code.extend(["13", "permission denied"])
+        await self._send(conn, rp)
+
+    async def _on_logout(self, conn, msg_buf):
+        rq = RequestLogout()
+        rq.ParseFromString(msg_buf)
+        rp = ResponseLogout()
+        rp.template_id = 13
+        rp.user_msg.extend(rq.user_msg)
+        rp.rp_code.append("0")
+        await self._send(conn, rp)
+
+    async def _on_system_info(self, conn, msg_buf):
+        rq = RequestRithmicSystemInfo()
+        rq.ParseFromString(msg_buf)
+        rp = ResponseRithmicSystemInfo()
+        rp.template_id = 17
+        rp.user_msg.extend(rq.user_msg)
+        rp.rp_code.append("0")
+        rp.system_name.extend(self.system_names)
+        await self._send(conn, rp)
+        await conn.ws.close()
+
+    async def _on_heartbeat(self, conn, msg_buf):
+        rq = RequestHeartbeat()
+        rq.ParseFromString(msg_buf)
+        rp = ResponseHeartbeat()
+        rp.template_id = 19
+        rp.user_msg.extend(rq.user_msg)
+        rp.rp_code.append("0")
+        _stamp(rp)
+        await self._send(conn, rp)
+
+    #   =======================================================================
+    #   ticker plant
+
+    async def _on_market_data_update(self, conn, msg_buf):
+        rq = RequestMarketDataUpdate()
+        rq.ParseFromString(msg_buf)
+        key = (rq.exchange, rq.symbol)
+
+        task = conn.feeds.pop(key, None)
+        if task is not None:
+            task.cancel()
+        if rq.request == RequestMarketDataUpdate.Request.SUBSCRIBE:
+            conn.feeds[key] = asyncio.ensure_future(self._feed(conn, rq.exchange, rq.symbol, rq.update_bits))
+
+        rp = ResponseMarketDataUpdate()
+        rp.template_id = 101
+        rp.user_msg.extend(rq.user_msg)
+        rp.rp_code.append("0")
+        await self._send(conn, rp)
+
+    def _market_data(self, exchange, symbol, update_bits, state, is_snapshot=False):
+        want_trades = update_bits & RequestMarketDataUpdate.UpdateBits.LAST_TRADE
+        want_bbo = update_bits & RequestMarketDataUpdate.UpdateBits.BBO
+        want_book = update_bits & RequestMarketDataUpdate.UpdateBits.ORDER_BOOK
+        if want_book and (not (want_trades or want_bbo) or random.random() < self.book_ratio):
+            return self._depth(exchange, symbol, state, order_book.SOLO)
+        if want_trades and (not want_bbo or random.random() < self.trade_ratio):
+            state["price"] += random.choice((-0.25, 0.0, 0.25))
+            state["volume"] += 1
+            msg = LastTrade()
+            msg.template_id = 150
+            msg.presence_bits = LastTrade.PresenceBits.LAST_TRADE | LastTrade.PresenceBits.VOLUME
+            msg.trade_price = state["price"]
+            msg.trade_size = random.randint(1, 10)
+            msg.aggressor = random.choice((LastTrade.TransactionType.BUY, LastTrade.TransactionType.SELL))
+            msg.volume = state["volume"]
+        elif want_bbo:
+            msg = BestBidOffer()
+            msg.template_id = 151
+            msg.presence_bits = BestBidOffer.PresenceBits.BID | BestBidOffer.PresenceBits.ASK
+            msg.bid_price = state["price"] - 0.25
+            msg.bid_size = random.randint(1, 50)
+            msg.ask_price = state["price"]
+            msg.ask_size = random.randint(1, 50)
+        else:
+            return None
+        msg.symbol = symbol
+        msg.exchange = exchange
+        msg.is_snapshot = is_snapshot
+        _stamp(msg)
+        return msg
+
+    def _depth(self, exchange, symbol, state, update_type):
+        """An OrderBook message, serialized: the ten levels each side for an
+        image, else a new size, or none, for one of them.  Levels the price
+        has moved away from, or through, are removed along the way."""
+        price = state["price"]
+        book = state.setdefault("book", ({}, {}))
+        if update_type == order_book.SNAPSHOT_IMAGE:
+            for side, sign, offset in ((0, -1, 1), (1, 1, 0)):
+                book[side].clear()
+                for k in range(10):
+                    book[side][price + sign * 0.25 * (k + offset)] = random.randint(1, 50)
+            changes = (dict(book[0]), dict(book[1]))
+        else:
+            changes = ({}, {})
+            side = random.randrange(2)
+            level = price - 0.25 * (random.randrange(10) + 1) if side == 0 else price + 0.25 * random.randrange(10)
+            changes[side][level] = 0 if random.random() < 0.2 else random.randint(1, 50)
+            for side, lo, hi in ((0, price - 2.5, price - 0.25), (1, price, price + 2.25)):
+                for stale in [p for p in book[side] if not lo <= p <= hi]:
+                    changes[side][stale] = 0
+            for side in (0, 1):
+                for level, size in changes[side].items():
+                    if size:
+                        book[side][level] = size
+                    else:
+                        book[side].pop(level, None)
+        bids, asks = ([(level, size, (size + 4) // 5) for level, size in changes[side].items()] for side in (0, 1))
+        now = time.time()
+        ssboe = int(now)
+        return order_book.encode(exchange, symbol, update_type, bids, asks, ssboe, int((now - ssboe) * 1000000))
+
+    async def _feed(self, conn, exchange, symbol, update_bits):
+        state = {"price": 5000.0, "volume": 0}
+        for snapshot_bits in (RequestMarketDataUpdate.UpdateBits.LAST_TRADE, RequestMarketDataUpdate.UpdateBits.BBO):
+            msg = self._market_data(exchange, symbol, update_bits & snapshot_bits, state, is_snapshot=True)
+            if msg is not None:
+                await self._send(conn, msg, delay=False)
+        if update_bits & RequestMarketDataUpdate.UpdateBits.ORDER_BOOK:
+            await self._send(conn, self._depth(exchange, symbol, state, order_book.SNAPSHOT_IMAGE), delay=False)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        next_burst = started + self.burst_interval
+        sent = 0
+        try:
+            while True:
+                now = loop.time()
+                due = int((now - started) * self.rate) - sent
+                if due > self.rate:
+                    # the client is more than a second behind; do not try
+                    # to catch up, just keep sending at the configured rate
+                    sent += due - int(self.rate)
+                    due = int(self.rate)
+                if self.burst_size and now >= next_burst:
+                    due += self.burst_size
+                    sent -= self.burst_size
+                    next_burst += self.burst_interval
+                for _ in range(due):
+                    msg = self._market_data(exchange, symbol, update_bits, state)
+                    if msg is None:
+                        return
+                    await self._send(conn, msg, delay=False)
+                sent += due
+                await asyncio.sleep(0.001)
+        except websockets.ConnectionClosed:
+            pass
+
+    #   =======================================================================
+    #   history plant
+
+    async def _on_tick_bar_replay(self, conn, msg_buf):
+        rq = RequestTickBarReplay()
+        rq.ParseFromString(msg_buf)
+        request_key = str(next(self._request_keys))
+
+        price = 5000.0
+        span = max(rq.finish_index - rq.start_index, 1)
+        for i in range(self.num_bars):
+            rp = ResponseTickBarReplay()
+            rp.template_id = 207
+            rp.request_key = request_key
+            rp.user_msg.extend(rq.user_msg)
+            rp.rq_handler_rp_code.append("0")
+            rp.symbol = rq.symbol
+            rp.exchange = rq.exchange
+            rp.type = rq.bar_type or ResponseTickBarReplay.BarType.TICK_BAR
+            rp.sub_type = rq.bar_sub_type or ResponseTickBarReplay.BarSubType.REGULAR
+            rp.type_specifier = rq.bar_type_specifier
+            rp.num_trades = 1
+            rp.volume = random.randint(1, 10)
+            rp.bid_volume = rp.volume // 2
+            rp.ask_volume = rp.volume - rp.bid_volume
+            rp.open_price = price
+            price += random.choice((-0.25, 0.0, 0.25))
+            rp.close_price = price
+            rp.high_price = max(rp.open_price, price)
+            rp.low_price = min(rp.open_price, price)
+            rp.data_bar_ssboe.append(rq.start_index + span * i // self.num_bars)
+            rp.data_bar_usecs.append(0)
+            await self._send(conn, rp, delay=(i == 0))
+
+        rp = ResponseTickBarReplay()
+        rp.template_id = 207
+        rp.request_key = request_key
+        rp.user_msg.extend(rq.user_msg)
+        rp.rp_code.append("0")
+        await self._send(conn, rp, delay=False)
+
+    #   =======================================================================
+    #   order plant
+
+    async def _on_login_info(self, conn, msg_buf):
+        rq = RequestLoginInfo()
+        rq.ParseFromString(msg_buf)
+        rp = ResponseLoginInfo()
+        rp.template_id = 301
+        rp.user_msg.extend(rq.user_msg)
+        rp.rp_code.append("0")
+        rp.fcm_id = FCM_ID
+        rp.ib_id = IB_ID
+        rp.first_name = "Local"
+        rp.last_name = "Trader"
+        rp.user_type = ResponseLoginInfo.UserType.USER_TYPE_TRADER
+        await self._send(conn, rp)
+
+    async def _on_account_list(self, conn, msg_buf):
+        rq = RequestAccountList()
+        rq.ParseFromString(msg_buf)
+        for i in range(self.num_accounts):
+            rp = ResponseAccountList()
+            rp.template_id = 303
+            rp.user_msg.extend(rq.user_msg)
+            rp.rq_handler_rp_code.append("0")
+            rp.fcm_id = FCM_ID
+            rp.ib_id = IB_ID
+            rp.account_id = f"LOCAL{i + 1:04d}"
+            rp.account_name = f"Local account {i + 1}"
+            rp.account_currency = "USD"
+            await self._send(conn, rp, delay=(i == 0))
+        rp = ResponseAccountList()
+        rp.template_id = 303
+        rp.user_msg.extend(rq.user_msg)
+        rp.rp_code.append("0")
+        await self._send(conn, rp, delay=False)
+
+    async def _on_trade_routes(self, conn, msg_buf):
+        rq = RequestTradeRoutes()
+        rq.ParseFromString(msg_buf)
+        for exchange in ("CME", "CBOT", "NYMEX", "COMEX"):
+            rp = ResponseTradeRoutes()
+            rp.template_id = 311
+            rp.user_msg.extend(rq.user_msg)
+            rp.rq_handler_rp_code.append("0")
+            rp.fcm_id = FCM_ID
+            rp.ib_id = IB_ID
+            rp.exchange = exchange
+            rp.trade_route = TRADE_ROUTE
+            rp.status = "UP"
+            rp.is_default = True
+            await self._send(conn, rp, delay=(exchange == "CME"))
+        rp = ResponseTradeRoutes()
+        rp.template_id = 311
+        rp.user_msg.extend(rq.user_msg)
+        rp.rp_code.append("0")
+        await self._send(conn, rp, delay=False)
+
+    async def _on_subscribe_for_order_updates(self, conn, msg_buf):
+        rq = RequestSubscribeForOrderUpdates()
+        rq.ParseFromString(msg_buf)
+        conn.order_accounts.add((rq.fcm_id, rq.ib_id, rq.account_id))
+        rp = ResponseSubscribeForOrderUpdates()
+        rp.template_id = 309
+        rp.user_msg.extend(rq.user_msg)
+        rp.rp_code.append("0")
+        await self._send(conn, rp)
+
+    async def _on_new_order(self, conn, msg_buf):
+        rq = RequestNewOrder()
+        rq.ParseFromString(msg_buf)
+        basket_id = str(next(self._basket_ids))
+
+        rp = ResponseNewOrder()
+        rp.template_id = 313
+        rp.user_msg.extend(rq.user_msg)
+        rp.user_tag = rq.user_tag
+        rp.rq_handler_rp_code.append("0")
+        rp.basket_id = basket_id
+        _stamp(rp)
+        await self._send(conn, rp)
+
+        rp = ResponseNewOrder()
+        rp.template_id = 313
+        rp.user_msg.extend(rq.user_msg)
+        rp.user_tag = rq.user_tag
+        rp.rp_code.append("0")
+        await self._send(conn, rp, delay=False)
+
+        if (rq.fcm_id, rq.ib_id, rq.account_id) not in conn.order_accounts:
+            return
+
+        fill_price = rq.price or 5000.0
+        for notify_type, status in ((RithmicOrderNotification.OPEN_PENDING, "open pending"),
+                                    (RithmicOrderNotification.OPEN, "open"),
+                                    (RithmicOrderNotification.COMPLETE, "complete")):
+            msg = RithmicOrderNotification()
+            msg.template_id = 351
+            msg.user_tag = rq.user_tag
+            msg.notify_type = notify_type
+            msg.status = status
+            msg.basket_id = basket_id
+            msg.fcm_id = rq.fcm_id
+            msg.ib_id = rq.ib_id
+            msg.account_id = rq.account_id
+            msg.symbol = rq.symbol
+            msg.exchange = rq.exchange
+            msg.trade_route = rq.trade_route
+            msg.quantity = rq.quantity
+            msg.price = rq.price
+            msg.transaction_type = rq.transaction_type or RithmicOrderNotification.TransactionType.BUY
+            msg.duration = rq.duration or RithmicOrderNotification.Duration.DAY
+            msg.price_type = rq.price_type or RithmicOrderNotification.PriceType.MARKET
+            msg.orig_price_type = msg.price_type
+            msg.manual_or_auto = rq.manual_or_auto or RithmicOrderNotification.OrderPlacement.MANUAL
+            if notify_type == RithmicOrderNotification.COMPLETE:
+                msg.avg_fill_price = fill_price
+                msg.total_fill_size = rq.quantity
+            _stamp(msg)
+
+            if notify_type == RithmicOrderNotification.COMPLETE:
+                fill = ExchangeOrderNotification()
+                fill.template_id = 352
+                fill.user_tag = rq.user_tag
+                fill.notify_type = ExchangeOrderNotification.FILL
+                fill.status = "complete"
+                fill.basket_id = basket_id
+                fill.fcm_id = rq.fcm_id
+                fill.ib_id = rq.ib_id
+                fill.account_id = rq.account_id
+                fill.symbol = rq.symbol
+                fill.exchange = rq.exchange
+                fill.trade_route = rq.trade_route
+                fill.quantity = rq.quantity
+                fill.transaction_type = msg.transaction_type
+                fill.duration = msg.duration
+                fill.price_type = msg.price_type
+                fill.orig_price_type = msg.price_type
+                fill.manual_or_auto = msg.manual_or_auto
+                fill.fill_price = fill_price
+                fill.fill_size = rq.quantity
+                fill.fill_id = basket_id
+                _stamp(fill)
+                await self._send(conn, fill, delay=False)
+
+            await self._send(conn, msg, delay=False)
+
+
+#   ===========================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Rithmic gateway.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate", type=float, default=100.0,
+                        help="market data messages per second per subscribed symbol")
+    parser.add_argument("--trade-ratio", type=float, default=0.25,
+                        help="fraction of market data messages that are trades")
+    parser.add_argument("--book-ratio", type=float, default=0.5,
+                        help="fraction of market data messages that are depth updates")
+    parser.add_argument("--burst-size", type=int, default=0)
+    parser.add_argument("--burst-interval", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency, in seconds")
+    parser.add_argument("--heartbeat-interval", type=float, default=60.0)
+    parser.add_argument("--num-bars", type=int, default=1000)
+    parser.add_argument("--num-accounts", type=int, default=1)
+    parser.add_argument("--certfile", help="serve wss:// with this certificate chain")
+    parser.add_argument("--keyfile")
+    args = parser.parse_args()
+
+    ssl_context = None
+    if args.certfile:
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(args.certfile, args.keyfile)
+
+    logging.basicConfig(level=logging.INFO)
+    server = LocalRithmicServer(host=args.host, port=args.port, rate=args.rate,
+                                trade_ratio=args.trade_ratio, book_ratio=args.book_ratio,
+                                burst_size=args.burst_size,
+                                burst_interval=args.burst_interval, latency=args.latency,
+                                jitter=args.jitter, heartbeat_interval=args.heartbeat_interval,
+                                num_bars=args.num_bars, num_accounts=args.num_accounts,
+                                ssl_context=ssl_context)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#   ===========================================================================
+#   Message reuse for hot-path decoding.  Instead of allocating a message per
+#   frame, a MessagePool keeps one preallocated message per class and
+#   refills it, which ParseFromString() does by clearing it first.
+#
+#   REUSE      the handler gets the pooled message itself; it is only valid
+#              until the next frame of the same class is decoded, so this
+#              suits handlers that finish with it before returning
+#   SNAPSHOT   the pooled message is copied into an immutable namedtuple
+#              of all its fields (repeated fields as tuples), which is safe
+#              to keep, e.g. in a queue or across an await
+#
+#   Decoders given by a WireCodec for its market data templates already
+#   return namedtuples, so they are used as they are in either mode.
+
+import collections
+import operator
+
+from rithmic_api import codec as codecs
+
+REUSE = "reuse"
+SNAPSHOT = "snapshot"
+
+
+class MessagePool:
+    """Preallocated messages, one per class, refilled frame after frame."""
+
+    def __init__(self, codec=None):
+        self.codec = codec or codecs.default()
+        self.allocated = 0
+        self.decoded = 0
+        self.snapshots = 0
+        self._messages = {}
+        self._snapshot_types = {}
+
+    def message(self, message_class):
+        """Return the pooled message for message_class, allocating it once."""
+        msg = self._messages.get(message_class)
+        if msg is None:
+            msg = self.codec.message_class(message_class)()
+            self._messages[message_class] = msg
+            self.allocated += 1
+        return msg
+
+    def decoder(self, message_class, mode=REUSE):
+        """Return a callable decoding msg_buf into the pooled message_class."""
+        if mode not in (REUSE, SNAPSHOT):
+            raise ValueError(f"unknown reuse mode {mode!r}")
+        decodes = getattr(self.codec, "decodes", None)
+        if decodes is not None and decodes(message_class):
+            return self.codec.decoder(message_class)
+
+        msg = self.message(message_class)
+        parse = msg.ParseFromString
+
+        if mode == REUSE:
+            def decode(msg_buf):
+                parse(msg_buf)
+                self.decoded += 1
+                return msg
+            return decode
+
+        record_class, fields, repeated = self._snapshot_type(message_class)
+        make = record_class._make
+
+        def decode(msg_buf):
+            parse(msg_buf)
+            self.decoded += 1
+            self.snapshots += 1
+            values = fields(msg)
+            if repeated:
+                values = list(values)
+                for index in repeated:
+                    values[index] = tuple(values[index])
+            return make(values)
+        return decode
+
+    def snapshot(self, msg):
+        """Return an immutable copy of msg, which may be a pooled message."""
+        record_class, fields, repeated = self._snapshot_type(type(msg))
+        values = list(fields(msg))
+        for index in repeated:
+            values[index] = tuple(values[index])
+        self.snapshots += 1
+        return record_class._make(values)
+
+    def stats(self):
+        return {
+            "allocated": self.allocated,
+            "decoded": self.decoded,
+            "snapshots": self.snapshots,
+            "classes": sorted(cls.__name__ for cls in self._messages),
+        }
+
+    def _snapshot_type(self, message_class):
+        entry = self._snapshot_types.get(message_class)
+        if entry is None:
+            from google.protobuf.descriptor import FieldDescriptor
+
+            descriptor = message_class.DESCRIPTOR
+            names = [field.name for field in descriptor.fields]
+            repeated = tuple(index for index, field in enumerate(descriptor.fields)
+                             if field.label == FieldDescriptor.LABEL_REPEATED)
+            if any(field.type == FieldDescriptor.TYPE_MESSAGE for field in descriptor.fields):
+                raise ValueError(f"{descriptor.name} has message fields and cannot be snapshotted")
+            record_class = collections.namedtuple(descriptor.name + "Snapshot", names)
+            fields = operator.attrgetter(*names) if len(names) > 1 else _single(names[0])
+            entry = (record_class, fields, repeated)
+            self._snapshot_types[message_class] = entry
+        return entry
+
+
+def _single(name):
+    get = operator.attrgetter(name)
+    return lambda msg: (get(msg),)
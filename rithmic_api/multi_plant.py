@@ -0,0 +1,108 @@
+import asyncio
+import contextlib
+import logging
+import time
+
+from rithmic_api.session import HISTORY_PLANT, ORDER_PLANT, PNL_PLANT, TICKER_PLANT, RithmicSession
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PLANTS = (
+    TICKER_PLANT,
+    ORDER_PLANT,
+    HISTORY_PLANT,
+)
+
+
+class PlantSessions:
+    """The logged-in sessions of one user, one per plant.
+
+    Sessions are looked up by SysInfraType, e.g. plants[ORDER_PLANT], or
+    through the ticker/order/history/pnl properties.
+    """
+
+    def __init__(self, sessions, pool=None, login_seconds=None):
+        self.sessions = dict(sessions)
+        self.pool = pool
+        self.login_seconds = login_seconds
+
+    def __getitem__(self, infra_type):
+        return self.sessions[infra_type]
+
+    def __contains__(self, infra_type):
+        return infra_type in self.sessions
+
+    @property
+    def ticker(self):
+        return self.sessions.get(TICKER_PLANT)
+
+    @property
+    def order(self):
+        return self.sessions.get(ORDER_PLANT)
+
+    @property
+    def history(self):
+        return self.sessions.get(HISTORY_PLANT)
+
+    @property
+    def pnl(self):
+        return self.sessions.get(PNL_PLANT)
+
+    async def close(self, discard=False):
+        """Return the sessions to their pool, or close them if there is none."""
+        sessions, self.sessions = self.sessions, {}
+        await asyncio.gather(*(_finish(session, self.pool, discard) for session in sessions.values()))
+
+    def stats(self):
+        return {
+            "login_seconds": self.login_seconds,
+            "plants": sorted(self.sessions),
+        }
+
+
+async def _finish(session, pool, discard=False):
+    if pool is None:
+        await session.close()
+    elif discard:
+        await pool.discard(session)
+    else:
+        await pool.release(session)
+
+
+async def open_plants(uri, system_name, user_id, password, infra_types=DEFAULT_PLANTS, pool=None):
+    """Log in to every plant in infra_types concurrently.
+
+    Sessions come from pool when one is given, so warm plants are reused.
+    If any login fails the others are closed again and the first error is
+    raised.
+    """
+    infra_types = list(dict.fromkeys(infra_types))
+    if pool is not None:
+        logins = [pool.acquire(uri, system_name, user_id, password, infra_type) for infra_type in infra_types]
+    else:
+        logins = [RithmicSession.open(uri, system_name, user_id, password, infra_type) for infra_type in infra_types]
+
+    started = time.monotonic()
+    results = await asyncio.gather(*logins, return_exceptions=True)
+    login_seconds = time.monotonic() - started
+
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        opened = [r for r in results if not isinstance(r, BaseException)]
+        await asyncio.gather(*(_finish(session, pool, discard=True) for session in opened))
+        raise errors[0]
+
+    logger.info("Logged in to %s plants for %s in %.3fs", len(results), user_id, login_seconds)
+    return PlantSessions(zip(infra_types, results), pool, login_seconds)
+
+
+@contextlib.asynccontextmanager
+async def plants(uri, system_name, user_id, password, infra_types=DEFAULT_PLANTS, pool=None):
+    """open_plants() for the duration of an ``async with`` block."""
+    sessions = await open_plants(uri, system_name, user_id, password, infra_types, pool)
+    try:
+        yield sessions
+    except BaseException:
+        await sessions.close(discard=True)
+        raise
+    await sessions.close()
@@ -0,0 +1,586 @@
+#   ===========================================================================
+#   Depth of market.  Subscribing with the ORDER_BOOK update bit makes the
+#   ticker plant send OrderBook messages (template 156): an image of the
+#   book by price level, then updates that each set the size of a few
+#   levels, a size of 0 removing the level.
+#
+#   The generated order_book_pb2 module is not part of this project, so
+#   OrderBook frames are read (and, for the local server and benchmarks,
+#   written) straight from the wire format here, with the field numbers of
+#   the R | Protocol reference.  Only the fields the book needs are read.
+#
+#   Each side of a book is a Ladder: the size and order count of every
+#   tick in a window of contiguous numpy arrays, indexed by tick rather
+#   than by price in a dict.  Setting a level is an array store, the best
+#   level is tracked as updates come in, and the top N levels are found
+#   with one vectorised scan outward from the best one.
+#
+#          books = OrderBooks(tick_sizes={("CME", "ESZ6"): 0.25})
+#          consumer = manager.consumer(ORDER_BOOK, books.update_buf, "depth")
+#          await consumer.subscribe("CME", "ESZ6")
+#          ...
+#          books.get("CME", "ESZ6").top(5)
+
+import collections
+import logging
+import struct
+import time
+
+import numpy as np
+
+from rithmic_api import wire
+
+logger = logging.getLogger(__name__)
+
+ORDER_BOOK = 156
+
+#   OrderBook.PresenceBits
+BID = 1
+ASK = 2
+
+#   OrderBook.UpdateType
+CLEAR_ORDER_BOOK = 1
+NO_BOOK = 2
+SNAPSHOT_IMAGE = 3
+BEGIN = 4
+MIDDLE = 5
+END = 6
+SOLO = 7
+
+#   OrderBook field numbers
+_SYMBOL = 110100
+_EXCHANGE = 110101
+_UPDATE_TYPE = 110121
+_PRESENCE_BITS = 149138
+_SSBOE = 150100
+_USECS = 150101
+_BID_PRICE = 154282
+_BID_SIZE = 154283
+_ASK_PRICE = 154284
+_ASK_SIZE = 154285
+_BID_ORDERS = 154401
+_ASK_ORDERS = 154402
+_TEMPLATE_ID = 154467
+
+_DOUBLE = struct.Struct("<d")
+
+OrderBookUpdate = collections.namedtuple("OrderBookUpdate", (
+    "symbol", "exchange", "presence_bits", "update_type",
+    "bid_price", "bid_size", "bid_orders", "ask_price", "ask_size", "ask_orders",
+    "ssboe", "usecs"))
+
+#   repeated fields : index in OrderBookUpdate
+_REPEATED = {
+    _BID_PRICE: 4, _BID_SIZE: 5, _BID_ORDERS: 6,
+    _ASK_PRICE: 7, _ASK_SIZE: 8, _ASK_ORDERS: 9,
+}
+_SCALARS = {_PRESENCE_BITS: 2, _UPDATE_TYPE: 3, _SSBOE: 10, _USECS: 11}
+
+
+def _signed(value):
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def decode(buf):
+    """Decode an OrderBook frame into an OrderBookUpdate.
+
+    Repeated fields come as lists, in either packed or unpacked form.
+    Raises wire.WireError if the frame is malformed.
+    """
+    try:
+        return _decode(buf)
+    except (IndexError, struct.error):
+        raise wire.WireError("truncated OrderBook message") from None
+
+
+def _decode(buf):
+    values = [None, None, 0, 0, [], [], [], [], [], [], 0, 0]
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        # every OrderBook field number takes a three byte tag
+        b0 = buf[pos]
+        if b0 & 0x80 and pos + 2 < end and buf[pos + 1] & 0x80 and not buf[pos + 2] & 0x80:
+            tag = (b0 & 0x7f) | (buf[pos + 1] & 0x7f) << 7 | buf[pos + 2] << 14
+            pos += 3
+        else:
+            tag, pos = wire.read_varint(buf, pos)
+        field_number = tag >> 3
+        wire_type = tag & 7
+
+        index = _REPEATED.get(field_number)
+        if index is not None:
+            if wire_type == wire.WIRETYPE_FIXED64:
+                values[index].append(_DOUBLE.unpack_from(buf, pos)[0])
+                pos += 8
+            elif wire_type == wire.WIRETYPE_VARINT:
+                b = buf[pos]
+                if b < 0x80:
+                    values[index].append(b)
+                    pos += 1
+                else:
+                    value, pos = wire.read_varint(buf, pos)
+                    values[index].append(_signed(value))
+            elif wire_type == wire.WIRETYPE_LENGTH_DELIMITED:
+                length, pos = wire.read_varint(buf, pos)
+                _unpack(buf, pos, pos + length, field_number, values[index])
+                pos += length
+            else:
+                raise wire.WireError(f"field {field_number} has wire type {wire_type}")
+            continue
+
+        if field_number == _SYMBOL or field_number == _EXCHANGE:
+            length, pos = wire.read_varint(buf, pos)
+            values[0 if field_number == _SYMBOL else 1] = bytes(buf[pos:pos + length]).decode("utf-8")
+            pos += length
+            continue
+
+        index = _SCALARS.get(field_number)
+        if index is not None and wire_type == wire.WIRETYPE_VARINT:
+            value, pos = wire.read_varint(buf, pos)
+            values[index] = _signed(value)
+            continue
+
+        pos = wire.skip_field(buf, pos, wire_type)
+    if pos > end:
+        raise wire.WireError("truncated OrderBook message")
+    return OrderBookUpdate._make(values)
+
+
+def _unpack(buf, pos, end, field_number, out):
+    if field_number == _BID_PRICE or field_number == _ASK_PRICE:
+        count = (end - pos) // 8
+        out.extend(struct.unpack_from(f"<{count}d", buf, pos))
+        return
+    while pos < end:
+        value, pos = wire.read_varint(buf, pos)
+        out.append(_signed(value))
+
+
+_TAGS = {field_number: wire.encode_tag(field_number, wire_type) for field_number, wire_type in (
+    (_SYMBOL, wire.WIRETYPE_LENGTH_DELIMITED), (_EXCHANGE, wire.WIRETYPE_LENGTH_DELIMITED),
+    (_UPDATE_TYPE, wire.WIRETYPE_VARINT), (_PRESENCE_BITS, wire.WIRETYPE_VARINT),
+    (_SSBOE, wire.WIRETYPE_VARINT), (_USECS, wire.WIRETYPE_VARINT),
+    (_BID_PRICE, wire.WIRETYPE_FIXED64), (_BID_SIZE, wire.WIRETYPE_VARINT),
+    (_ASK_PRICE, wire.WIRETYPE_FIXED64), (_ASK_SIZE, wire.WIRETYPE_VARINT),
+    (_BID_ORDERS, wire.WIRETYPE_VARINT), (_ASK_ORDERS, wire.WIRETYPE_VARINT),
+    (_TEMPLATE_ID, wire.WIRETYPE_VARINT))}
+
+
+def encode(exchange, symbol, update_type, bids=(), asks=(), ssboe=None, usecs=None):
+    """Serialize an OrderBook message; bids and asks are (price, size, orders) levels.
+
+    Fields are written in field number order, unpacked, as the protobuf
+    runtime writes a proto2 message.
+    """
+    tags = _TAGS
+    out = bytearray()
+    for field_number, text in ((_SYMBOL, symbol), (_EXCHANGE, exchange)):
+        encoded = text.encode("utf-8")
+        out += tags[field_number] + wire.encode_varint(len(encoded)) + encoded
+    presence_bits = (BID if bids else 0) | (ASK if asks else 0)
+    out += tags[_UPDATE_TYPE] + wire.encode_varint(update_type)
+    out += tags[_PRESENCE_BITS] + wire.encode_varint(presence_bits)
+    if ssboe is not None:
+        out += tags[_SSBOE] + wire.encode_varint(ssboe)
+        out += tags[_USECS] + wire.encode_varint(usecs or 0)
+    for field_number, levels, column in ((_BID_PRICE, bids, 0), (_BID_SIZE, bids, 1),
+                                         (_ASK_PRICE, asks, 0), (_ASK_SIZE, asks, 1),
+                                         (_BID_ORDERS, bids, 2), (_ASK_ORDERS, asks, 2)):
+        tag = tags[field_number]
+        for level in levels:
+            if column == 0:
+                out += tag + _DOUBLE.pack(level[0])
+            else:
+                out += tag + wire.encode_varint(level[column])
+    out += tags[_TEMPLATE_ID] + wire.encode_varint(ORDER_BOOK)
+    return bytes(out)
+
+
+#   ===========================================================================
+#   The book.
+
+_NO_SLOTS = np.zeros(0, np.intp)
+
+
+class Ladder:
+    """One side of a book: size and order count per tick, in contiguous arrays.
+
+    Slot i holds the level at tick base + i.  When a level falls outside
+    the window it is re-centred on the levels it holds, and doubled in
+    size if they do not fit, up to max_capacity ticks.
+    """
+
+    __slots__ = ("is_bid", "base", "sizes", "orders", "best", "levels", "max_capacity", "dropped")
+
+    def __init__(self, is_bid, capacity=1024, max_capacity=1 << 20):
+        self.is_bid = is_bid
+        self.base = None
+        self.sizes = np.zeros(capacity, np.int64)
+        self.orders = np.zeros(capacity, np.int64)
+        self.best = -1          # slot of the best level, -1 when empty
+        self.levels = 0
+        self.max_capacity = max_capacity
+        self.dropped = 0
+
+    def __len__(self):
+        return self.levels
+
+    def set(self, tick, size, orders=0):
+        """Set the level at tick; a size of 0 removes it."""
+        base = self.base
+        i = tick - base if base is not None else -1
+        sizes = self.sizes
+        if not 0 <= i < len(sizes):
+            if size <= 0:
+                # no level can be held outside the window, nothing to remove
+                return
+            i = self._make_room(tick, tick)
+            if i < 0:
+                return
+            sizes = self.sizes
+        if size > 0:
+            if not sizes[i]:
+                self.levels += 1
+            sizes[i] = size
+            self.orders[i] = orders
+            best = self.best
+            if best < 0 or (i > best if self.is_bid else i < best):
+                self.best = i
+        elif sizes[i]:
+            sizes[i] = 0
+            self.orders[i] = 0
+            self.levels -= 1
+            if i == self.best:
+                self.best = self._next_best(i)
+
+    def load(self, ticks, sizes, orders):
+        """Set many levels at once from arrays, as a snapshot does."""
+        if not len(ticks):
+            return
+        lo = int(ticks.min())
+        hi = int(ticks.max())
+        base = self.base
+        if base is None or lo < base or hi >= base + len(self.sizes):
+            if self._make_room(lo, hi) < 0:
+                # keep what fits around the levels held, or the lowest one
+                if self.base is None:
+                    self._make_room(lo, lo)
+                keep = (ticks >= self.base) & (ticks < self.base + len(self.sizes))
+                ticks, sizes, orders = ticks[keep], sizes[keep], orders[keep]
+        slots = ticks - self.base
+        self.sizes[slots] = sizes
+        self.orders[slots] = np.where(sizes > 0, orders, 0)
+        self._recount()
+
+    def clear(self):
+        if self.levels:
+            self.sizes[:] = 0
+            self.orders[:] = 0
+        self.levels = 0
+        self.best = -1
+
+    def best_tick(self):
+        return self.base + self.best if self.best >= 0 else None
+
+    def size_at(self, tick):
+        i = tick - self.base if self.base is not None else -1
+        return int(self.sizes[i]) if 0 <= i < len(self.sizes) else 0
+
+    def top(self, n):
+        """Slots of the n best levels, best first."""
+        best = self.best
+        if best < 0 or n <= 0:
+            return _NO_SLOTS
+        sizes = self.sizes
+        capacity = len(sizes)
+        want = min(n, self.levels)
+        width = 4 * n + 16
+        while True:
+            if self.is_bid:
+                lo = max(0, best + 1 - width)
+                slots = sizes[lo:best + 1].nonzero()[0][::-1] + lo
+                exhausted = lo == 0
+            else:
+                hi = min(capacity, best + width)
+                slots = sizes[best:hi].nonzero()[0] + best
+                exhausted = hi == capacity
+            if len(slots) >= want or exhausted:
+                return slots[:n]
+            width *= 4
+
+    def _next_best(self, i):
+        """The best level behind slot i, which has just been emptied."""
+        if not self.levels:
+            return -1
+        sizes = self.sizes
+        width = 64
+        while True:
+            if self.is_bid:
+                lo = max(0, i - width)
+                found = sizes[lo:i].nonzero()[0]
+                if len(found):
+                    return lo + int(found[-1])
+                if lo == 0:
+                    return -1
+            else:
+                hi = min(len(sizes), i + 1 + width)
+                found = sizes[i + 1:hi].nonzero()[0]
+                if len(found):
+                    return i + 1 + int(found[0])
+                if hi == len(sizes):
+                    return -1
+            width *= 4
+
+    def _recount(self):
+        occupied = np.flatnonzero(self.sizes)
+        self.levels = len(occupied)
+        if not self.levels:
+            self.best = -1
+        else:
+            self.best = int(occupied[-1] if self.is_bid else occupied[0])
+
+    def _make_room(self, lo, hi):
+        """Move or grow the window so that ticks lo..hi fit; returns the slot of lo, or -1."""
+        capacity = len(self.sizes)
+        if self.levels:
+            occupied = np.flatnonzero(self.sizes)
+            lo_tick = min(lo, self.base + int(occupied[0]))
+            hi_tick = max(hi, self.base + int(occupied[-1]))
+        else:
+            lo_tick, hi_tick = lo, hi
+        needed = hi_tick - lo_tick + 1
+        if needed > self.max_capacity:
+            self.dropped += 1
+            logger.warning("Dropping depth at ticks %s..%s, %s ticks away from the book",
+                           lo, hi, needed)
+            return -1
+        new_capacity = capacity
+        while new_capacity < needed:
+            new_capacity *= 2
+        new_base = lo_tick - (new_capacity - needed) // 2
+        sizes = np.zeros(new_capacity, np.int64)
+        orders = np.zeros(new_capacity, np.int64)
+        if self.levels:
+            # copy the occupied span of the old window
+            first = int(occupied[0])
+            last = int(occupied[-1]) + 1
+            shift = self.base - new_base
+            sizes[first + shift:last + shift] = self.sizes[first:last]
+            orders[first + shift:last + shift] = self.orders[first:last]
+            self.best += shift
+        self.sizes = sizes
+        self.orders = orders
+        self.base = new_base
+        return lo - new_base
+
+
+class OrderBook:
+    """The depth of one (exchange, symbol), by price level.
+
+    Prices are mapped to ticks with tick_size; a price that is not a
+    multiple of it is counted in off_tick and put on the nearest tick.
+    consistent is False between the BEGIN and END of an update the plant
+    split over several messages, when the book is only partly updated.
+    """
+
+    def __init__(self, exchange, symbol, tick_size, capacity=1024):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.tick_size = tick_size
+        self.bids = Ladder(True, capacity)
+        self.asks = Ladder(False, capacity)
+        self.consistent = True
+        self.updates = 0
+        self.snapshots = 0
+        self.off_tick = 0
+        self.received_at = None
+        self.ssboe = None
+        self.usecs = None
+        self._in_snapshot = False
+        self._inverse = 1.0 / tick_size
+
+    def apply(self, msg):
+        """Apply a decoded OrderBook update (or any object with its fields)."""
+        update_type = msg.update_type
+        if update_type == SNAPSHOT_IMAGE:
+            # an image may take several messages; the first one starts afresh
+            if not self._in_snapshot:
+                self.bids.clear()
+                self.asks.clear()
+                self._in_snapshot = True
+                self.snapshots += 1
+            self._load(self.bids, msg.bid_price, msg.bid_size, msg.bid_orders)
+            self._load(self.asks, msg.ask_price, msg.ask_size, msg.ask_orders)
+            self.consistent = True
+        else:
+            self._in_snapshot = False
+            if update_type == CLEAR_ORDER_BOOK or update_type == NO_BOOK:
+                self.bids.clear()
+                self.asks.clear()
+                self.consistent = True
+            else:
+                if msg.bid_price:
+                    self._set(self.bids, msg.bid_price, msg.bid_size, msg.bid_orders)
+                if msg.ask_price:
+                    self._set(self.asks, msg.ask_price, msg.ask_size, msg.ask_orders)
+                self.consistent = update_type != BEGIN and update_type != MIDDLE
+        if msg.ssboe:
+            self.ssboe = msg.ssboe
+            self.usecs = msg.usecs
+        self.received_at = time.time()
+        self.updates += 1
+
+    def tick(self, price):
+        x = price * self._inverse
+        tick = round(x)
+        if abs(x - tick) > 1e-6:
+            self.off_tick += 1
+        return tick
+
+    def price(self, tick):
+        return tick * self.tick_size
+
+    def best_bid(self):
+        """(price, size) of the best bid, or None."""
+        return self._best(self.bids)
+
+    def best_ask(self):
+        return self._best(self.asks)
+
+    def top(self, n=10):
+        """The n best levels of each side, best first, as (price, size, orders) lists."""
+        return {"bids": self._levels(self.bids, n), "asks": self._levels(self.asks, n)}
+
+    def depth(self, n=10):
+        """top() as arrays: (bid prices, bid sizes, ask prices, ask sizes)."""
+        bids = self.bids
+        asks = self.asks
+        bid_slots = bids.top(n)
+        ask_slots = asks.top(n)
+        return ((bid_slots + bids.base) * self.tick_size if len(bid_slots) else np.zeros(0),
+                bids.sizes[bid_slots],
+                (ask_slots + asks.base) * self.tick_size if len(ask_slots) else np.zeros(0),
+                asks.sizes[ask_slots])
+
+    def as_dict(self, n=10):
+        return {
+            "exchange": self.exchange,
+            "symbol": self.symbol,
+            "consistent": self.consistent,
+            "received_at": self.received_at,
+            **self.top(n),
+        }
+
+    def _set(self, ladder, prices, sizes, orders):
+        inverse = self._inverse
+        num_sizes = len(sizes)
+        num_orders = len(orders)
+        for i, price in enumerate(prices):
+            x = price * inverse
+            tick = round(x)
+            if abs(x - tick) > 1e-6:
+                self.off_tick += 1
+            ladder.set(tick, sizes[i] if i < num_sizes else 0, orders[i] if i < num_orders else 0)
+
+    def _load(self, ladder, prices, sizes, orders):
+        if not prices:
+            return
+        x = np.asarray(prices, np.float64) * self._inverse
+        ticks = np.rint(x).astype(np.int64)
+        self.off_tick += int(np.count_nonzero(np.abs(x - ticks) > 1e-6))
+        count = len(ticks)
+        sizes = np.asarray(sizes[:count], np.int64)
+        orders = np.asarray(orders[:count], np.int64)
+        if len(sizes) < count:
+            sizes = np.concatenate((sizes, np.zeros(count - len(sizes), np.int64)))
+        if len(orders) < count:
+            orders = np.concatenate((orders, np.zeros(count - len(orders), np.int64)))
+        ladder.load(ticks, sizes, orders)
+
+    def _best(self, ladder):
+        if ladder.best < 0:
+            return None
+        return (ladder.base + ladder.best) * self.tick_size, int(ladder.sizes[ladder.best])
+
+    def _levels(self, ladder, n):
+        slots = ladder.top(n)
+        if not len(slots):
+            return []
+        prices = ((slots + ladder.base) * self.tick_size).tolist()
+        return list(zip(prices, ladder.sizes[slots].tolist(), ladder.orders[slots].tolist()))
+
+
+class OrderBooks:
+    """Per-instrument order books, kept up to date from OrderBook frames.
+
+    Feed it with update() (a decoded OrderBookUpdate), update_buf() (raw
+    frames, e.g. as a subscriptions callback), or attach(reader) to follow
+    a MessageReader.  tick_sizes maps (exchange, symbol) to the price
+    increment of the instrument; others use default_tick_size.
+    """
+
+    def __init__(self, tick_sizes=None, default_tick_size=0.01, capacity=1024):
+        self.tick_sizes = dict(tick_sizes or {})
+        self.default_tick_size = default_tick_size
+        self.capacity = capacity
+        self.updates = 0
+        self.malformed = 0
+        self._books = {}
+        self._reader = None
+
+    def update(self, template_id, msg):
+        """Apply msg to its instrument's book; returns the OrderBook."""
+        if template_id != ORDER_BOOK:
+            return None
+        key = (msg.exchange, msg.symbol)
+        book = self._books.get(key)
+        if book is None:
+            tick_size = self.tick_sizes.get(key, self.default_tick_size)
+            book = self._books[key] = OrderBook(msg.exchange, msg.symbol, tick_size, self.capacity)
+        book.apply(msg)
+        self.updates += 1
+        return book
+
+    def update_buf(self, template_id, msg_buf):
+        if template_id != ORDER_BOOK:
+            return None
+        try:
+            msg = decode(msg_buf)
+        except wire.WireError as e:
+            self.malformed += 1
+            logger.warning("Dropping malformed frame: %s", e)
+            return None
+        return self.update(template_id, msg)
+
+    def get(self, exchange, symbol):
+        return self._books.get((exchange, symbol))
+
+    def __len__(self):
+        return len(self._books)
+
+    def __contains__(self, key):
+        return key in self._books
+
+    def books(self):
+        return list(self._books.values())
+
+    def attach(self, reader):
+        """Follow every OrderBook frame reader receives."""
+        self._reader = reader
+        reader.add_callback(ORDER_BOOK, self.update_buf)
+        return self
+
+    def detach(self):
+        if self._reader is not None:
+            self._reader.remove_callback(ORDER_BOOK, self.update_buf)
+            self._reader = None
+
+    def stats(self):
+        return {
+            "instruments": len(self._books),
+            "updates": self.updates,
+            "malformed": self.malformed,
+            "off_tick": sum(book.off_tick for book in self._books.values()),
+            "dropped": sum(book.bids.dropped + book.asks.dropped for book in self._books.values()),
+        }
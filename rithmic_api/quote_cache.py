@@ -0,0 +1,144 @@
+#   ===========================================================================
+#   Process-wide top-of-book cache.  Live BestBidOffer and LastTrade streams
+#   are followed on the session pool's background loop and merged into a
+#   quote_state.QuoteState; readers on any thread, Django views included,
+#   get the latest bid/ask/last straight from memory, with the time of the
+#   last update and how old it is, without touching the network.
+#
+#          run_coroutine(cache.follow(uri, system_name, user_id, password,
+#                                     [("CME", "ESZ6"), ("CME", "NQZ6")]))
+#          cache.quote("CME", "ESZ6")
+
+import asyncio
+import hmac
+import time
+
+from rithmic_api.quote_state import QuoteState
+from rithmic_api.session import digest_password
+from rithmic_api.session_pool import pool
+from rithmic_api.subscriptions import BBO, LAST_TRADE, SubscriptionManager
+
+
+def _timestamp(ssboe, usecs):
+    if not ssboe:
+        return None
+    return ssboe + (usecs or 0) / 1e6
+
+
+class _Feed:
+    """A pooled ticker plant session subscribed on behalf of the cache."""
+
+    def __init__(self, session, manager, consumer, password_digest):
+        self.session = session
+        self.manager = manager
+        self.consumer = consumer
+        self.password_digest = password_digest
+
+
+class QuoteCache:
+    """Latest quotes and trades, fed by live subscriptions, read from memory.
+
+    follow() and close() run on the pool's event loop (through
+    session_pool.run_coroutine() from other threads); quote(), quotes()
+    and stats() may be called from any thread.  A quote is stale once
+    max_age seconds have passed since its instrument last updated.
+    """
+
+    def __init__(self, max_age=5.0, update_bits=LAST_TRADE | BBO):
+        self.max_age = max_age
+        self.update_bits = update_bits
+        self.state = QuoteState()
+        self._feeds = {}
+        self._lock = None
+
+    async def follow(self, uri, system_name, user_id, password, instruments):
+        """Subscribe to (exchange, symbol) pairs on a pooled session for this user.
+
+        Like the session pool, an existing feed is only used by a caller
+        presenting the password it was opened with; anyone else gets a
+        PermissionError.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        key = (uri, system_name, user_id)
+        digest = digest_password(password)
+        async with self._lock:
+            feed = self._feeds.get(key)
+            if feed is None:
+                session = await pool.acquire(uri, system_name, user_id, password)
+                manager = SubscriptionManager([session])
+                consumer = manager.consumer(self.update_bits, self.state.update_buf, "quote_cache")
+                feed = self._feeds[key] = _Feed(session, manager, consumer, digest)
+            elif not hmac.compare_digest(feed.password_digest, digest):
+                raise PermissionError(f"wrong password for {user_id} on {system_name}")
+        await feed.consumer.subscribe_many(instruments)
+
+    async def unfollow(self, instruments):
+        """Stop following (exchange, symbol) pairs; their last quotes stay readable."""
+        for feed in list(self._feeds.values()):
+            await asyncio.gather(*(feed.consumer.release(exchange, symbol) for exchange, symbol in instruments))
+
+    async def close(self):
+        """Unsubscribe everything and hand the sessions back to the pool."""
+        feeds, self._feeds = self._feeds, {}
+        for feed in feeds.values():
+            await feed.manager.close()
+            await pool.release(feed.session)
+
+    def quote(self, exchange, symbol, now=None):
+        """Return the latest quote and trade of an instrument as a dict, or None."""
+        state = self.state.get(exchange, symbol)
+        if state is None:
+            return None
+        if now is None:
+            now = time.time()
+        # read each record once; they are replaced, never changed, by updates
+        quote = state.quote
+        trade = state.trade
+        received_at = state.received_at
+        age = now - received_at if received_at is not None else None
+        return {
+            "exchange": exchange,
+            "symbol": symbol,
+            "bid_price": quote.bid_price,
+            "bid_size": quote.bid_size,
+            "ask_price": quote.ask_price,
+            "ask_size": quote.ask_size,
+            "quote_time": _timestamp(quote.ssboe, quote.usecs),
+            "last_price": trade.trade_price,
+            "last_size": trade.trade_size,
+            "volume": trade.volume,
+            "trade_time": _timestamp(trade.ssboe, trade.usecs),
+            "received_at": received_at,
+            "age_seconds": age,
+            "stale": age is None or age > self.max_age,
+        }
+
+    def instruments(self):
+        """The (exchange, symbol) pairs with a cached quote."""
+        return [(state.exchange, state.symbol) for state in self.state.instruments()]
+
+    def quotes(self, instruments):
+        """quote() for many (exchange, symbol) pairs; returns (found, missing)."""
+        now = time.time()
+        found = []
+        missing = []
+        for exchange, symbol in instruments:
+            quote = self.quote(exchange, symbol, now)
+            if quote is None:
+                missing.append(f"{exchange}:{symbol}")
+            else:
+                found.append(quote)
+        return found, missing
+
+    def stats(self):
+        return {
+            "max_age": self.max_age,
+            "feeds": len(self._feeds),
+            "following": sum(len(feed.manager) for feed in list(self._feeds.values())),
+            **self.state.stats(),
+        }
+
+
+#   the process-wide cache, fed on the session pool's loop
+cache = QuoteCache()
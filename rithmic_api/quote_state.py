@@ -0,0 +1,209 @@
+#   ===========================================================================
+#   Latest quote and trade per instrument, merged from BestBidOffer and
+#   LastTrade updates the way the R | Protocol means them to be read:
+#
+#   - presence_bits says which groups of fields an update carries; groups
+#     it does not carry keep their previous values, rather than being read
+#     as zeros
+#   - clear_bits says which groups no longer have a value (an empty side of
+#     the book, say); their fields become None
+#   - an update with is_snapshot set replaces the state wholesale, so any
+#     group missing from it is cleared
+#
+#   The quote and trade of an instrument are immutable namedtuples that are
+#   replaced, never modified, by each update, so a reader always gets a
+#   consistent pair of values with a single attribute lookup, from any
+#   thread.
+
+import collections
+import logging
+import time
+
+from rithmic_api import decoders, wire
+
+logger = logging.getLogger(__name__)
+
+LAST_TRADE = 150
+BEST_BID_OFFER = 151
+
+#   BestBidOffer.PresenceBits, and the fields each one covers
+QUOTE_GROUPS = (
+    (1, ("bid_price", "bid_size", "bid_orders", "bid_implicit_size", "bid_time")),     # BID
+    (2, ("ask_price", "ask_size", "ask_orders", "ask_implicit_size", "ask_time")),     # ASK
+    (4, ("lean_price",)),                                                              # LEAN_PRICE
+)
+
+#   LastTrade.PresenceBits, and the fields each one covers
+TRADE_GROUPS = (
+    (1, ("trade_price", "trade_size", "aggressor", "exchange_order_id",
+         "aggressor_exchange_order_id", "trade_time")),                                # LAST_TRADE
+    (2, ("net_change",)),                                                              # NET_CHANGE
+    (4, ("percent_change",)),                                                          # PRECENT_CHANGE
+    (8, ("volume",)),                                                                  # VOLUME
+    (16, ("vwap",)),                                                                   # VWAP
+)
+
+_STAMP = ("ssboe", "usecs")
+
+Quote = collections.namedtuple("Quote", [f for _, fields in QUOTE_GROUPS for f in fields] + list(_STAMP))
+Trade = collections.namedtuple("Trade", [f for _, fields in TRADE_GROUPS for f in fields] + list(_STAMP))
+
+EMPTY_QUOTE = Quote._make([None] * len(Quote._fields))
+EMPTY_TRADE = Trade._make([None] * len(Trade._fields))
+
+_HEADER = ("symbol", "exchange", "presence_bits", "clear_bits", "is_snapshot")
+
+#   partial decoders for exactly the fields the state needs
+DECODERS = {
+    BEST_BID_OFFER: decoders.FieldDecoder(BEST_BID_OFFER, _HEADER + Quote._fields),
+    LAST_TRADE: decoders.FieldDecoder(LAST_TRADE, _HEADER + Trade._fields),
+}
+
+
+class _Merger:
+    """Merges one template's updates into a Quote or Trade."""
+
+    def __init__(self, record_class, groups):
+        self.record_class = record_class
+        index = {name: i for i, name in enumerate(record_class._fields)}
+        self.groups = [(bit, [(index[name], name) for name in fields]) for bit, fields in groups]
+        self.stamp = [(index[name], name) for name in _STAMP]
+
+    def merge(self, current, msg):
+        presence_bits = msg.presence_bits
+        if msg.is_snapshot:
+            values = [None] * len(current)
+        else:
+            values = list(current)
+            clear_bits = msg.clear_bits
+            if clear_bits:
+                for bit, fields in self.groups:
+                    if clear_bits & bit:
+                        for i, _ in fields:
+                            values[i] = None
+        for bit, fields in self.groups:
+            if presence_bits & bit:
+                for i, name in fields:
+                    values[i] = getattr(msg, name)
+        for i, name in self.stamp:
+            values[i] = getattr(msg, name)
+        return self.record_class._make(values)
+
+
+_MERGERS = {
+    BEST_BID_OFFER: _Merger(Quote, QUOTE_GROUPS),
+    LAST_TRADE: _Merger(Trade, TRADE_GROUPS),
+}
+
+
+class InstrumentState:
+    """The latest quote and trade of one (exchange, symbol).
+
+    received_at is the local time.time() of the last update of either.
+    """
+
+    __slots__ = ("exchange", "symbol", "quote", "trade", "quote_updates", "trade_updates", "received_at")
+
+    def __init__(self, exchange, symbol):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.quote = EMPTY_QUOTE
+        self.trade = EMPTY_TRADE
+        self.quote_updates = 0
+        self.trade_updates = 0
+        self.received_at = None
+
+    def as_dict(self):
+        return {
+            "exchange": self.exchange,
+            "symbol": self.symbol,
+            "quote": self.quote._asdict(),
+            "trade": self.trade._asdict(),
+            "received_at": self.received_at,
+        }
+
+
+class QuoteState:
+    """Per-instrument quote and trade state, kept up to date from market data.
+
+    Feed it with update() (a parsed BestBidOffer/LastTrade, or any object
+    with the same attributes), update_buf() (raw frames, decoded here with
+    partial decoders), or attach(reader) to follow a MessageReader.
+    """
+
+    def __init__(self):
+        self._instruments = {}
+        self._reader = None
+        self.updates = 0
+        self.malformed = 0
+
+    def update(self, template_id, msg):
+        """Merge msg into its instrument's state; returns the InstrumentState."""
+        merger = _MERGERS.get(template_id)
+        if merger is None:
+            return None
+        key = (msg.exchange, msg.symbol)
+        state = self._instruments.get(key)
+        if state is None:
+            state = self._instruments[key] = InstrumentState(*key)
+        if template_id == BEST_BID_OFFER:
+            state.quote = merger.merge(state.quote, msg)
+            state.quote_updates += 1
+        else:
+            state.trade = merger.merge(state.trade, msg)
+            state.trade_updates += 1
+        state.received_at = time.time()
+        self.updates += 1
+        return state
+
+    def update_buf(self, template_id, msg_buf):
+        decoder = DECODERS.get(template_id)
+        if decoder is None:
+            return None
+        try:
+            msg = decoder.decode(msg_buf)
+        except wire.WireError as e:
+            self.malformed += 1
+            logger.warning("Dropping malformed frame: %s", e)
+            return None
+        return self.update(template_id, msg)
+
+    def get(self, exchange, symbol):
+        return self._instruments.get((exchange, symbol))
+
+    def quote(self, exchange, symbol):
+        state = self._instruments.get((exchange, symbol))
+        return state.quote if state is not None else None
+
+    def trade(self, exchange, symbol):
+        state = self._instruments.get((exchange, symbol))
+        return state.trade if state is not None else None
+
+    def __len__(self):
+        return len(self._instruments)
+
+    def __contains__(self, key):
+        return key in self._instruments
+
+    def instruments(self):
+        return list(self._instruments.values())
+
+    def attach(self, reader):
+        """Follow every BestBidOffer and LastTrade frame reader receives."""
+        self._reader = reader
+        reader.add_callback(LAST_TRADE, self.update_buf)
+        reader.add_callback(BEST_BID_OFFER, self.update_buf)
+        return self
+
+    def detach(self):
+        if self._reader is not None:
+            self._reader.remove_callback(LAST_TRADE, self.update_buf)
+            self._reader.remove_callback(BEST_BID_OFFER, self.update_buf)
+            self._reader = None
+
+    def stats(self):
+        return {
+            "instruments": len(self._instruments),
+            "updates": self.updates,
+            "malformed": self.malformed,
+        }
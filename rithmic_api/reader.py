@@ -0,0 +1,312 @@
+import asyncio
+import collections
+import logging
+import time
+
+import websockets
+
+from rithmic_api import wire
+
+logger = logging.getLogger(__name__)
+
+#   overflow policies for a full MessageStream
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+CONFLATE = "conflate"
+
+
+def instrument_key(template_id, msg_buf):
+    """Default conflation key: the template id plus exchange and symbol."""
+    try:
+        key = wire.instrument_key(msg_buf)
+    except wire.WireError:
+        return None
+    if key is None:
+        return None
+    return (template_id,) + key
+
+
+class MessageStream:
+    """A bounded buffer of (template_id, msg_buf) pairs for one consumer.
+
+    What happens when the buffer is full depends on overflow :
+
+       BLOCK        the reader waits for the consumer (backpressure)
+       DROP_OLDEST  the oldest buffered frame is dropped
+       CONFLATE     a frame replaces the buffered one with the same key
+                    (by default the same template, exchange and symbol),
+                    so at most one frame per instrument is pending; frames
+                    without a key, or with a new key while the buffer is
+                    full, fall back to dropping the oldest frame
+
+    decoders maps template ids to callables, such as the partial decoders
+    in rithmic_api.decoders; frames of those templates are yielded as
+    (template_id, decoder(msg_buf)) instead of raw bytes.  Decoding happens
+    in get(), so frames that are dropped or conflated are never decoded.
+    """
+
+    def __init__(self, reader, template_ids, maxsize, overflow=BLOCK, key=instrument_key, decoders=None):
+        if overflow not in (BLOCK, DROP_OLDEST, CONFLATE):
+            raise ValueError(f"unknown overflow policy {overflow!r}")
+        self.template_ids = frozenset(template_ids)
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.key = key
+        self.decoders = dict(decoders or {})
+
+        self.received = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.max_depth = 0
+
+        self._reader = reader
+        self._items = collections.deque()
+        self._pending = {}
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._closed = False
+        self._finished = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self.get()
+        if item is None:
+            raise StopAsyncIteration
+        return item
+
+    async def get(self):
+        """Wait for the next frame; returns None once the connection is gone."""
+        while True:
+            while not self._items:
+                if self._closed or self._finished:
+                    return None
+                self._readable.clear()
+                await self._readable.wait()
+            entry = self._items.popleft()
+            if entry[0] is not None:
+                del self._pending[entry[0]]
+            self._writable.set()
+            item = entry[1]
+            decoder = self.decoders.get(item[0]) if self.decoders else None
+            if decoder is None:
+                return item
+            try:
+                return item[0], decoder(item[1])
+            except wire.WireError as e:
+                logger.warning("Dropping malformed frame: %s", e)
+
+    def qsize(self):
+        return len(self._items)
+
+    def stats(self):
+        return {
+            "overflow": self.overflow,
+            "depth": len(self._items),
+            "max_depth": self.max_depth,
+            "received": self.received,
+            "dropped": self.dropped,
+            "conflated": self.conflated,
+        }
+
+    def close(self):
+        """Stop receiving frames on this stream."""
+        self._reader.remove_stream(self)
+        self._closed = True
+        self._items.clear()
+        self._pending.clear()
+        # wake the reader if it was blocked on this full stream, and a
+        # consumer blocked on an empty one
+        self._writable.set()
+        self._readable.set()
+
+    async def _put(self, item):
+        if self._closed:
+            return
+        self.received += 1
+        key = None
+        if self.overflow == CONFLATE:
+            key = self.key(*item)
+            entry = self._pending.get(key) if key is not None else None
+            if entry is not None:
+                entry[1] = item
+                self.conflated += 1
+                return
+
+        if self.maxsize and len(self._items) >= self.maxsize:
+            if self.overflow == BLOCK:
+                while len(self._items) >= self.maxsize and not self._closed:
+                    self._writable.clear()
+                    await self._writable.wait()
+                if self._closed:
+                    return
+            else:
+                dropped = self._items.popleft()
+                if dropped[0] is not None:
+                    del self._pending[dropped[0]]
+                self.dropped += 1
+
+        entry = [key, item]
+        self._items.append(entry)
+        if key is not None:
+            self._pending[key] = entry
+        if len(self._items) > self.max_depth:
+            self.max_depth = len(self._items)
+        self._readable.set()
+
+    def _finish(self):
+        # frames already buffered are still delivered, then get() returns None
+        self._finished = True
+        self._readable.set()
+        self._writable.set()
+
+
+class MessageReader:
+    """Reads a websocket in a single task and routes frames by template_id.
+
+    Consumers either register a synchronous callback for a template_id, or
+    open a bounded MessageStream for one or more template_ids (no ids means
+    every frame) and await it.  Streams never grow without limit: a full
+    stream applies backpressure to the reader, or drops or conflates frames,
+    depending on its overflow policy.
+
+    A resumable reader keeps its streams open when the connection drops, so
+    that a replacement websocket can be attached after a reconnect.
+    Disconnect callbacks are called, without arguments, every time the
+    connection is lost.
+    """
+
+    def __init__(self, ws, resumable=False):
+        self.ws = ws
+        self.resumable = resumable
+        self.num_msgs = 0
+        self.first_msg_at = None
+        self.closed = asyncio.Event()
+        self.disconnected = asyncio.Event()
+        self._callbacks = {}
+        self._disconnect_callbacks = []
+        self._streams = {}
+        self._all_streams = []
+        self._task = None
+        self._stopping = False
+
+    def start(self):
+        """Start the reader task; returns self so it can be chained."""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    async def stop(self):
+        """Cancel the reader task and end every open stream."""
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._close_streams()
+
+    def attach(self, ws):
+        """Resume reading from a new websocket, keeping streams and callbacks."""
+        self.ws = ws
+        self.first_msg_at = None
+        self.disconnected.clear()
+        self._task = asyncio.ensure_future(self._run())
+
+    def stream(self, *template_ids, maxsize=1000, overflow=BLOCK, key=instrument_key, decoders=None):
+        """Open a stream for the given template ids (all frames if none).
+
+        maxsize bounds the frames buffered for the consumer, and overflow
+        (BLOCK, DROP_OLDEST or CONFLATE) says what happens when it is hit.
+        decoders optionally decodes frames by template id as they are read.
+        """
+        stream = MessageStream(self, template_ids, maxsize, overflow, key, decoders)
+        if self.closed.is_set():
+            stream._finish()
+        elif stream.template_ids:
+            for template_id in stream.template_ids:
+                self._streams[template_id] = self._streams.get(template_id, []) + [stream]
+        else:
+            self._all_streams = self._all_streams + [stream]
+        return stream
+
+    def remove_stream(self, stream):
+        # routing lists are replaced rather than mutated so that _run() can
+        # keep iterating its current list while awaiting a full stream
+        if not stream.template_ids:
+            self._all_streams = [s for s in self._all_streams if s is not stream]
+        for template_id in stream.template_ids:
+            streams = [s for s in self._streams.get(template_id, []) if s is not stream]
+            if streams:
+                self._streams[template_id] = streams
+            else:
+                self._streams.pop(template_id, None)
+
+    def add_callback(self, template_id, callback):
+        """Call callback(template_id, msg_buf) for every matching frame."""
+        self._callbacks[template_id] = self._callbacks.get(template_id, []) + [callback]
+
+    def remove_callback(self, template_id, callback):
+        # compare with ==, not is: every self.method access makes a new
+        # bound method object, but equal ones share __self__ and __func__
+        callbacks = [cb for cb in self._callbacks.get(template_id, []) if cb != callback]
+        if callbacks:
+            self._callbacks[template_id] = callbacks
+        else:
+            self._callbacks.pop(template_id, None)
+
+    def add_disconnect_callback(self, callback):
+        """Call callback() whenever the reader loses its connection."""
+        self._disconnect_callbacks = self._disconnect_callbacks + [callback]
+
+    def remove_disconnect_callback(self, callback):
+        self._disconnect_callbacks = [cb for cb in self._disconnect_callbacks if cb != callback]
+
+    async def _run(self):
+        try:
+            async for msg_buf in self.ws:
+                self.num_msgs += 1
+                if self.first_msg_at is None:
+                    self.first_msg_at = time.monotonic()
+
+                try:
+                    template_id = wire.peek_template_id(msg_buf)
+                except wire.WireError as e:
+                    logger.warning("Dropping malformed frame: %s", e)
+                    continue
+
+                for callback in self._callbacks.get(template_id, ()):
+                    try:
+                        callback(template_id, msg_buf)
+                    except Exception:
+                        logger.exception("Callback for template %s failed", template_id)
+
+                item = (template_id, msg_buf)
+                for stream in self._streams.get(template_id, ()):
+                    await stream._put(item)
+                for stream in self._all_streams:
+                    await stream._put(item)
+        except websockets.ConnectionClosed:
+            logger.info("WebSocket connection closed, reader exiting.")
+        finally:
+            self.disconnected.set()
+            for callback in self._disconnect_callbacks:
+                try:
+                    callback()
+                except Exception:
+                    logger.exception("Disconnect callback failed")
+            if not self.resumable or self._stopping:
+                self._close_streams()
+
+    def _close_streams(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        streams = {id(s): s for s in self._all_streams}
+        for routed in self._streams.values():
+            streams.update((id(s), s) for s in routed)
+        for stream in streams.values():
+            stream._finish()
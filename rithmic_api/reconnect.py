@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ReconnectSupervisor:
+    """Reconnects a RithmicSession whenever its websocket drops.
+
+    Attempts are spaced with exponential backoff and full jitter.  After a
+    successful reconnect the session logs in again and replays its tracked
+    subscriptions; consumers keep reading from the same streams.
+    """
+
+    def __init__(self, session, base_delay=0.05, max_delay=30.0, max_attempts=None):
+        self.session = session
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+
+        self.reconnects = 0
+        self.failed_attempts = 0
+        self.last_disconnect_at = None
+        self.last_reconnect_seconds = None
+
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def time_to_first_msg(self):
+        """Seconds from the last disconnect to the first message afterwards."""
+        first_msg_at = self.session.reader.first_msg_at
+        if self.last_disconnect_at is None or first_msg_at is None:
+            return None
+        if first_msg_at < self.last_disconnect_at:
+            return None
+        return first_msg_at - self.last_disconnect_at
+
+    def stats(self):
+        return {
+            "reconnects": self.reconnects,
+            "failed_attempts": self.failed_attempts,
+            "last_reconnect_seconds": self.last_reconnect_seconds,
+            "time_to_first_msg": self.time_to_first_msg(),
+        }
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _run(self):
+        reader = self.session.reader
+        while True:
+            await reader.disconnected.wait()
+            disconnected_at = time.monotonic()
+            self.last_disconnect_at = disconnected_at
+            logger.warning("Connection to %s lost, reconnecting.", self.session.uri)
+            self.session.router.fail_pending(ConnectionResetError("Rithmic connection lost"))
+
+            attempt = 0
+            while True:
+                await asyncio.sleep(self._backoff(attempt))
+                try:
+                    await self.session.reconnect()
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    attempt += 1
+                    self.failed_attempts += 1
+                    logger.warning("Reconnect attempt %s to %s failed: %s", attempt, self.session.uri, e)
+                    if self.max_attempts is not None and attempt >= self.max_attempts:
+                        logger.error("Giving up on %s after %s attempts.", self.session.uri, attempt)
+                        await reader.stop()
+                        return
+
+            self.reconnects += 1
+            self.last_reconnect_seconds = time.monotonic() - disconnected_at
+            logger.info("Reconnected to %s in %.3fs.", self.session.uri, self.last_reconnect_seconds)
@@ -0,0 +1,172 @@
+#   ===========================================================================
+#   Pre-serialized requests.  A RequestTemplate serializes the fields of a
+#   request that never change (template_id, fcm/ib/account ids, trade route,
+#   duration ...) once, and at send time only encodes the fields that do,
+#   splicing them in between the static bytes so that the result is exactly
+#   what serializing the whole message would give, field-number order and
+#   all.
+#
+#          rq = RequestTemplate(312, ("user_tag", "quantity", "transaction_type"),
+#                               fcm_id=fcm_id, ib_id=ib_id, account_id=account_id, ...)
+#          await ws.send(rq.encode(user_tag="a1", quantity=1, transaction_type=BUY))
+
+import struct
+
+from rithmic_api import codec, templates, wire
+
+_DOUBLE = struct.Struct("<d").pack
+_FLOAT = struct.Struct("<f").pack
+_INT64 = struct.Struct("<q").pack
+_UINT64 = struct.Struct("<Q").pack
+_INT32 = struct.Struct("<i").pack
+_UINT32 = struct.Struct("<I").pack
+
+
+class RequestTemplate:
+    """A request whose static fields are serialized once.
+
+    message is a generated class or a template_id; for a template_id the
+    template_id field is filled in and the class is only loaded on the
+    first encode().  varying names the fields passed to encode(); a field
+    left out of an encode() call is left out of the message.
+    """
+
+    def __init__(self, message, varying=(), **static):
+        self.varying = tuple(varying)
+        if isinstance(message, int):
+            static.setdefault("template_id", message)
+        self._message = message
+        overlap = set(self.varying) & set(static)
+        if overlap:
+            raise ValueError(f"fields both static and varying: {sorted(overlap)}")
+        self.static = static
+        self._segments = None
+        self._tail = None
+        self._names = frozenset(self.varying)
+
+    @property
+    def message_class(self):
+        if isinstance(self._message, int):
+            self._message = templates.message_class(self._message)
+        return self._message
+
+    def encode(self, **values):
+        """Return the serialized request with values for the varying fields."""
+        segments = self._segments
+        if segments is None:
+            segments = self._setup()
+        for name in values:
+            if name not in self._names:
+                raise TypeError(f"{name!r} is not a varying field of this template")
+        parts = []
+        for static, name, encode in segments:
+            parts.append(static)
+            value = values.get(name)
+            if value is not None:
+                parts.append(encode(value))
+        parts.append(self._tail)
+        return b"".join(parts)
+
+    def message(self, **values):
+        """Build the same request as a message, the slow way; for checking encode()."""
+        msg = self.message_class()
+        for name, value in list(self.static.items()) + list(values.items()):
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple)):
+                getattr(msg, name).extend(value)
+            else:
+                setattr(msg, name, value)
+        return msg
+
+    def _setup(self):
+        message_class = self.message_class
+        by_name = message_class.DESCRIPTOR.fields_by_name
+        varying = []
+        for name in self.varying:
+            field = by_name.get(name)
+            if field is None:
+                raise ValueError(f"{message_class.__name__} has no field {name!r}")
+            varying.append((field.number, name, _encoder(field)))
+        varying.sort()
+
+        # cut the serialized static fields wherever a varying field goes
+        static_buf = codec.encode(self.message())
+        segments = []
+        pos = start = 0
+        for number, name, encode in varying:
+            while pos < len(static_buf):
+                tag, end = wire.read_varint(static_buf, pos)
+                if tag >> 3 > number:
+                    break
+                pos = wire.skip_field(static_buf, end, tag & 7)
+            segments.append((static_buf[start:pos], name, encode))
+            start = pos
+        self._tail = static_buf[start:]
+        self._segments = segments
+        return segments
+
+
+def _encoder(field):
+    tag = wire.encode_tag(field.number, _WIRE_TYPES[field.type])
+    encode = _VALUE_ENCODERS[field.type]
+    if field.label == field.LABEL_REPEATED:
+        return lambda values: b"".join(tag + encode(value) for value in values)
+    return lambda value: tag + encode(value)
+
+
+def _length_delimited(data):
+    return wire.encode_varint(len(data)) + data
+
+
+def _zigzag(value):
+    return wire.encode_varint((value << 1) ^ (value >> 63))
+
+
+# FieldDescriptor.TYPE_* : wire type, value encoder
+_WIRE_TYPES = {
+    1: wire.WIRETYPE_FIXED64, 2: wire.WIRETYPE_FIXED32, 3: wire.WIRETYPE_VARINT, 4: wire.WIRETYPE_VARINT,
+    5: wire.WIRETYPE_VARINT, 6: wire.WIRETYPE_FIXED64, 7: wire.WIRETYPE_FIXED32, 8: wire.WIRETYPE_VARINT,
+    9: wire.WIRETYPE_LENGTH_DELIMITED, 12: wire.WIRETYPE_LENGTH_DELIMITED, 13: wire.WIRETYPE_VARINT,
+    14: wire.WIRETYPE_VARINT, 15: wire.WIRETYPE_FIXED32, 16: wire.WIRETYPE_FIXED64,
+    17: wire.WIRETYPE_VARINT, 18: wire.WIRETYPE_VARINT,
+}
+_VALUE_ENCODERS = {
+    1: _DOUBLE,                                         # double
+    2: _FLOAT,                                          # float
+    3: wire.encode_varint,                              # int64
+    4: wire.encode_varint,                              # uint64
+    5: wire.encode_varint,                              # int32
+    6: _UINT64,                                         # fixed64
+    7: _UINT32,                                         # fixed32
+    8: lambda value: b"\x01" if value else b"\x00",     # bool
+    9: lambda value: _length_delimited(value.encode("utf-8")),  # string
+    12: _length_delimited,                              # bytes
+    13: wire.encode_varint,                             # uint32
+    14: wire.encode_varint,                             # enum
+    15: _INT32,                                         # sfixed32
+    16: _INT64,                                         # sfixed64
+    17: _zigzag,                                        # sint32
+    18: _zigzag,                                        # sint64
+}
+
+
+class RequestTemplateCache:
+    """RequestTemplates memoized by their message, varying and static fields."""
+
+    def __init__(self):
+        self._templates = {}
+
+    def get(self, message, varying=(), **static):
+        key = (message, tuple(varying),
+               tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in static.items())))
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates[key] = RequestTemplate(message, varying, **static)
+        return template
+
+    def __len__(self):
+        return len(self._templates)
+
+    def clear(self):
+        self._templates.clear()
@@ -0,0 +1,265 @@
+import asyncio
+import hashlib
+import logging
+import time
+
+import websockets
+
+from rithmic_api import codec, templates
+from rithmic_api.correlation import RequestRouter
+from rithmic_api.heartbeat import HeartbeatScheduler
+from rithmic_api.reader import MessageReader
+from rithmic_api import tls
+from rithmic_api.reconnect import ReconnectSupervisor
+from rithmic_api.writer import MessageWriter
+
+request_login_pb2 = templates.lazy_module("request_login_pb2")
+request_market_data_update_pb2 = templates.lazy_module("request_market_data_update_pb2")
+request_subscribe_for_order_updates_pb2 = templates.lazy_module("request_subscribe_for_order_updates_pb2")
+request_logout_pb2 = templates.lazy_module("request_logout_pb2")
+response_login_pb2 = templates.lazy_module("response_login_pb2")
+response_market_data_update_pb2 = templates.lazy_module("response_market_data_update_pb2")
+response_subscribe_for_order_updates_pb2 = templates.lazy_module("response_subscribe_for_order_updates_pb2")
+
+logger = logging.getLogger(__name__)
+
+#   RequestLogin.SysInfraType and RequestMarketDataUpdate.Request values,
+#   spelled out so that default arguments do not load the generated modules
+TICKER_PLANT = 1
+ORDER_PLANT = 2
+HISTORY_PLANT = 3
+PNL_PLANT = 4
+REPOSITORY_PLANT = 5
+
+SUBSCRIBE = 1
+UNSUBSCRIBE = 2
+
+APP_NAME = "SampleMD.py"
+APP_VERSION = "0.3.0.0"
+
+
+class LoginError(Exception):
+    """Raised when the gateway rejects a login request."""
+
+    def __init__(self, rp_code):
+        super().__init__(f"Rithmic login failed: {list(rp_code)}")
+        self.rp_code = list(rp_code)
+
+
+def digest_password(password):
+    """Return the digest sessions are matched on, so raw passwords are never compared."""
+    return hashlib.sha256(password.encode("utf-8")).digest()
+
+
+def make_ssl_context(uri):
+    """Return the shared SSL context for wss:// connections, or None for ws://."""
+    if "wss://" not in uri:
+        return None
+    return tls.client_context()
+
+
+async def login(ws, system_name, user_id, password, infra_type,
+                app_name=APP_NAME, app_version=APP_VERSION):
+    """Send a RequestLogin and return the parsed ResponseLogin."""
+    rq = request_login_pb2.RequestLogin()
+    rq.template_id = 10
+    rq.template_version = "3.9"
+    rq.user = user_id
+    rq.password = password
+    rq.app_name = app_name
+    rq.app_version = app_version
+    rq.system_name = system_name
+    rq.infra_type = infra_type
+
+    await ws.send(codec.encode(rq))
+    rp_buf = await ws.recv()
+
+    rp = codec.decode(response_login_pb2.ResponseLogin, rp_buf)
+    if not rp.rp_code or rp.rp_code[0] != "0":
+        raise LoginError(rp.rp_code)
+    return rp
+
+
+class RithmicSession:
+    """A logged-in websocket connection to a single Rithmic plant.
+
+    Subscriptions made through the session are remembered so that, when it
+    is supervised, they can be replayed after an automatic reconnect.
+    """
+
+    def __init__(self, key, password, ws, login_response, ssl_context=None):
+        self.key = key
+        self.password = password
+        self.password_digest = digest_password(password)
+        self.ws = ws
+        self.login_response = login_response
+        self.ssl_context = ssl_context
+        self.reader = MessageReader(ws).start()
+        self.writer = MessageWriter(ws).start()
+        self.router = RequestRouter(self.reader, self.send)
+        self.heartbeat = HeartbeatScheduler(self.send, self.reader, login_response.heartbeat_interval).start()
+        self.writer.on_sent = self.heartbeat.note_sent
+        self.supervisor = None
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self._replay = {}
+
+    @property
+    def uri(self):
+        return self.key[0]
+
+    @property
+    def system_name(self):
+        return self.key[1]
+
+    @property
+    def user_id(self):
+        return self.key[2]
+
+    @property
+    def infra_type(self):
+        return self.key[3]
+
+    @property
+    def is_open(self):
+        return self.ws.open
+
+    @classmethod
+    async def open(cls, uri, system_name, user_id, password,
+                   infra_type=TICKER_PLANT, ssl_context=None):
+        """Connect to the gateway and log in to the requested plant."""
+        if ssl_context is None:
+            ssl_context = make_ssl_context(uri)
+        ws = await websockets.connect(uri, ssl=ssl_context, ping_interval=3)
+        try:
+            rp = await login(ws, system_name, user_id, password, infra_type)
+        except BaseException:
+            await ws.close()
+            raise
+        tls.remember(ws)
+        logger.info("Logged in to %s (%s, infra_type=%s)", uri, system_name, infra_type)
+        return cls((uri, system_name, user_id, infra_type), password, ws, rp, ssl_context)
+
+    def supervise(self, **kwargs):
+        """Reconnect automatically when the connection drops."""
+        if self.supervisor is None:
+            self.reader.resumable = True
+            self.supervisor = ReconnectSupervisor(self, **kwargs).start()
+        return self.supervisor
+
+    async def reconnect(self):
+        """Open a new websocket, log in again and replay tracked subscriptions."""
+        ws = await websockets.connect(self.uri, ssl=self.ssl_context, ping_interval=3)
+        try:
+            rp = await login(ws, self.system_name, self.user_id, self.password, self.infra_type)
+        except BaseException:
+            await ws.close()
+            raise
+        tls.remember(ws)
+        self.ws = ws
+        self.login_response = rp
+        self.reader.attach(ws)
+        self.writer.attach(ws)
+        self.heartbeat.restart(rp.heartbeat_interval)
+        for buf in list(self._replay.values()):
+            await self.send(buf)
+
+    def track(self, key, buf):
+        """Remember a subscription request so it is replayed on reconnect."""
+        self._replay[key] = buf
+
+    def untrack(self, key):
+        self._replay.pop(key, None)
+
+    async def subscribe_market_data(self, exchange, symbol, update_bits,
+                                    request=SUBSCRIBE, wait=True):
+        """Send a RequestMarketDataUpdate and wait for its acknowledgement.
+
+        With wait=False the request is only queued, and a task resolving to
+        the acknowledgement is returned; failures are logged.
+        """
+        rq = request_market_data_update_pb2.RequestMarketDataUpdate()
+        rq.template_id = 100
+        rq.symbol = symbol
+        rq.exchange = exchange
+        rq.request = request
+        rq.update_bits = update_bits
+
+        update = self._update_market_data(rq)
+        if not wait:
+            return self._submit(update)
+        return await update
+
+    async def unsubscribe_market_data(self, exchange, symbol, update_bits, wait=True):
+        return await self.subscribe_market_data(exchange, symbol, update_bits,
+                                                UNSUBSCRIBE, wait)
+
+    async def subscribe_market_data_many(self, instruments, update_bits,
+                                         request=SUBSCRIBE):
+        """Subscribe to many (exchange, symbol) pairs at once; returns the acks.
+
+        Every request is queued before any acknowledgement is awaited, so the
+        writer sends them back to back.
+        """
+        return await asyncio.gather(*(self.subscribe_market_data(exchange, symbol, update_bits, request)
+                                      for exchange, symbol in instruments))
+
+    async def unsubscribe_market_data_many(self, instruments, update_bits):
+        return await self.subscribe_market_data_many(instruments, update_bits,
+                                                     UNSUBSCRIBE)
+
+    async def subscribe_for_order_updates(self, fcm_id, ib_id, account_id):
+        """Subscribe to order updates for an account and wait for the ack."""
+        rq = request_subscribe_for_order_updates_pb2.RequestSubscribeForOrderUpdates()
+        rq.template_id = 308
+        rq.fcm_id = fcm_id
+        rq.ib_id = ib_id
+        rq.account_id = account_id
+
+        responses = await self.router.request(
+            rq, response_subscribe_for_order_updates_pb2.ResponseSubscribeForOrderUpdates)
+        self.track(("order_updates", fcm_id, ib_id, account_id), codec.encode(rq))
+        return responses[-1]
+
+    async def send(self, buf):
+        """Queue a serialized request and wait until it has been written."""
+        await self.writer.send(buf)
+
+    def send_nowait(self, buf):
+        """Queue a serialized request without waiting for it to be written."""
+        self.writer.send_nowait(buf)
+
+    async def close(self):
+        """Log out (best effort) and close the websocket."""
+        if self.supervisor is not None:
+            self.supervisor.stop()
+        self.heartbeat.stop()
+        if self.ws.open:
+            rq = request_logout_pb2.RequestLogout()
+            rq.template_id = 12
+            try:
+                await self.send(codec.encode(rq))
+            except websockets.ConnectionClosed:
+                pass
+        await self.writer.stop()
+        await self.ws.close(1000, "see you tomorrow")
+        await self.reader.stop()
+
+    async def _update_market_data(self, rq):
+        responses = await self.router.request(rq, response_market_data_update_pb2.ResponseMarketDataUpdate)
+        key = ("market_data", rq.exchange, rq.symbol)
+        if rq.request == SUBSCRIBE:
+            self.track(key, codec.encode(rq))
+        else:
+            self.untrack(key)
+        return responses[-1]
+
+    def _submit(self, coro):
+        task = asyncio.ensure_future(coro)
+        task.add_done_callback(_log_failure)
+        return task
+
+
+def _log_failure(task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Request failed: %s", task.exception())
@@ -0,0 +1,189 @@
+import asyncio
+import contextlib
+import hmac
+import logging
+import threading
+import time
+
+from rithmic_api.session import TICKER_PLANT, RithmicSession, digest_password
+
+logger = logging.getLogger(__name__)
+
+
+class SessionPool:
+    """Keeps logged-in plant sessions open and hands them out to callers.
+
+    Sessions are keyed by (uri, system_name, user_id, infra_type).  A session
+    is only reused for a caller presenting the same password it was opened
+    with.  All methods must be called from the event loop that owns the pool.
+    """
+
+    def __init__(self, idle_timeout=300.0, max_idle_per_key=4, reconnect=True):
+        self.idle_timeout = idle_timeout
+        self.max_idle_per_key = max_idle_per_key
+        self.reconnect = reconnect
+        self._idle = {}
+        self._in_use = set()
+        self._reaper = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.connect_seconds = 0.0
+
+    async def acquire(self, uri, system_name, user_id, password,
+                      infra_type=TICKER_PLANT):
+        """Return an open, logged-in session, reusing an idle one if possible."""
+        self._ensure_reaper()
+        key = (uri, system_name, user_id, infra_type)
+        digest = digest_password(password)
+        idle = self._idle.get(key, [])
+        for i in range(len(idle) - 1, -1, -1):
+            session = idle[i]
+            if not session.is_open:
+                del idle[i]
+                self.evictions += 1
+                await session.close()
+                continue
+            if hmac.compare_digest(session.password_digest, digest):
+                del idle[i]
+                self.hits += 1
+                self._in_use.add(session)
+                session.last_used = time.monotonic()
+                return session
+
+        self.misses += 1
+        started = time.monotonic()
+        session = await RithmicSession.open(uri, system_name, user_id, password, infra_type)
+        self.connect_seconds += time.monotonic() - started
+        if self.reconnect:
+            session.supervise()
+        self._in_use.add(session)
+        return session
+
+    async def release(self, session):
+        """Return a session to the pool once the caller is done with it."""
+        self._in_use.discard(session)
+        session.last_used = time.monotonic()
+        if not session.is_open:
+            self.evictions += 1
+            await session.close()
+            return
+        idle = self._idle.setdefault(session.key, [])
+        if len(idle) >= self.max_idle_per_key:
+            self.evictions += 1
+            await session.close()
+            return
+        idle.append(session)
+
+    async def discard(self, session):
+        """Close a session that is in an unknown state instead of pooling it."""
+        self._in_use.discard(session)
+        self.evictions += 1
+        await session.close()
+
+    @contextlib.asynccontextmanager
+    async def session(self, uri, system_name, user_id, password,
+                      infra_type=TICKER_PLANT):
+        """Acquire a session for the duration of an ``async with`` block."""
+        session = await self.acquire(uri, system_name, user_id, password, infra_type)
+        try:
+            yield session
+        except BaseException:
+            await self.discard(session)
+            raise
+        await self.release(session)
+
+    async def evict_idle(self):
+        """Close sessions that have been idle longer than idle_timeout."""
+        cutoff = time.monotonic() - self.idle_timeout
+        stale = []
+        for key in list(self._idle):
+            keep = []
+            for session in self._idle[key]:
+                if session.is_open and session.last_used >= cutoff:
+                    keep.append(session)
+                else:
+                    stale.append(session)
+            if keep:
+                self._idle[key] = keep
+            else:
+                del self._idle[key]
+        for session in stale:
+            self.evictions += 1
+            await session.close()
+
+    async def close_all(self):
+        """Close every idle session and stop the reaper."""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        idle, self._idle = self._idle, {}
+        for sessions in idle.values():
+            for session in sessions:
+                await session.close()
+
+    def stats(self):
+        """Return hit/miss counters, connect+login time saved and per-session health.
+
+        Sessions are listed by position and plant only: the stats are served
+        to unauthenticated callers, so no uri or user_id appears in them.
+        """
+        avg_connect = self.connect_seconds / self.misses if self.misses else 0.0
+        sessions = list(self._in_use) + [s for idle in list(self._idle.values()) for s in idle]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "idle": sum(len(idle) for idle in list(self._idle.values())),
+            "in_use": len(self._in_use),
+            "connect_login_seconds": self.connect_seconds,
+            "avg_connect_login_seconds": avg_connect,
+            "saved_seconds": self.hits * avg_connect,
+            "heartbeats": [dict(session=i, infra_type=s.infra_type, **s.heartbeat.stats())
+                           for i, s in enumerate(sessions)],
+            "writers": [dict(session=i, infra_type=s.infra_type, **s.writer.stats())
+                        for i, s in enumerate(sessions)],
+            "reconnects": [dict(session=i, infra_type=s.infra_type, **s.supervisor.stats())
+                           for i, s in enumerate(sessions) if s.supervisor is not None],
+        }
+
+    def _ensure_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.ensure_future(self._reap())
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(self.idle_timeout / 2)
+            try:
+                await self.evict_idle()
+            except Exception:
+                logger.exception("Failed to evict idle Rithmic sessions")
+
+
+#   ===========================================================================
+#   Pooled websockets are bound to the event loop that opened them, so the
+#   process-wide pool lives on a dedicated background loop.  Synchronous
+#   callers (Django views, run_rithmic) submit coroutines to it with
+#   run_coroutine().
+
+pool = SessionPool()
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop():
+    """Return the background event loop that owns the process-wide pool."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop.run_forever, name="rithmic-session-pool", daemon=True)
+            thread.start()
+    return _loop
+
+
+def run_coroutine(coro, timeout=None):
+    """Run a coroutine on the pool's event loop and block until it finishes."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
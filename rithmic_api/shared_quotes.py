@@ -0,0 +1,356 @@
+#   ===========================================================================
+#   Cross-process quote table.  One feeder process follows the market data
+#   and writes the latest quote of every instrument into a fixed-slot
+#   multiprocessing.shared_memory block; every Django worker attaches to
+#   the block and reads quotes from it, so N workers share one ticker plant
+#   session instead of opening one each.
+#
+#   Each slot is guarded by a seqlock.  The single writer makes the
+#   sequence number odd, writes the record and makes it even again; a
+#   reader copies the record between two reads of the sequence number and
+#   retries if they differ or are odd.  Readers never block the writer or
+#   each other, and never see half of an update.  A reader that keeps
+#   finding a slot mid-write spins briefly, then sleeps between retries,
+#   so that a writer preempted halfway through gets the CPU back.
+#
+#   Layout of the block :
+#
+#          header      64 bytes    magic, version, capacity, slots in use
+#          directory   capacity x 48 bytes, "exchange:symbol" per slot
+#          records     capacity x 96 bytes, seq + quote fields per slot
+#
+#   A slot's key is written before the count of slots in use is raised,
+#   so readers only look at slots that are complete.
+#
+#          python -m rithmic_api.shared_quotes --uri wss://... --system-name "Rithmic Test" \
+#                 --user-id ... --password ... --symbols CME:ESZ4,CME:NQZ4
+#
+#   runs a feeder; workers find the table through RITHMIC_QUOTE_TABLE.
+
+import argparse
+import asyncio
+import logging
+import os
+import struct
+import time
+
+from multiprocessing import shared_memory
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NAME = "rithmic_quotes"
+ENV_NAME = "RITHMIC_QUOTE_TABLE"
+
+_MAGIC = b"RQTB"
+_VERSION = 1
+_HEADER = struct.Struct("<4sIII")           # magic, version, capacity, count
+_HEADER_SIZE = 64
+_COUNT_OFFSET = 12
+_COUNT = struct.Struct("<I")
+_KEY_SIZE = 48
+_SEQ = struct.Struct("<Q")
+#   seq, flags, bid, ask, last, bid size, ask size, last size, volume,
+#   quote time, trade time, received at
+_RECORD = struct.Struct("<QQdddqqqqddd")
+_BODY = struct.Struct("<Qdddqqqqddd")
+_RECORD_SIZE = 96
+
+#   flags : which fields hold a value
+HAS_BID = 1
+HAS_ASK = 2
+HAS_TRADE = 4
+HAS_VOLUME = 8
+
+_NAN = float("nan")
+
+#   blocks created by this process, which its resource tracker must keep
+_created = set()
+
+
+def _open(name, create, size=0):
+    if create:
+        shm = shared_memory.SharedMemory(name, create=True, size=size)
+        _created.add(name)
+        return shm
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # before Python 3.13 attaching registers the block with the resource
+        # tracker, which would unlink it when this worker exits
+        shm = shared_memory.SharedMemory(name)
+        if name not in _created:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def _timestamp(ssboe, usecs):
+    if not ssboe:
+        return _NAN
+    return ssboe + (usecs or 0) / 1e6
+
+
+def _value(value):
+    return None if value != value else value        # NaN means unset
+
+
+class QuoteTableWriter:
+    """The feeder's side of the table; there must only ever be one writer.
+
+    publish(state) copies a quote_state.InstrumentState into its slot,
+    assigning the next free slot to an instrument seen for the first time.
+    """
+
+    def __init__(self, name=DEFAULT_NAME, capacity=1024):
+        self.name = name
+        self.capacity = capacity
+        self.writes = 0
+        self.full = 0
+        self._slots = {}
+        self._shm = _open(name, True, _HEADER_SIZE + capacity * (_KEY_SIZE + _RECORD_SIZE))
+        self._buf = self._shm.buf
+        self._records = _HEADER_SIZE + capacity * _KEY_SIZE
+        _HEADER.pack_into(self._buf, 0, _MAGIC, _VERSION, capacity, 0)
+
+    def slot(self, exchange, symbol):
+        """Return the slot of an instrument, assigning one if needed; None when full."""
+        key = (exchange, symbol)
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = len(self._slots)
+            if slot >= self.capacity:
+                self.full += 1
+                return None
+            encoded = f"{exchange}:{symbol}".encode("utf-8")
+            if len(encoded) > _KEY_SIZE:
+                raise ValueError(f"instrument key too long: {exchange}:{symbol}")
+            offset = _HEADER_SIZE + slot * _KEY_SIZE
+            self._buf[offset:offset + _KEY_SIZE] = encoded.ljust(_KEY_SIZE, b"\0")
+            self._slots[key] = slot
+            _COUNT.pack_into(self._buf, _COUNT_OFFSET, slot + 1)
+        return slot
+
+    def publish(self, state):
+        """Write the latest quote and trade of an InstrumentState."""
+        if state is None:
+            return
+        slot = self.slot(state.exchange, state.symbol)
+        if slot is None:
+            return
+        quote = state.quote
+        trade = state.trade
+        flags = 0
+        if quote.bid_price is not None:
+            flags |= HAS_BID
+        if quote.ask_price is not None:
+            flags |= HAS_ASK
+        if trade.trade_price is not None:
+            flags |= HAS_TRADE
+        if trade.volume is not None:
+            flags |= HAS_VOLUME
+
+        buf = self._buf
+        offset = self._records + slot * _RECORD_SIZE
+        seq = _SEQ.unpack_from(buf, offset)[0]
+        _SEQ.pack_into(buf, offset, seq + 1)
+        _BODY.pack_into(buf, offset + 8, flags,
+                        quote.bid_price if flags & HAS_BID else _NAN,
+                        quote.ask_price if flags & HAS_ASK else _NAN,
+                        trade.trade_price if flags & HAS_TRADE else _NAN,
+                        quote.bid_size or 0, quote.ask_size or 0, trade.trade_size or 0, trade.volume or 0,
+                        _timestamp(quote.ssboe, quote.usecs), _timestamp(trade.ssboe, trade.usecs),
+                        state.received_at or _NAN)
+        _SEQ.pack_into(buf, offset, seq + 2)
+        self.writes += 1
+
+    def callback(self, quotes):
+        """A subscription callback that merges frames into quotes and publishes them."""
+        update_buf = quotes.update_buf
+        publish = self.publish
+
+        def on_frame(template_id, msg_buf):
+            publish(update_buf(template_id, msg_buf))
+        return on_frame
+
+    def stats(self):
+        return {"name": self.name, "capacity": self.capacity, "slots": len(self._slots),
+                "writes": self.writes, "full": self.full}
+
+    def close(self):
+        """Detach and remove the block; readers keep what they have mapped."""
+        self._buf = None
+        self._shm.close()
+        self._shm.unlink()
+        _created.discard(self.name)
+
+
+class QuoteTableReader:
+    """A worker's read-only view of the table.
+
+    quote() and quotes() return the same dicts as quote_cache.QuoteCache,
+    so either can serve the /api/quotes/ endpoint.
+    """
+
+    def __init__(self, name=DEFAULT_NAME, max_age=5.0, spins=100, timeout=0.5):
+        self.name = name
+        self.max_age = max_age
+        self.spins = spins
+        self.timeout = timeout
+        self.retried = 0
+        self._shm = _open(name, False)
+        self._buf = self._shm.buf
+        magic, version, capacity, _ = _HEADER.unpack_from(self._buf, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{name} is not a version {_VERSION} quote table")
+        self.capacity = capacity
+        self._records = _HEADER_SIZE + capacity * _KEY_SIZE
+        self._slots = {}
+
+    def instruments(self):
+        self._refresh()
+        return list(self._slots)
+
+    def read(self, slot):
+        """Return a consistent copy of a slot's record, without its sequence number."""
+        buf = self._buf
+        offset = self._records + slot * _RECORD_SIZE
+        attempts = 0
+        deadline = None
+        while True:
+            record = _RECORD.unpack_from(buf, offset)
+            if not record[0] & 1 and _SEQ.unpack_from(buf, offset)[0] == record[0]:
+                return record[1:]
+            self.retried += 1
+            attempts += 1
+            if attempts > self.spins:
+                if deadline is None:
+                    deadline = time.monotonic() + self.timeout
+                elif time.monotonic() > deadline:
+                    raise TimeoutError(f"slot {slot} of {self.name} kept changing while being read")
+                time.sleep(0.00005)
+
+    def quote(self, exchange, symbol, now=None):
+        key = (exchange, symbol)
+        slot = self._slots.get(key)
+        if slot is None:
+            self._refresh()
+            slot = self._slots.get(key)
+            if slot is None:
+                return None
+        (flags, bid, ask, last, bid_size, ask_size, last_size, volume,
+         quote_time, trade_time, received_at) = self.read(slot)
+        if now is None:
+            now = time.time()
+        received_at = _value(received_at)
+        age = now - received_at if received_at is not None else None
+        return {
+            "exchange": exchange,
+            "symbol": symbol,
+            "bid_price": bid if flags & HAS_BID else None,
+            "bid_size": bid_size if flags & HAS_BID else None,
+            "ask_price": ask if flags & HAS_ASK else None,
+            "ask_size": ask_size if flags & HAS_ASK else None,
+            "quote_time": _value(quote_time),
+            "last_price": last if flags & HAS_TRADE else None,
+            "last_size": last_size if flags & HAS_TRADE else None,
+            "volume": volume if flags & HAS_VOLUME else None,
+            "trade_time": _value(trade_time),
+            "received_at": received_at,
+            "age_seconds": age,
+            "stale": age is None or age > self.max_age,
+        }
+
+    def quotes(self, instruments):
+        """quote() for many (exchange, symbol) pairs; returns (found, missing)."""
+        now = time.time()
+        found = []
+        missing = []
+        for exchange, symbol in instruments:
+            quote = self.quote(exchange, symbol, now)
+            if quote is None:
+                missing.append(f"{exchange}:{symbol}")
+            else:
+                found.append(quote)
+        return found, missing
+
+    def stats(self):
+        return {"name": self.name, "capacity": self.capacity, "slots": len(self._slots),
+                "retried": self.retried}
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+
+    def _refresh(self):
+        count = min(_COUNT.unpack_from(self._buf, _COUNT_OFFSET)[0], self.capacity)
+        for slot in range(len(self._slots), count):
+            offset = _HEADER_SIZE + slot * _KEY_SIZE
+            exchange, symbol = bytes(self._buf[offset:offset + _KEY_SIZE]).rstrip(b"\0").decode("utf-8").split(":", 1)
+            self._slots[(exchange, symbol)] = slot
+
+
+_reader = None
+
+
+def reader_from_env():
+    """The table named by RITHMIC_QUOTE_TABLE, attached once per process, or None."""
+    global _reader
+    if _reader is None:
+        name = os.environ.get(ENV_NAME)
+        if not name:
+            return None
+        _reader = QuoteTableReader(name)
+    return _reader
+
+
+#   ===========================================================================
+#   The feeder process.
+
+async def feed(uri, system_name, user_id, password, instruments, name=DEFAULT_NAME, capacity=1024,
+               duration=None):
+    """Follow instruments on one session and publish them into the table.
+
+    The session modules are imported here, so that workers which only
+    read the table do not load them.
+    """
+    from rithmic_api.quote_state import QuoteState
+    from rithmic_api.session import RithmicSession
+    from rithmic_api.subscriptions import BBO, LAST_TRADE, SubscriptionManager
+
+    writer = QuoteTableWriter(name, capacity)
+    session = await RithmicSession.open(uri, system_name, user_id, password)
+    session.supervise()
+    manager = SubscriptionManager([session])
+    try:
+        consumer = manager.consumer(LAST_TRADE | BBO, writer.callback(QuoteState()), "shared_quotes")
+        await consumer.subscribe_many(instruments)
+        logger.info("Publishing %s instruments into %s", len(instruments), name)
+        if duration is None:
+            await asyncio.Event().wait()
+        else:
+            await asyncio.sleep(duration)
+    finally:
+        await manager.close()
+        await session.close()
+        writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Publish live quotes into a shared-memory table.")
+    parser.add_argument("--uri", required=True)
+    parser.add_argument("--system-name", required=True)
+    parser.add_argument("--user-id", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--symbols", required=True, help="comma-separated EXCHANGE:SYMBOL list")
+    parser.add_argument("--name", default=os.environ.get(ENV_NAME, DEFAULT_NAME))
+    parser.add_argument("--capacity", type=int, default=1024)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    instruments = [tuple(item.strip().split(":", 1)) for item in args.symbols.split(",") if item.strip()]
+    asyncio.run(feed(args.uri, args.system_name, args.user_id, args.password, instruments,
+                     args.name, args.capacity))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+#   ===========================================================================
+#   Market data subscriptions shared between consumers.  A
+#   SubscriptionManager spreads instruments over one or a few ticker plant
+#   sessions, and counts the consumers interested in each one.  Every
+#   interest declares the update_bits it needs, and the instrument is
+#   subscribed with the union of them: the first interest sends the
+#   SUBSCRIBE, an interest asking for more bits subscribes again with the
+#   wider mask, one that leaves takes its bits away with a narrower mask,
+#   and releasing the last interest sends the UNSUBSCRIBE.
+#
+#          manager = SubscriptionManager([session])
+#          interest = await manager.subscribe("CME", "ESZ6", LAST_TRADE | BBO, on_frame)
+#          ...
+#          await manager.release(interest)
+#
+#   Frames for an instrument are handed to the callbacks of its interests
+#   straight from the session reader, as callback(template_id, msg_buf),
+#   but only to the interests that asked for the update_bits the template
+#   belongs to: a consumer of trades alone never sees, or decodes, the far
+#   more frequent BestBidOffers another consumer made the plant send.
+
+import asyncio
+import contextlib
+import logging
+
+from rithmic_api import wire
+from rithmic_api.session import UNSUBSCRIBE
+
+logger = logging.getLogger(__name__)
+
+#   RequestMarketDataUpdate.UpdateBits, spelled out so that using them does
+#   not load the generated module
+LAST_TRADE = 1
+BBO = 2
+ORDER_BOOK = 4
+OPEN = 8
+OPENING_INDICATOR = 16
+HIGH_LOW = 32
+HIGH_BID_LOW_ASK = 64
+CLOSE = 128
+CLOSING_INDICATOR = 256
+SETTLEMENT = 512
+MARKET_MODE = 1024
+OPEN_INTEREST = 2048
+MARGIN_RATE = 4096
+HIGH_PRICE_LIMIT = 8192
+LOW_PRICE_LIMIT = 16384
+PROJECTED_SETTLEMENT = 32768
+ADJUSTED_CLOSE = 65536
+
+#   template_id : the update_bits that make the plant send it; an interest
+#   gets the template's frames if it asked for any of those bits.  Frames
+#   of templates that are routed but not listed here go to every interest.
+TEMPLATE_BITS = {
+    150: LAST_TRADE,                                # LastTrade
+    151: BBO,                                       # BestBidOffer
+    152: OPEN | HIGH_LOW,                           # TradeStatistics
+    153: HIGH_BID_LOW_ASK,                          # QuoteStatistics
+    154: OPENING_INDICATOR | CLOSING_INDICATOR,     # IndicatorPrices
+    155: CLOSE | SETTLEMENT | PROJECTED_SETTLEMENT | ADJUSTED_CLOSE,    # EndOfDayPrices
+    156: ORDER_BOOK,                                # OrderBook
+    157: MARKET_MODE,                               # MarketMode
+    158: OPEN_INTEREST,                             # OpenInterest
+    162: MARGIN_RATE,                               # SymbolMarginRate
+    163: HIGH_PRICE_LIMIT | LOW_PRICE_LIMIT,        # OrderPriceLimits
+}
+
+MARKET_DATA_TEMPLATES = tuple(TEMPLATE_BITS)
+
+
+class Interest:
+    """One consumer's interest in one instrument, as returned by subscribe().
+
+    delivered and filtered count the frames of the instrument that were
+    handed to the callback, and those skipped for want of update_bits.
+    """
+
+    __slots__ = ("key", "update_bits", "callback", "released", "delivered", "filtered")
+
+    def __init__(self, key, update_bits, callback):
+        self.key = key
+        self.update_bits = update_bits
+        self.callback = callback
+        self.released = False
+        self.delivered = 0
+        self.filtered = 0
+
+    @property
+    def exchange(self):
+        return self.key[0]
+
+    @property
+    def symbol(self):
+        return self.key[1]
+
+
+class Consumer:
+    """A subscription profile: one update_bits mask and callback for many instruments.
+
+    Made by SubscriptionManager.consumer().  set_update_bits() changes the
+    profile for every instrument the consumer holds at once.
+    """
+
+    def __init__(self, manager, update_bits, callback, name=None):
+        self.manager = manager
+        self.update_bits = update_bits
+        self.callback = callback
+        self.name = name
+        self._interests = {}
+
+    async def subscribe(self, exchange, symbol):
+        key = (exchange, symbol)
+        if key not in self._interests:
+            self._interests[key] = await self.manager.subscribe(exchange, symbol, self.update_bits,
+                                                                self.callback)
+        return self._interests[key]
+
+    async def subscribe_many(self, instruments):
+        return await asyncio.gather(*(self.subscribe(exchange, symbol) for exchange, symbol in instruments))
+
+    async def release(self, exchange, symbol):
+        interest = self._interests.pop((exchange, symbol), None)
+        if interest is not None:
+            await self.manager.release(interest)
+
+    async def set_update_bits(self, update_bits):
+        self.update_bits = update_bits
+        await asyncio.gather(*(self.manager.update(interest, update_bits)
+                               for interest in self._interests.values()))
+
+    async def close(self):
+        interests, self._interests = self._interests, {}
+        await self.manager.release_many(interests.values())
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "update_bits": self.update_bits,
+            "instruments": len(self._interests),
+            "delivered": sum(i.delivered for i in self._interests.values()),
+            "filtered": sum(i.filtered for i in self._interests.values()),
+        }
+
+
+class _Instrument:
+    """An instrument with at least one interest, and the session carrying it."""
+
+    __slots__ = ("session", "update_bits", "interests", "messages")
+
+    def __init__(self, session):
+        self.session = session
+        self.update_bits = 0
+        self.interests = ()
+        self.messages = 0
+
+    def wanted_bits(self):
+        bits = 0
+        for interest in self.interests:
+            bits |= interest.update_bits
+        return bits
+
+
+class SubscriptionManager:
+    """Reference-counted market data subscriptions over a set of sessions.
+
+    New instruments go to the session carrying the fewest, and stay there
+    until their last interest is released.  Sessions are not closed by the
+    manager; close() only unsubscribes everything it subscribed.  All
+    methods must be called from the event loop that owns the sessions.
+    """
+
+    def __init__(self, sessions, template_ids=MARKET_DATA_TEMPLATES):
+        self.sessions = list(sessions)
+        if not self.sessions:
+            raise ValueError("SubscriptionManager needs at least one session")
+        self.template_ids = tuple(template_ids)
+        self.subscribes = 0
+        self.narrowed = 0
+        self.unsubscribes = 0
+        self.unrouted = 0
+        self._instruments = {}
+        self._locks = {}
+        for session in self.sessions:
+            for template_id in self.template_ids:
+                session.reader.add_callback(template_id, self._route)
+
+    async def subscribe(self, exchange, symbol, update_bits, callback=None):
+        """Register an interest in (exchange, symbol); returns the Interest.
+
+        Waits for the subscription to be acknowledged when a request had
+        to be sent.  If it fails the interest is dropped again and the
+        error raised.
+        """
+        key = (exchange, symbol)
+        interest = Interest(key, update_bits, callback)
+        async with self._lock(key):
+            instrument = self._instruments.get(key)
+            if instrument is None:
+                instrument = self._instruments[key] = _Instrument(self._least_loaded())
+            instrument.interests = instrument.interests + (interest,)
+            try:
+                await self._resubscribe(key, instrument)
+            except BaseException:
+                instrument.interests = tuple(i for i in instrument.interests if i is not interest)
+                if not instrument.interests:
+                    del self._instruments[key]
+                raise
+        return interest
+
+    def consumer(self, update_bits, callback=None, name=None):
+        """Return a Consumer subscribing through this manager with one profile."""
+        return Consumer(self, update_bits, callback, name)
+
+    async def subscribe_many(self, instruments, update_bits, callback=None):
+        """subscribe() to many (exchange, symbol) pairs at once; returns the Interests."""
+        return await asyncio.gather(*(self.subscribe(exchange, symbol, update_bits, callback)
+                                      for exchange, symbol in instruments))
+
+    async def update(self, interest, update_bits):
+        """Change the update_bits an interest needs, re-subscribing if the union changes."""
+        if interest.released:
+            raise ValueError("interest has been released")
+        key = interest.key
+        async with self._lock(key):
+            previous, interest.update_bits = interest.update_bits, update_bits
+            try:
+                await self._resubscribe(key, self._instruments[key])
+            except BaseException:
+                interest.update_bits = previous
+                raise
+
+    async def release(self, interest):
+        """Drop an interest, narrowing or unsubscribing its instrument as needed."""
+        if interest.released:
+            return
+        interest.released = True
+        key = interest.key
+        async with self._lock(key):
+            instrument = self._instruments.get(key)
+            if instrument is None:
+                return
+            instrument.interests = tuple(i for i in instrument.interests if i is not interest)
+            if instrument.interests:
+                await self._resubscribe(key, instrument)
+                return
+            del self._instruments[key]
+            if instrument.update_bits:
+                self.unsubscribes += 1
+                await instrument.session.subscribe_market_data(key[0], key[1], instrument.update_bits,
+                                                               UNSUBSCRIBE)
+
+    async def release_many(self, interests):
+        await asyncio.gather(*(self.release(interest) for interest in interests))
+
+    async def close(self):
+        """Unsubscribe every instrument and stop routing frames."""
+        for session in self.sessions:
+            for template_id in self.template_ids:
+                session.reader.remove_callback(template_id, self._route)
+        interests = [i for instrument in self._instruments.values() for i in instrument.interests]
+        await asyncio.gather(*(self.release(interest) for interest in interests), return_exceptions=True)
+
+    def __len__(self):
+        return len(self._instruments)
+
+    def __contains__(self, key):
+        return key in self._instruments
+
+    def stats(self):
+        sessions = {id(session): i for i, session in enumerate(self.sessions)}
+        return {
+            "sessions": len(self.sessions),
+            "subscriptions": len(self._instruments),
+            "interests": sum(len(instrument.interests) for instrument in self._instruments.values()),
+            "subscribes": self.subscribes,
+            "narrowed": self.narrowed,
+            "unsubscribes": self.unsubscribes,
+            "unrouted": self.unrouted,
+            "instruments": {
+                f"{exchange}:{symbol}": {
+                    "session": sessions[id(instrument.session)],
+                    "update_bits": instrument.update_bits,
+                    "interests": len(instrument.interests),
+                    "messages": instrument.messages,
+                    "delivered": sum(i.delivered for i in instrument.interests),
+                    "filtered": sum(i.filtered for i in instrument.interests),
+                }
+                for (exchange, symbol), instrument in self._instruments.items()
+            },
+        }
+
+    async def _resubscribe(self, key, instrument):
+        """Bring the instrument's subscription in line with the union of its interests."""
+        wanted = instrument.wanted_bits()
+        subscribed = instrument.update_bits
+        if wanted == subscribed:
+            return
+        session = instrument.session
+        dropped = subscribed & ~wanted
+        if dropped:
+            # take the bits nobody wants any more away, then subscribe to
+            # the narrower mask, which is right whether the plant treats a
+            # request as adding to the bits it sends or as replacing them
+            await session.subscribe_market_data(key[0], key[1], dropped, UNSUBSCRIBE)
+            instrument.update_bits = subscribed & wanted
+            self.narrowed += 1
+        if wanted:
+            await session.subscribe_market_data(key[0], key[1], wanted)
+            self.subscribes += 1
+        instrument.update_bits = wanted
+
+    @contextlib.asynccontextmanager
+    async def _lock(self, key):
+        """Hold the instrument's lock; dropped once it is unsubscribed and unused."""
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        # count the tasks holding or waiting for the lock
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1] and key not in self._instruments:
+                del self._locks[key]
+
+    def _least_loaded(self):
+        load = {id(session): 0 for session in self.sessions}
+        for instrument in self._instruments.values():
+            load[id(instrument.session)] += 1
+        return min(self.sessions, key=lambda session: load[id(session)])
+
+    def _route(self, template_id, msg_buf):
+        try:
+            key = wire.instrument_key(msg_buf)
+        except wire.WireError as e:
+            logger.warning("Dropping malformed frame: %s", e)
+            return
+        instrument = self._instruments.get(key)
+        if instrument is None:
+            self.unrouted += 1
+            return
+        instrument.messages += 1
+        bits = TEMPLATE_BITS.get(template_id, 0)
+        for interest in instrument.interests:
+            if bits and not interest.update_bits & bits:
+                interest.filtered += 1
+                continue
+            interest.delivered += 1
+            if interest.callback is None:
+                continue
+            try:
+                interest.callback(template_id, msg_buf)
+            except Exception:
+                logger.exception("Subscription callback for %s:%s failed", key[0], key[1])
@@ -0,0 +1,112 @@
+#   ===========================================================================
+#   Template registry: maps each R | Protocol template_id to the generated
+#   message class for it, importing the *_pb2 module only when the class is
+#   first asked for.  Every generated module builds its descriptors when it
+#   is imported, so code that may never see most templates (a Django worker
+#   that only reads quotes, say) should go through here, or through
+#   lazy_module(), rather than importing them all up front.
+
+import importlib
+import threading
+
+#   template_id : (module name, class name)
+TEMPLATES = {
+    10: ("request_login_pb2", "RequestLogin"),
+    11: ("response_login_pb2", "ResponseLogin"),
+    12: ("request_logout_pb2", "RequestLogout"),
+    13: ("response_logout_pb2", "ResponseLogout"),
+    16: ("request_rithmic_system_info_pb2", "RequestRithmicSystemInfo"),
+    17: ("response_rithmic_system_info_pb2", "ResponseRithmicSystemInfo"),
+    18: ("request_heartbeat_pb2", "RequestHeartbeat"),
+    19: ("response_heartbeat_pb2", "ResponseHeartbeat"),
+    100: ("request_market_data_update_pb2", "RequestMarketDataUpdate"),
+    101: ("response_market_data_update_pb2", "ResponseMarketDataUpdate"),
+    150: ("last_trade_pb2", "LastTrade"),
+    151: ("best_bid_offer_pb2", "BestBidOffer"),
+    206: ("request_tick_bar_replay_pb2", "RequestTickBarReplay"),
+    207: ("response_tick_bar_replay_pb2", "ResponseTickBarReplay"),
+    300: ("request_login_info_pb2", "RequestLoginInfo"),
+    301: ("response_login_info_pb2", "ResponseLoginInfo"),
+    302: ("request_account_list_pb2", "RequestAccountList"),
+    303: ("response_account_list_pb2", "ResponseAccountList"),
+    308: ("request_subscribe_for_order_updates_pb2", "RequestSubscribeForOrderUpdates"),
+    309: ("response_subscribe_for_order_updates_pb2", "ResponseSubscribeForOrderUpdates"),
+    310: ("request_trade_routes_pb2", "RequestTradeRoutes"),
+    311: ("response_trade_routes_pb2", "ResponseTradeRoutes"),
+    312: ("request_new_order_pb2", "RequestNewOrder"),
+    313: ("response_new_order_pb2", "ResponseNewOrder"),
+    351: ("rithmic_order_notification_pb2", "RithmicOrderNotification"),
+    352: ("exchange_order_notification_pb2", "ExchangeOrderNotification"),
+}
+
+_classes = {}
+
+
+def message_class(template_id):
+    """Return the generated class for template_id, importing its module on first use."""
+    cls = _classes.get(template_id)
+    if cls is None:
+        try:
+            module_name, class_name = TEMPLATES[template_id]
+        except KeyError:
+            raise KeyError(f"unknown template_id {template_id}") from None
+        cls = getattr(importlib.import_module(f"{__package__}.{module_name}"), class_name)
+        _classes[template_id] = cls
+    return cls
+
+
+def loaded():
+    """Return the template ids whose classes have been imported so far."""
+    return sorted(_classes)
+
+
+def template_id_of(message_class):
+    """Return the template_id of a generated class, without importing anything."""
+    name = message_class.__name__
+    for template_id, (_, class_name) in TEMPLATES.items():
+        if class_name == name:
+            return template_id
+    raise KeyError(f"no template_id for {name}")
+
+
+def enum_name(msg, field):
+    """Return the name of the enum value msg.field holds, e.g. "BUY".
+
+    Looked up in the message's own descriptor, so there is no value to
+    name table to build or keep in step with the .proto files.
+    """
+    value = getattr(msg, field)
+    enum_value = msg.DESCRIPTOR.fields_by_name[field].enum_type.values_by_number.get(value)
+    return enum_value.name if enum_value is not None else str(value)
+
+
+class LazyModule:
+    """Stands in for a generated module until one of its attributes is used.
+
+    Lets code keep the module.Class style of the samples, e.g.
+    request_login_pb2.RequestLogin, without importing the module until
+    that line first runs.
+    """
+
+    def __init__(self, name):
+        self.__name = name
+        self.__module = None
+        self.__lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        module = self.__module
+        if module is None:
+            with self.__lock:
+                if self.__module is None:
+                    self.__module = importlib.import_module(self.__name)
+                module = self.__module
+        return getattr(module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self.__module is not None else "not loaded"
+        return f"<lazy module {self.__name!r} ({state})>"
+
+
+def lazy_module(name):
+    """Return a LazyModule for rithmic_api.<name>, e.g. lazy_module("request_login_pb2")."""
+    return LazyModule(f"{__package__}.{name}")
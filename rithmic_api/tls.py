@@ -0,0 +1,88 @@
+import logging
+import pathlib
+import ssl
+import threading
+
+logger = logging.getLogger(__name__)
+
+RITHMIC_CA_FILE = pathlib.Path(__file__).with_name("rithmic_ssl_cert_auth_params")
+
+_contexts = {}
+_contexts_lock = threading.Lock()
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """A client SSLContext that resumes the last TLS session per server.
+
+    asyncio (and so websockets) has no way to pass a session to a new
+    connection, so the session is injected in wrap_bio(), keyed by
+    server_hostname.  The module-level remember() stores the session of an
+    established connection; sessions are only valid with the context that
+    created them, which is why one context is shared process-wide.
+    """
+
+    def __new__(cls, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        return super().__new__(cls, protocol)
+
+    def __init__(self, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        super().__init__()
+        self.sessions = {}
+        self.handshakes = 0
+        self.resumed = 0
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        if session is None and not server_side:
+            session = self.sessions.get(server_hostname)
+        return super().wrap_bio(incoming, outgoing, server_side=server_side,
+                                server_hostname=server_hostname, session=session)
+
+    def remember(self, ssl_object):
+        """Store the session of an established connection made with this context."""
+        self.handshakes += 1
+        if ssl_object.session_reused:
+            self.resumed += 1
+        session = ssl_object.session
+        # a TLS 1.3 session is only resumable once its ticket has arrived,
+        # which is after the handshake; do not replace a good one before then
+        if session is not None and (session.has_ticket or ssl_object.version() != "TLSv1.3"):
+            self.sessions[ssl_object.server_hostname] = session
+
+    def forget(self, server_hostname=None):
+        """Drop the stored session for one server, or for all of them."""
+        if server_hostname is None:
+            self.sessions.clear()
+        else:
+            self.sessions.pop(server_hostname, None)
+
+    def stats(self):
+        return {
+            "handshakes": self.handshakes,
+            "resumed": self.resumed,
+            "sessions": len(self.sessions),
+        }
+
+
+def client_context(cafile=RITHMIC_CA_FILE):
+    """Return the shared client context trusting cafile, creating it once."""
+    key = str(cafile)
+    context = _contexts.get(key)
+    if context is None:
+        with _contexts_lock:
+            context = _contexts.get(key)
+            if context is None:
+                context = ResumingSSLContext()
+                context.load_verify_locations(cafile)
+                _contexts[key] = context
+    return context
+
+
+def remember(ws):
+    """Store ws's TLS session if it was made with a ResumingSSLContext.
+
+    Call it once the first response has been read, so that a TLS 1.3
+    session ticket has had time to arrive.
+    """
+    transport = getattr(ws, "transport", None)
+    ssl_object = transport.get_extra_info("ssl_object") if transport is not None else None
+    if ssl_object is not None and isinstance(ssl_object.context, ResumingSSLContext):
+        ssl_object.context.remember(ssl_object)
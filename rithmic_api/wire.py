@@ -0,0 +1,136 @@
+#   ===========================================================================
+#   Helpers that read (and write) a few fields straight from the protobuf
+#   wire format, for the hot paths where going through a whole message
+#   would be wasted work.
+#   Messages are serialized in field-number order, so a scan can stop as
+#   soon as it is past the fields it is looking for.
+
+WIRETYPE_VARINT = 0
+WIRETYPE_FIXED64 = 1
+WIRETYPE_LENGTH_DELIMITED = 2
+WIRETYPE_FIXED32 = 5
+
+SYMBOL_FIELD = 110100
+EXCHANGE_FIELD = 110101
+TEMPLATE_ID_FIELD = 154467
+
+
+class WireError(ValueError):
+    """Raised when a buffer is not a well-formed protobuf message."""
+
+
+def read_varint(buf, pos):
+    """Decode the varint at buf[pos]; returns (value, new_pos)."""
+    result = 0
+    shift = 0
+    while True:
+        try:
+            b = buf[pos]
+        except IndexError:
+            raise WireError("truncated varint") from None
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+        if shift >= 64:
+            raise WireError("varint too long")
+
+
+def encode_varint(value):
+    """Return the varint encoding of value; negative values take ten bytes."""
+    if value < 0:
+        value += 1 << 64
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def encode_tag(field_number, wire_type):
+    return encode_varint(field_number << 3 | wire_type)
+
+
+def skip_field(buf, pos, wire_type):
+    """Return the position just past a field value of the given wire type."""
+    if wire_type == WIRETYPE_VARINT:
+        return read_varint(buf, pos)[1]
+    if wire_type == WIRETYPE_FIXED64:
+        return pos + 8
+    if wire_type == WIRETYPE_LENGTH_DELIMITED:
+        length, pos = read_varint(buf, pos)
+        return pos + length
+    if wire_type == WIRETYPE_FIXED32:
+        return pos + 4
+    raise WireError(f"unsupported wire type {wire_type}")
+
+
+def instrument_key(buf):
+    """Return (exchange, symbol) from a market data message, or None."""
+    symbol = exchange = None
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        tag, pos = read_varint(buf, pos)
+        field_number = tag >> 3
+        wire_type = tag & 7
+        if field_number > EXCHANGE_FIELD:
+            break
+        if field_number == SYMBOL_FIELD or field_number == EXCHANGE_FIELD:
+            length, pos = read_varint(buf, pos)
+            value = bytes(buf[pos:pos + length]).decode("utf-8")
+            pos += length
+            if pos > end:
+                raise WireError("truncated message")
+            if field_number == SYMBOL_FIELD:
+                symbol = value
+            else:
+                exchange = value
+            continue
+        pos = skip_field(buf, pos, wire_type)
+    if symbol is None:
+        return None
+    return exchange, symbol
+
+
+def peek_template_id(buf):
+    """Return the template_id of a serialized message without parsing it."""
+    try:
+        return _peek_template_id(buf)
+    except IndexError:
+        raise WireError("truncated message") from None
+
+
+def _peek_template_id(buf):
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        # every Rithmic field number needs a three byte tag, so decode that
+        # case inline and fall back on read_varint() for anything else
+        b0 = buf[pos]
+        if b0 & 0x80 and pos + 2 < end and buf[pos + 1] & 0x80 and not buf[pos + 2] & 0x80:
+            tag = (b0 & 0x7f) | (buf[pos + 1] & 0x7f) << 7 | buf[pos + 2] << 14
+            pos += 3
+        else:
+            tag, pos = read_varint(buf, pos)
+        wire_type = tag & 7
+        if tag >> 3 == TEMPLATE_ID_FIELD:
+            if wire_type != WIRETYPE_VARINT:
+                raise WireError("template_id is not a varint")
+            return read_varint(buf, pos)[0]
+        if wire_type == WIRETYPE_LENGTH_DELIMITED:
+            length, pos = read_varint(buf, pos)
+            pos += length
+        elif wire_type == WIRETYPE_FIXED64:
+            pos += 8
+        elif wire_type == WIRETYPE_VARINT:
+            while buf[pos] & 0x80:
+                pos += 1
+            pos += 1
+        elif wire_type == WIRETYPE_FIXED32:
+            pos += 4
+        else:
+            raise WireError(f"unsupported wire type {wire_type}")
+    raise WireError("message has no template_id")
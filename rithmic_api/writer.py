@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import time
+
+import websockets
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriter:
+    """Sends every outbound frame for one connection from a single task.
+
+    Callers enqueue serialized requests; the writer takes everything that
+    is pending and writes it as back-to-back frames, so requests issued
+    together go out in one batch, in the order they were queued.  send()
+    waits until the frame is written, send_nowait() does not.  Every frame
+    goes through the queue, so depth, batch and latency stats cover all
+    outbound traffic.
+
+    Like MessageReader, a writer can be attached to a new websocket after
+    a reconnect.  Frames are not held back while the connection is down:
+    until attach() they are written to the old websocket and fail with
+    ConnectionClosed, and it is up to the caller to send them again.  When
+    a write fails partway through a batch only the frames not yet written
+    fail.
+    """
+
+    def __init__(self, ws, maxsize=0, on_sent=None):
+        self.ws = ws
+        self.on_sent = on_sent
+
+        self.frames = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.max_depth = 0
+        self.last_latency = None
+        self.max_latency = None
+        self.avg_latency = None
+
+        self._queue = asyncio.Queue(maxsize)
+        self._task = None
+
+    def start(self):
+        """Start the writer task; returns self so it can be chained."""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    async def stop(self):
+        """Cancel the writer task and fail anything still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._fail_queued(websockets.ConnectionClosedOK(None, None))
+
+    def attach(self, ws):
+        """Write to a new websocket from now on."""
+        self.ws = ws
+
+    async def send(self, buf):
+        """Queue buf and wait until it has been written."""
+        future = asyncio.get_running_loop().create_future()
+        await self._put(buf, future)
+        await future
+
+    def send_nowait(self, buf):
+        """Queue buf without waiting; failures are only logged."""
+        self._queue.put_nowait((buf, None, time.monotonic()))
+        self._note_depth()
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "depth": self._queue.qsize(),
+            "max_depth": self.max_depth,
+            "frames": self.frames,
+            "batches": self.batches,
+            "avg_batch": self.frames / self.batches if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "last_latency": self.last_latency,
+            "avg_latency": self.avg_latency,
+            "max_latency": self.max_latency,
+        }
+
+    async def _put(self, buf, future):
+        await self._queue.put((buf, future, time.monotonic()))
+        self._note_depth()
+
+    def _note_depth(self):
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            ws = self.ws
+            sent = 0
+            try:
+                for buf, _, _ in batch:
+                    await ws.send(buf)
+                    sent += 1
+            except asyncio.CancelledError:
+                self._sent(batch[:sent])
+                self._fail(batch[sent:], websockets.ConnectionClosedOK(None, None))
+                raise
+            except Exception as e:
+                # frames written before the failure reached the gateway
+                self._sent(batch[:sent])
+                self._fail(batch[sent:], e)
+                continue
+            self._sent(batch)
+
+    def _sent(self, batch):
+        if not batch:
+            return
+        now = time.monotonic()
+        for buf, future, queued_at in batch:
+            latency = now - queued_at
+            self.last_latency = latency
+            self.max_latency = latency if self.max_latency is None else max(self.max_latency, latency)
+            self.avg_latency = latency if self.avg_latency is None else self.avg_latency + (latency - self.avg_latency) / 8
+            if future is not None and not future.done():
+                future.set_result(None)
+        self.frames += len(batch)
+        self.batches += 1
+        self.max_batch = max(self.max_batch, len(batch))
+        if self.on_sent is not None:
+            self.on_sent()
+
+    def _fail(self, batch, exc):
+        for buf, future, _ in batch:
+            if future is None:
+                logger.warning("Dropped an outbound frame: %s", exc)
+            elif not future.done():
+                future.set_exception(exc)
+
+    def _fail_queued(self, exc):
+        batch = []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        self._fail(batch, exc)
@@ -1,3 +1,820 @@
-from django.test import TestCase
+import asyncio
+import os
+import random
+import struct
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from rithmic_api.events import EventBus
+from rithmic_api.heartbeat import HEARTBEAT_REQUEST, HeartbeatScheduler
+from rithmic_api.quote_state import EMPTY_QUOTE, EMPTY_TRADE, InstrumentState, QuoteState
+from rithmic_api import bar_replay, decoders, order_book, quote_cache, session_pool, shared_quotes, wire
+from rithmic_api.best_bid_offer_pb2 import BestBidOffer
+from rithmic_api.correlation import RequestError, RequestRouter
+from rithmic_api.last_trade_pb2 import LastTrade
+from rithmic_api.reader import DROP_OLDEST, MessageReader
+from rithmic_api.writer import MessageWriter
+from rithmic_api.request_new_order_pb2 import RequestNewOrder
+from rithmic_api.request_templates import RequestTemplate
+from rithmic_api.request_trade_routes_pb2 import RequestTradeRoutes
+from rithmic_api.response_tick_bar_replay_pb2 import ResponseTickBarReplay
+from rithmic_api.response_trade_routes_pb2 import ResponseTradeRoutes
+from rithmic_api.local_server import LocalRithmicServer
+from rithmic_api.session import SUBSCRIBE, UNSUBSCRIBE, RithmicSession, digest_password
+from rithmic_api.subscriptions import BBO, LAST_TRADE, OPEN_INTEREST, SubscriptionManager
+
+
+class _Handler:
+    def __init__(self):
+        self.calls = []
+
+    def on_frame(self, template_id, msg_buf):
+        self.calls.append((template_id, msg_buf))
+
+
+class MessageReaderCallbackTests(SimpleTestCase):
+    def test_remove_bound_method_callback(self):
+        reader = MessageReader(None)
+        handler = _Handler()
+        reader.add_callback(150, handler.on_frame)
+        # a fresh bound method object, equal to but not the one registered
+        reader.remove_callback(150, handler.on_frame)
+        self.assertNotIn(150, reader._callbacks)
+
+    def test_remove_leaves_other_callbacks(self):
+        reader = MessageReader(None)
+        first, second = _Handler(), _Handler()
+        reader.add_callback(150, first.on_frame)
+        reader.add_callback(150, second.on_frame)
+        reader.remove_callback(150, first.on_frame)
+        self.assertEqual(reader._callbacks[150], [second.on_frame])
+
+
+class _Socket:
+    """Stands in for a websocket: yields frames fed to it, None ends it."""
+
+    def __init__(self):
+        self.frames = asyncio.Queue()
+
+    async def __aiter__(self):
+        while True:
+            msg_buf = await self.frames.get()
+            if msg_buf is None:
+                return
+            yield msg_buf
+
+
+class RequestRouterTests(SimpleTestCase):
+    async def open(self):
+        self.ws = _Socket()
+        self.sent = []
+        self.reader = MessageReader(self.ws).start()
+
+        async def send(buf):
+            self.sent.append(RequestTradeRoutes.FromString(buf))
+        self.router = RequestRouter(self.reader, send)
+
+    async def sent_token(self):
+        while not self.sent:
+            await asyncio.sleep(0)
+        return self.sent[-1].user_msg[-1]
+
+    def feed(self, response):
+        self.ws.frames.put_nowait(response.SerializeToString())
+
+    def test_collects_responses_until_rp_code(self):
+        async def run():
+            await self.open()
+            request = asyncio.ensure_future(self.router.request(RequestTradeRoutes(template_id=310),
+                                                                ResponseTradeRoutes))
+            token = await self.sent_token()
+            for trade_route in ("a", "b"):
+                self.feed(ResponseTradeRoutes(template_id=311, user_msg=[token], rq_handler_rp_code=["0"],
+                                              trade_route=trade_route))
+            self.feed(ResponseTradeRoutes(template_id=311, user_msg=[token], rp_code=["0"]))
+            return await request
+        responses = asyncio.run(run())
+        self.assertEqual([r.trade_route for r in responses], ["a", "b", ""])
+
+    def test_error_rp_code_raises(self):
+        async def run():
+            await self.open()
+            request = asyncio.ensure_future(self.router.request(RequestTradeRoutes(template_id=310),
+                                                                ResponseTradeRoutes))
+            self.feed(ResponseTradeRoutes(template_id=311, user_msg=[await self.sent_token()],
+                                          rp_code=["3", "bad request"]))
+            with self.assertRaises(RequestError):
+                await request
+        asyncio.run(run())
+
+    def test_later_responses_matched_on_request_key(self):
+        async def run():
+            await self.open()
+            request = asyncio.ensure_future(self.router.request(RequestTradeRoutes(template_id=206),
+                                                                ResponseTickBarReplay))
+            token = await self.sent_token()
+            self.feed(ResponseTickBarReplay(template_id=207, user_msg=[token], request_key="k1",
+                                            rq_handler_rp_code=["0"], volume=1))
+            self.feed(ResponseTickBarReplay(template_id=207, request_key="other", rq_handler_rp_code=["0"],
+                                            volume=99))
+            self.feed(ResponseTickBarReplay(template_id=207, request_key="k1", rq_handler_rp_code=["0"],
+                                            volume=2))
+            self.feed(ResponseTickBarReplay(template_id=207, request_key="k1", rp_code=["0"]))
+            return await request
+        responses = asyncio.run(run())
+        self.assertEqual([r.volume for r in responses], [1, 2, 0])
+
+    def test_unrelated_frames_reach_streams(self):
+        async def run():
+            await self.open()
+            stream = self.reader.stream(311)
+            request = asyncio.ensure_future(self.router.request(RequestTradeRoutes(template_id=310),
+                                                                ResponseTradeRoutes))
+            token = await self.sent_token()
+            self.feed(ResponseTradeRoutes(template_id=311, user_msg=["someone else"], rp_code=["0"]))
+            self.feed(ResponseTradeRoutes(template_id=311, user_msg=[token], rp_code=["0"]))
+            await request
+            self.ws.frames.put_nowait(None)
+            return [ResponseTradeRoutes.FromString(msg_buf).user_msg[0] async for _, msg_buf in stream]
+        user_msgs = asyncio.run(run())
+        self.assertEqual(user_msgs[0], "someone else")
+
+    def test_disconnect_fails_pending_and_later_requests(self):
+        async def run():
+            await self.open()
+            request = asyncio.ensure_future(self.router.request(RequestTradeRoutes(template_id=310),
+                                                                ResponseTradeRoutes))
+            await self.sent_token()
+            self.ws.frames.put_nowait(None)
+            with self.assertRaises(ConnectionResetError):
+                await asyncio.wait_for(request, 1)
+            with self.assertRaises(ConnectionResetError):
+                await self.router.request(RequestTradeRoutes(template_id=310), ResponseTradeRoutes)
+            self.assertEqual(len(self.sent), 1)
+        asyncio.run(run())
+
+
+class _ClosingSocket:
+    """Accepts a number of frames, then fails like a dropped websocket."""
+
+    def __init__(self, accept):
+        self.accept = accept
+        self.sent = []
+
+    async def send(self, buf):
+        if len(self.sent) >= self.accept:
+            raise ConnectionResetError("connection lost")
+        self.sent.append(buf)
+
+
+class MessageWriterTests(SimpleTestCase):
+    def test_failure_partway_through_a_batch_fails_only_unsent_frames(self):
+        ws = _ClosingSocket(accept=2)
+
+        async def run():
+            writer = MessageWriter(ws)
+            sends = [asyncio.ensure_future(writer.send(buf)) for buf in (b"1", b"2", b"3")]
+            await asyncio.sleep(0)
+            writer.start()
+            results = await asyncio.gather(*sends, return_exceptions=True)
+            await writer.stop()
+            return writer, results
+        writer, results = asyncio.run(run())
+        self.assertEqual(results[:2], [None, None])
+        self.assertIsInstance(results[2], ConnectionResetError)
+        self.assertEqual((ws.sent, writer.frames, writer.batches), ([b"1", b"2"], 2, 1))
+
+
+class FieldDecoderTests(SimpleTestCase):
+    def setUp(self):
+        self.quote = decoders.FieldDecoder(BestBidOffer, ("symbol", "exchange", "presence_bits", "bid_price",
+                                                          "bid_size", "bid_orders", "ask_price", "ssboe", "usecs"))
+        self.trade = decoders.FieldDecoder(LastTrade, ("symbol", "trade_price", "trade_size", "aggressor",
+                                                       "net_change", "volume", "usecs"))
+
+    def test_records_match_the_full_parse(self):
+        quote = BestBidOffer(template_id=151, symbol="ESZ6", exchange="CME", presence_bits=3, bid_price=5000.25,
+                             bid_size=12, bid_orders=3, ask_price=5000.5, ssboe=1792300000, usecs=123456)
+        trade = LastTrade(template_id=150, symbol="ESZ6", trade_price=5000.25, trade_size=2,
+                          aggressor=LastTrade.TransactionType.SELL, net_change=-12.5, volume=1 << 40, usecs=9)
+        self.assertEqual(self.quote.mismatches(quote.SerializeToString()), {})
+        self.assertEqual(self.trade.mismatches(trade.SerializeToString()), {})
+        self.assertEqual(self.quote.decode(quote.SerializeToString()).bid_orders, 3)
+
+    def test_absent_fields_take_their_defaults(self):
+        buf = BestBidOffer(template_id=151, symbol="ESZ6").SerializeToString()
+        self.assertEqual(self.quote.mismatches(buf), {})
+        record = self.quote.decode(buf)
+        self.assertEqual((record.exchange, record.bid_price, record.bid_size), ("", 0.0, 0))
+
+    def test_negative_int32(self):
+        buf = BestBidOffer(template_id=151, symbol="ESZ6", bid_size=-5, bid_orders=-2147483648).SerializeToString()
+        self.assertEqual(self.quote.mismatches(buf), {})
+        self.assertEqual(self.quote.decode(buf).bid_size, -5)
+
+    def test_truncated_buffers_raise(self):
+        buf = BestBidOffer(template_id=151, symbol="ESZ6", exchange="CME", bid_price=5000.25,
+                           bid_size=-5, usecs=300).SerializeToString()
+        # cut inside bid_price, bid_size, symbol, exchange and usecs
+        for length in (5, 20, 29, 36, 42):
+            with self.assertRaises(wire.WireError):
+                self.quote.decode(buf[:length])
+
+    def test_peek_template_id(self):
+        buf = BestBidOffer(template_id=151, symbol="ESZ6", exchange="CME", bid_price=5000.25).SerializeToString()
+        self.assertEqual(wire.peek_template_id(buf), 151)
+        for truncated in (buf[:-1], buf[:5], BestBidOffer(symbol="ESZ6").SerializePartialToString()):
+            with self.assertRaises(wire.WireError):
+                wire.peek_template_id(truncated)
+
+
+class RequestTemplateTests(SimpleTestCase):
+    ORDER = dict(user_msg=["hello"], fcm_id="LocalFCM", ib_id="LocalIB", account_id="ACCT-1",
+                 exchange="CME", symbol="ESZ6", duration=RequestNewOrder.Duration.DAY,
+                 price_type=RequestNewOrder.PriceType.LIMIT, trade_route="simulator",
+                 manual_or_auto=RequestNewOrder.OrderPlacement.MANUAL)
+    VALUES = dict(user_tag="order-1", quantity=3, price=5000.25,
+                  transaction_type=RequestNewOrder.TransactionType.SELL)
+
+    def assertEncodesAsMessage(self, template, **values):
+        self.assertEqual(template.encode(**values), template.message(**values).SerializeToString())
+
+    def test_new_order_matches_full_serialization(self):
+        template = RequestTemplate(312, tuple(self.VALUES), **self.ORDER)
+        self.assertEncodesAsMessage(template, **self.VALUES)
+        self.assertEncodesAsMessage(template, **dict(self.VALUES, price=-0.25, quantity=0))
+
+    def test_subsets_of_varying_fields(self):
+        for names in (("price",), ("user_tag", "transaction_type"), ("quantity", "price", "user_tag")):
+            template = RequestTemplate(312, names, **self.ORDER)
+            self.assertEncodesAsMessage(template, **{name: self.VALUES[name] for name in names})
+
+    def test_omitted_field_is_left_out(self):
+        template = RequestTemplate(312, tuple(self.VALUES), **self.ORDER)
+        self.assertEncodesAsMessage(template, user_tag="order-2", quantity=1)
+        self.assertEncodesAsMessage(template)
+
+    def test_repeated_user_msg_of_heartbeat(self):
+        for user_msg in ((), ("hb1",), ("hb1", "second")):
+            self.assertEncodesAsMessage(HEARTBEAT_REQUEST, user_msg=user_msg, ssboe=1792313612, usecs=250)
+
+    def test_unknown_varying_field_is_refused(self):
+        template = RequestTemplate(312, ("price",), **self.ORDER)
+        with self.assertRaises(TypeError):
+            template.encode(quantity=1)
+        with self.assertRaises(ValueError):
+            RequestTemplate(312, ("no_such_field",)).encode()
+
+
+async def _until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        await asyncio.sleep(0.01)
+
+
+class ReconnectTests(SimpleTestCase):
+    def test_reconnect_replays_subscriptions_and_keeps_consumers(self):
+        server = LocalRithmicServer(port=0, rate=200)
+        subscribed = []
+        on_market_data_update = server._handlers[100]
+
+        async def record(conn, msg_buf):
+            subscribed.append((conn, msg_buf))
+            await on_market_data_update(conn, msg_buf)
+        server._handlers[100] = record
+        quotes = []
+
+        async def run():
+            await server.start()
+            session = await RithmicSession.open(server.uri, "Rithmic Test", "user", "password")
+            try:
+                supervisor = session.supervise(base_delay=0.01)
+                stream = session.reader.stream(150, 151, maxsize=10, overflow=DROP_OLDEST)
+                session.reader.add_callback(151, lambda template_id, msg_buf: quotes.append(msg_buf))
+                await session.subscribe_market_data("CME", "ESZ6", LAST_TRADE | BBO)
+                await asyncio.wait_for(stream.get(), 5)
+
+                with self.assertLogs("rithmic_api.reconnect", "WARNING"):
+                    session.ws.transport.abort()
+                    await _until(lambda: supervisor.reconnects == 1)
+                seen = len(quotes)
+                while stream.qsize():
+                    await stream.get()
+                self.assertIsNotNone(await asyncio.wait_for(stream.get(), 5))
+                await _until(lambda: len(quotes) > seen)
+                return supervisor.stats()
+            finally:
+                await session.close()
+                await server.stop()
+        stats = asyncio.run(run())
+        self.assertEqual((stats["reconnects"], stats["failed_attempts"]), (1, 0))
+        self.assertEqual(len(subscribed), 2)
+        self.assertIsNot(subscribed[0][0], subscribed[1][0])
+        self.assertEqual(subscribed[0][1], subscribed[1][1])
+
+
+class HeartbeatSchedulerTests(SimpleTestCase):
+    def test_stop_detaches_from_reader(self):
+        reader = MessageReader(None)
+        heartbeat = HeartbeatScheduler(lambda buf: None, reader, 30)
+        self.assertIn(19, reader._callbacks)
+        heartbeat.stop()
+        self.assertNotIn(19, reader._callbacks)
+
+
+class _Message:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class EventBusTests(SimpleTestCase):
+    def test_filter_on_missing_field_matches_nothing(self):
+        bus = EventBus()
+        calls = []
+        bus.subscribe(351, lambda template_id, msg: calls.append("filtered"), basket_id="1")
+        bus.subscribe(351, lambda template_id, msg: calls.append("all"))
+        bus.publish(351, _Message(symbol="ESZ6"))
+        self.assertEqual(calls, ["all"])
+
+    def test_later_filters_on_missing_field(self):
+        bus = EventBus()
+        calls = []
+        bus.subscribe(351, lambda template_id, msg: calls.append(msg), symbol="ESZ6", basket_id="1")
+        bus.publish(351, _Message(symbol="ESZ6"))
+        bus.publish(351, _Message(symbol="ESZ6", basket_id="1"))
+        self.assertEqual(len(calls), 1)
+
+
+class _Session:
+    """Stands in for a RithmicSession: records market data requests."""
+
+    def __init__(self):
+        self.reader = MessageReader(None)
+        self.requests = []
+
+    async def subscribe_market_data(self, exchange, symbol, update_bits, request=SUBSCRIBE):
+        self.requests.append((exchange, symbol, update_bits, request))
+        # let other tasks run while the request is acknowledged
+        await asyncio.sleep(0)
+
+
+class _Pool:
+    def __init__(self):
+        self.acquired = 0
+
+    async def acquire(self, uri, system_name, user_id, password):
+        self.acquired += 1
+        return _Session()
+
+    async def release(self, session):
+        pass
+
+
+class _PooledSession:
+    """Stands in for a RithmicSession opened by the pool."""
+
+    def __init__(self, key, password):
+        self.key = key
+        self.infra_type = key[3]
+        self.password_digest = digest_password(password)
+        self.is_open = True
+        self.closed = False
+        self.heartbeat = self.writer = mock.Mock(**{"stats.return_value": {}})
+        self.supervisor = None
+
+    async def close(self):
+        self.closed = True
+        self.is_open = False
+
+
+class SessionPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.opened = []
+
+        async def open_session(uri, system_name, user_id, password, infra_type):
+            session = _PooledSession((uri, system_name, user_id, infra_type), password)
+            self.opened.append(session)
+            return session
+        patcher = mock.patch.object(session_pool.RithmicSession, "open", open_session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def acquire(self, pool, password="sécret"):
+        return pool.acquire("ws://plant", "Rithmic Test", "user", password)
+
+    def test_released_session_is_reused(self):
+        async def run():
+            pool = session_pool.SessionPool(reconnect=False)
+            first = await self.acquire(pool)
+            await pool.release(first)
+            second = await self.acquire(pool)
+            third = await self.acquire(pool)
+            await pool.close_all()
+            return pool, first, second, third
+        pool, first, second, third = asyncio.run(run())
+        self.assertIs(second, first)
+        self.assertIsNot(third, first)
+        self.assertEqual((pool.hits, pool.misses), (1, 2))
+
+    def test_other_password_is_a_miss(self):
+        async def run():
+            pool = session_pool.SessionPool(reconnect=False)
+            await pool.release(await self.acquire(pool))
+            other = await self.acquire(pool, "other sécret")
+            await pool.close_all()
+            return pool, other
+        pool, other = asyncio.run(run())
+        self.assertIs(other, self.opened[1])
+        self.assertEqual((pool.hits, pool.misses), (0, 2))
+
+    def test_idle_sessions_are_evicted(self):
+        async def run():
+            pool = session_pool.SessionPool(idle_timeout=60, reconnect=False)
+            fresh, stale = await self.acquire(pool), await self.acquire(pool)
+            await pool.release(fresh)
+            await pool.release(stale)
+            stale.last_used -= 120
+            await pool.evict_idle()
+            stats = pool.stats()
+            await pool.close_all()
+            return pool, stats, fresh, stale
+        pool, stats, fresh, stale = asyncio.run(run())
+        self.assertTrue(stale.closed)
+        self.assertEqual((pool.evictions, stats["idle"]), (1, 1))
+        self.assertEqual(stats["heartbeats"], [{"session": 0, "infra_type": 1}])
+        self.assertTrue(fresh.closed)
+
+
+class QuoteCacheTests(SimpleTestCase):
+    def follow(self, cache, password, symbol):
+        return cache.follow("ws://plant", "Rithmic Test", "user", password, [("CME", symbol)])
+
+    def test_feed_reused_with_same_password(self):
+        pool = _Pool()
+        cache = quote_cache.QuoteCache()
+
+        async def run():
+            await self.follow(cache, "secret", "ESZ6")
+            await self.follow(cache, "secret", "NQZ6")
+        with mock.patch.object(quote_cache, "pool", pool):
+            asyncio.run(run())
+        self.assertEqual(pool.acquired, 1)
+        self.assertEqual(cache.stats()["following"], 2)
+
+    def test_feed_refused_with_other_password(self):
+        pool = _Pool()
+        cache = quote_cache.QuoteCache()
+
+        async def run():
+            await self.follow(cache, "secret", "ESZ6")
+            with self.assertRaises(PermissionError):
+                await self.follow(cache, "guess", "NQZ6")
+        with mock.patch.object(quote_cache, "pool", pool):
+            asyncio.run(run())
+        self.assertEqual(pool.acquired, 1)
+        self.assertEqual(cache.stats()["following"], 1)
+        session = next(iter(cache._feeds.values())).session
+        self.assertNotIn("NQZ6", [symbol for _, symbol, _, _ in session.requests])
+
+
+class SubscriptionManagerTests(SimpleTestCase):
+    def test_reference_counted_subscribe_and_release(self):
+        session = _Session()
+
+        async def run():
+            manager = SubscriptionManager([session])
+            first = await manager.subscribe("CME", "ESZ6", LAST_TRADE)
+            second = await manager.subscribe("CME", "ESZ6", LAST_TRADE)
+            self.assertEqual(session.requests, [("CME", "ESZ6", LAST_TRADE, SUBSCRIBE)])
+            await manager.release(first)
+            self.assertEqual(len(session.requests), 1)
+            self.assertIn(("CME", "ESZ6"), manager)
+            await manager.release(second)
+            await manager.release(second)
+            self.assertEqual(session.requests[1:], [("CME", "ESZ6", LAST_TRADE, UNSUBSCRIBE)])
+            self.assertEqual(len(manager), 0)
+        asyncio.run(run())
+
+    def test_locks_are_dropped_with_their_instruments(self):
+        session = _Session()
+
+        async def run():
+            manager = SubscriptionManager([session])
+            first = await manager.subscribe("CME", "ESZ6", LAST_TRADE)
+            for symbol in ("NQZ6", "YMZ6"):
+                await manager.release(await manager.subscribe("CME", symbol, LAST_TRADE))
+            self.assertEqual(list(manager._locks), [("CME", "ESZ6")])
+            # a subscribe waiting while the last interest leaves keeps the lock
+            _, second = await asyncio.gather(manager.release(first), manager.subscribe("CME", "ESZ6", BBO))
+            self.assertEqual(list(manager._locks), [("CME", "ESZ6")])
+            self.assertEqual(session.requests[-2:], [("CME", "ESZ6", LAST_TRADE, UNSUBSCRIBE),
+                                                     ("CME", "ESZ6", BBO, SUBSCRIBE)])
+            await manager.release(second)
+            self.assertEqual((manager._locks, len(manager)), ({}, 0))
+        asyncio.run(run())
+
+    def test_union_of_update_bits(self):
+        session = _Session()
+
+        async def run():
+            manager = SubscriptionManager([session])
+            await manager.subscribe("CME", "ESZ6", LAST_TRADE)
+            quotes = await manager.subscribe("CME", "ESZ6", BBO)
+            self.assertEqual(session.requests[-1], ("CME", "ESZ6", LAST_TRADE | BBO, SUBSCRIBE))
+            await manager.release(quotes)
+            self.assertEqual(session.requests[-2:], [("CME", "ESZ6", BBO, UNSUBSCRIBE),
+                                                     ("CME", "ESZ6", LAST_TRADE, SUBSCRIBE)])
+        asyncio.run(run())
+
+    def test_frames_only_reach_interests_with_their_bits(self):
+        session = _Session()
+        trades, quotes = [], []
+        msg = BestBidOffer(template_id=151, symbol="ESZ6", exchange="CME", presence_bits=1, bid_price=1.0)
+
+        async def run():
+            manager = SubscriptionManager([session])
+            await manager.subscribe("CME", "ESZ6", LAST_TRADE, lambda t, b: trades.append(t))
+            await manager.subscribe("CME", "ESZ6", BBO, lambda t, b: quotes.append(t))
+            for callback in session.reader._callbacks[151]:
+                callback(151, msg.SerializeToString())
+        asyncio.run(run())
+        self.assertEqual((trades, quotes), ([], [151]))
+
+    def test_open_interest_frames_are_routed(self):
+        session = _Session()
+        trades, open_interest = [], []
+        # OpenInterest carries symbol and exchange in the same fields as
+        # every other market data template
+        msg = BestBidOffer(template_id=158, symbol="ESZ6", exchange="CME")
+
+        async def run():
+            manager = SubscriptionManager([session])
+            await manager.subscribe("CME", "ESZ6", LAST_TRADE, lambda t, b: trades.append(t))
+            await manager.subscribe("CME", "ESZ6", OPEN_INTEREST, lambda t, b: open_interest.append(t))
+            for callback in session.reader._callbacks[158]:
+                callback(158, msg.SerializeToString())
+        asyncio.run(run())
+        self.assertEqual((trades, open_interest), ([], [158]))
+
+    def test_close_leaves_reader_callbacks_as_before(self):
+        session = _Session()
+        other = _Handler()
+        session.reader.add_callback(151, other.on_frame)
+        before = {template_id: list(callbacks) for template_id, callbacks in session.reader._callbacks.items()}
+
+        async def run():
+            for _ in range(3):
+                manager = SubscriptionManager([session])
+                await manager.subscribe("CME", "ESZ6", LAST_TRADE | BBO)
+                await manager.close()
+        asyncio.run(run())
+        self.assertEqual(session.reader._callbacks, before)
+        self.assertEqual(session.requests[-1], ("CME", "ESZ6", LAST_TRADE | BBO, UNSUBSCRIBE))
+
+
+class QuoteStateTests(SimpleTestCase):
+    BID, ASK = 1, 2
+
+    def setUp(self):
+        self.state = QuoteState()
+
+    def quote(self, **fields):
+        msg = BestBidOffer(template_id=151, symbol="ESZ6", exchange="CME", **fields)
+        return self.state.update_buf(151, msg.SerializeToString()).quote
+
+    def test_partial_update_keeps_the_other_side(self):
+        self.quote(presence_bits=self.BID | self.ASK, is_snapshot=True,
+                   bid_price=100.0, bid_size=3, ask_price=100.25, ask_size=4)
+        quote = self.quote(presence_bits=self.BID, bid_price=100.0, bid_size=7)
+        self.assertEqual((quote.bid_price, quote.bid_size, quote.ask_price, quote.ask_size),
+                         (100.0, 7, 100.25, 4))
+
+    def test_clear_bits_empty_a_side(self):
+        self.quote(presence_bits=self.BID | self.ASK, bid_price=100.0, bid_size=3, ask_price=100.25, ask_size=4)
+        quote = self.quote(clear_bits=self.ASK)
+        self.assertEqual((quote.bid_price, quote.bid_size), (100.0, 3))
+        self.assertEqual((quote.ask_price, quote.ask_size, quote.ask_orders), (None, None, None))
+
+    def test_snapshot_replaces_the_state(self):
+        self.quote(presence_bits=self.BID | self.ASK, bid_price=100.0, bid_size=3, ask_price=100.25, ask_size=4)
+        quote = self.quote(presence_bits=self.BID, is_snapshot=True, bid_price=99.75, bid_size=1)
+        self.assertEqual((quote.bid_price, quote.bid_size, quote.ask_price), (99.75, 1, None))
+
+    def test_trade_groups_merge_separately(self):
+        def trade(**fields):
+            msg = LastTrade(template_id=150, symbol="ESZ6", exchange="CME", **fields)
+            return self.state.update_buf(150, msg.SerializeToString()).trade
+        trade(presence_bits=1 | 8, trade_price=100.0, trade_size=2, volume=10, ssboe=1792300000)
+        latest = trade(presence_bits=8, volume=12, ssboe=1792300001)
+        self.assertEqual((latest.trade_price, latest.trade_size, latest.volume, latest.ssboe),
+                         (100.0, 2, 12, 1792300001))
+        self.assertIsNone(latest.vwap)
+        self.assertEqual(self.state.stats(), {"instruments": 1, "updates": 2, "malformed": 0})
+
+    def test_malformed_frame_is_counted(self):
+        msg = BestBidOffer(template_id=151, symbol="ESZ6", exchange="CME", presence_bits=self.BID, bid_price=1.0)
+        with self.assertLogs("rithmic_api.quote_state", "WARNING"):
+            self.assertIsNone(self.state.update_buf(151, msg.SerializeToString()[:-3]))
+        self.assertEqual(self.state.malformed, 1)
+
+
+class SharedQuoteTableTests(SimpleTestCase):
+    def setUp(self):
+        self.writer = shared_quotes.QuoteTableWriter(f"test_quotes_{os.getpid()}", capacity=4)
+        self.reader = shared_quotes.QuoteTableReader(self.writer.name, timeout=0.01)
+
+    def tearDown(self):
+        self.reader.close()
+        self.writer.close()
+
+    def publish(self, symbol, **quote):
+        state = InstrumentState("CME", symbol)
+        state.quote = EMPTY_QUOTE._replace(**quote)
+        state.trade = EMPTY_TRADE._replace(trade_price=5000.5, trade_size=2, volume=10)
+        state.received_at = time.time()
+        self.writer.publish(state)
+        return state
+
+    def test_round_trip(self):
+        self.publish("ESZ6", bid_price=5000.25, bid_size=3, ssboe=1792300000, usecs=500000)
+        quote = self.reader.quote("CME", "ESZ6")
+        self.assertEqual((quote["bid_price"], quote["bid_size"]), (5000.25, 3))
+        self.assertEqual((quote["ask_price"], quote["ask_size"]), (None, None))
+        self.assertEqual((quote["last_price"], quote["last_size"], quote["volume"]), (5000.5, 2, 10))
+        self.assertEqual(quote["quote_time"], 1792300000.5)
+        self.assertFalse(quote["stale"])
+        self.assertEqual(self.reader.instruments(), [("CME", "ESZ6")])
+        self.assertIsNone(self.reader.quote("CME", "NQZ6"))
+
+    def test_updates_and_new_instruments_are_seen(self):
+        self.publish("ESZ6", bid_price=1.0, bid_size=1)
+        self.reader.quote("CME", "ESZ6")
+        self.publish("ESZ6", bid_price=2.0, bid_size=2)
+        self.publish("NQZ6", ask_price=3.0, ask_size=3)
+        self.assertEqual(self.reader.quote("CME", "ESZ6")["bid_price"], 2.0)
+        found, missing = self.reader.quotes([("CME", "NQZ6"), ("CME", "YMZ6")])
+        self.assertEqual([q["ask_price"] for q in found], [3.0])
+        self.assertEqual(missing, ["CME:YMZ6"])
+
+    def test_reader_never_returns_a_record_mid_write(self):
+        self.publish("ESZ6", bid_price=1.0, bid_size=1)
+        # leave the sequence number odd, as a writer stopped halfway would
+        offset = self.reader._records
+        seq = shared_quotes._SEQ.unpack_from(self.writer._buf, offset)[0]
+        shared_quotes._SEQ.pack_into(self.writer._buf, offset, seq + 1)
+        with self.assertRaises(TimeoutError):
+            self.reader.quote("CME", "ESZ6")
+        shared_quotes._SEQ.pack_into(self.writer._buf, offset, seq + 2)
+        self.assertEqual(self.reader.quote("CME", "ESZ6")["bid_price"], 1.0)
+
+
+class TickBarReplayTests(SimpleTestCase):
+    # a price whose eight bytes start with the bytes of the rp_code tag
+    TAGGED_PRICE = struct.unpack("<d", bar_replay._RP_CODE_TAG + b"\x00\x00\x00\x00\x40")[0]
+
+    def bar(self, i, **fields):
+        fields.setdefault("open_price", 5000.0 + i)
+        return ResponseTickBarReplay(template_id=207, request_key="k1", rq_handler_rp_code=["0"],
+                                     symbol="ESZ6", exchange="CME", type=1, num_trades=i, volume=i,
+                                     data_bar_ssboe=[1792300000 + i], data_bar_usecs=[i], **fields)
+
+    def replay(self, frames, batch_size=3):
+        async def run():
+            decoder = bar_replay.TickBarReplayDecoder(batch_size=batch_size, workers=0)
+            for msg in frames:
+                decoder.add(207, msg.SerializeToString())
+            return decoder, await asyncio.wait_for(decoder.result(), 5)
+        return asyncio.run(run())
+
+    def test_rp_code_tag_inside_a_value_is_not_the_end(self):
+        buf = self.bar(1, open_price=self.TAGGED_PRICE).SerializeToString()
+        self.assertIn(bar_replay._RP_CODE_TAG, buf)
+        self.assertFalse(bar_replay.is_end_of_response(buf))
+        end = ResponseTickBarReplay(template_id=207, request_key="k1", rp_code=["0"])
+        self.assertTrue(bar_replay.is_end_of_response(end.SerializeToString()))
+
+        decoder, bars = self.replay([self.bar(1, open_price=self.TAGGED_PRICE), end])
+        self.assertEqual(bars["open_price"].tolist(), [self.TAGGED_PRICE])
+
+    def test_rows_keep_their_order_across_batches(self):
+        end = ResponseTickBarReplay(template_id=207, request_key="k1", rp_code=["0"])
+        decoder, bars = self.replay([self.bar(i) for i in range(10)] + [end])
+        self.assertEqual(bars["volume"].tolist(), list(range(10)))
+        self.assertEqual(bars["ssboe"].tolist(), [1792300000 + i for i in range(10)])
+        self.assertEqual(bars["open_price"][-1], 5009.0)
+        self.assertEqual((decoder.bars, decoder.batches, decoder.end.rp_code), (10, 4, ["0"]))
+
+    def test_error_end_of_response(self):
+        end = ResponseTickBarReplay(template_id=207, request_key="k1", rp_code=["7", "no data"])
+        decoder, bars = self.replay([self.bar(0), end])
+        self.assertTrue(decoder.done)
+        self.assertEqual(list(decoder.end.rp_code), ["7", "no data"])
+        self.assertEqual(len(bars), 1)
+        decoder, bars = self.replay([end])
+        self.assertEqual(len(bars), 0)
+        self.assertEqual(bars.dtype, bar_replay.BAR_DTYPE)
+
+
+class LadderTests(SimpleTestCase):
+    def test_best_level_and_top(self):
+        bids = order_book.Ladder(True, capacity=16)
+        for tick, size in ((100, 5), (98, 7), (103, 1), (90, 2)):
+            bids.set(tick, size)
+        self.assertEqual(bids.best_tick(), 103)
+        self.assertEqual((bids.top(3) + bids.base).tolist(), [103, 100, 98])
+        bids.set(103, 0)
+        self.assertEqual(bids.best_tick(), 100)
+        self.assertEqual(len(bids), 3)
+
+    def test_recentres_without_growing_when_levels_fit(self):
+        asks = order_book.Ladder(False, capacity=16)
+        asks.set(1000, 1)
+        asks.set(1000, 0)
+        asks.set(5000, 2)
+        self.assertEqual(len(asks.sizes), 16)
+        self.assertEqual(asks.best_tick(), 5000)
+        self.assertEqual(asks.size_at(5000), 2)
+
+    def test_grows_keeping_levels(self):
+        asks = order_book.Ladder(False, capacity=16)
+        asks.set(1000, 1)
+        asks.set(1040, 2)
+        asks.set(990, 3)
+        self.assertGreaterEqual(len(asks.sizes), 51)
+        self.assertEqual([(asks.base + slot, asks.size_at(asks.base + slot)) for slot in asks.top(5).tolist()],
+                         [(990, 3), (1000, 1), (1040, 2)])
+
+    def test_removing_a_level_outside_the_window_keeps_it(self):
+        bids = order_book.Ladder(True, capacity=16, max_capacity=64)
+        bids.set(1000, 1)
+        base = bids.base
+        bids.set(1500, 0)
+        bids.set(900, 0)
+        self.assertEqual((len(bids.sizes), bids.base, bids.dropped), (16, base, 0))
+        self.assertEqual(bids.best_tick(), 1000)
+
+    def test_level_too_far_away_is_dropped(self):
+        bids = order_book.Ladder(True, capacity=16, max_capacity=64)
+        bids.set(1000, 1)
+        with self.assertLogs("rithmic_api.order_book", "WARNING"):
+            bids.set(2000, 1)
+        self.assertEqual((bids.dropped, len(bids), bids.best_tick()), (1, 1, 1000))
+
+
+class OrderBookTests(SimpleTestCase):
+    def update(self, books, update_type, bids=(), asks=()):
+        return books.update_buf(order_book.ORDER_BOOK, order_book.encode("CME", "ESZ6", update_type, bids, asks))
+
+    def test_snapshot_over_several_messages_then_updates(self):
+        books = order_book.OrderBooks(tick_sizes={("CME", "ESZ6"): 0.25})
+        self.update(books, order_book.SOLO, [(4000.0, 9, 1)])
+        self.update(books, order_book.SNAPSHOT_IMAGE, [(5000.0, 1, 1)], [(5000.25, 2, 1)])
+        book = self.update(books, order_book.SNAPSHOT_IMAGE, [(4999.75, 3, 2)], [(5000.5, 4, 2)])
+        self.assertEqual(book.top(5), {"bids": [(5000.0, 1, 1), (4999.75, 3, 2)],
+                                       "asks": [(5000.25, 2, 1), (5000.5, 4, 2)]})
+        self.update(books, order_book.BEGIN, [(5000.0, 0, 0)])
+        self.assertFalse(book.consistent)
+        self.update(books, order_book.END, (), [(5000.0, 6, 1)])
+        self.assertTrue(book.consistent)
+        self.assertEqual((book.best_bid(), book.best_ask()), ((4999.75, 3), (5000.0, 6)))
+        self.update(books, order_book.CLEAR_ORDER_BOOK)
+        self.assertEqual(book.top(5), {"bids": [], "asks": []})
+
+    def test_random_updates_match_a_dict_book(self):
+        rng = random.Random(7)
+        book = order_book.OrderBook("CME", "ESZ6", 0.25, capacity=16)
+        reference = ({}, {})
+        mid = 20000
+        for i in range(5000):
+            if rng.random() < 0.01:
+                # jumps far enough to re-centre and grow the ladders
+                mid += rng.choice((-1, 1)) * rng.randint(20, 200)
+            side = rng.randrange(2)
+            tick = mid - 1 - rng.randrange(30) if side == 0 else mid + rng.randrange(30)
+            size = 0 if rng.random() < 0.3 else rng.randint(1, 50)
+            if size:
+                reference[side][tick] = size
+            else:
+                reference[side].pop(tick, None)
+            level = [(tick * 0.25, size, 1)]
+            book.apply(order_book.decode(order_book.encode(
+                "CME", "ESZ6", order_book.SOLO, level if side == 0 else (), level if side == 1 else ())))
+            if i % 250 == 0:
+                for n in (1, 10, 40):
+                    top = book.top(n)
+                    self.assertEqual([(round(p * 4), s) for p, s, _ in top["bids"]],
+                                     sorted(reference[0].items(), reverse=True)[:n])
+                    self.assertEqual([(round(p * 4), s) for p, s, _ in top["asks"]],
+                                     sorted(reference[1].items())[:n])
+        self.assertEqual((len(book.bids), len(book.asks)), (len(reference[0]), len(reference[1])))
+        self.assertEqual(book.off_tick, 0)
+
+    def test_decode_rejects_truncated_frames(self):
+        buf = order_book.encode("CME", "ESZ6", order_book.SOLO, [(5000.25, 3, 1)])
+        self.assertEqual(order_book.decode(buf).bid_price, [5000.25])
+        with self.assertRaises(order_book.wire.WireError):
+            order_book.decode(buf[:-10])
@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import RithmicApiView
+from .views import RithmicApiView, RithmicPoolStatsView, RithmicQuotesView
 
 urlpatterns = [
     path('run-rithmic/', RithmicApiView.as_view(), name='run-rithmic'),
+    path('pool-stats/', RithmicPoolStatsView.as_view(), name='pool-stats'),
+    path('quotes/', RithmicQuotesView.as_view(), name='quotes'),
 ]
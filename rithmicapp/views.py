@@ -4,6 +4,8 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rithmic_api.SampleMD import run_rithmic  # Import your function
+from rithmic_api.quote_cache import cache
+from rithmic_api.session_pool import pool, run_coroutine
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,3 +30,74 @@ class RithmicApiView(APIView):
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+
+
+class RithmicPoolStatsView(APIView):
+    def get(self, request):
+        return Response(pool.stats(), status=status.HTTP_200_OK)
+
+
+def _instruments(exchange, symbols):
+    """Parse "CME:ESZ6,NQZ6" style lists; a bare symbol takes exchange."""
+    instruments = []
+    for item in (symbols or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if ":" in item:
+            instruments.append(tuple(item.split(":", 1)))
+        elif exchange:
+            instruments.append((exchange, item))
+        else:
+            raise ValueError(f"no exchange given for {item}")
+    return instruments
+
+
+def _quote_source():
+    """The shared-memory table named by RITHMIC_QUOTE_TABLE if there is one,
+    fed by a separate process for every worker, else this process's cache."""
+    # imported here, so that workers without a table never load it
+    from rithmic_api import shared_quotes
+    return shared_quotes.reader_from_env() or cache
+
+
+class RithmicQuotesView(APIView):
+    """Latest quotes from memory; POST starts following symbols."""
+
+    def get(self, request):
+        try:
+            instruments = _instruments(request.query_params.get('exchange'),
+                                       request.query_params.get('symbols') or request.query_params.get('symbol'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        source = _quote_source()
+        if not instruments:
+            instruments = source.instruments()
+        quotes, missing = source.quotes(instruments)
+        return Response({"quotes": quotes, "missing": missing}, status=status.HTTP_200_OK)
+
+    def post(self, request):
+        if _quote_source() is not cache:
+            return Response({"error": "Quotes are published by the shared quote table feeder."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        uri = request.data.get('uri')
+        system_name = request.data.get('system_name')
+        user_id = request.data.get('user_id')
+        password = request.data.get('password')
+        try:
+            instruments = _instruments(request.data.get('exchange'), request.data.get('symbol'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not all([uri, system_name, user_id, password, instruments]):
+            return Response({"error": "All parameters are required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            run_coroutine(cache.follow(uri, system_name, user_id, password, instruments))
+        except PermissionError as e:
+            return Response({"error": str(e)}, status=status.HTTP_403_FORBIDDEN)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({"following": [f"{exchange}:{symbol}" for exchange, symbol in instruments]},
+                        status=status.HTTP_200_OK)